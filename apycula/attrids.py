@@ -1,3 +1,5 @@
+from types import MappingProxyType
+
 # These constants are used to interact with the 'logicinfo', 'shortval' and maybe 'longval' tables
 # * - it seems that these attributes must always be present (XXX)
 # Warning:
@@ -1820,7 +1822,108 @@ iologic_attrvals = {
         'HCLK3_':             115,
 }
 
-# num -> attr name
-iologic_num2val = {v: k for k, v in iologic_attrvals.items()}
-iob_num2val = {v: k for k, v in iob_attrvals.items()}
+# The tables are shared by the packer and the unpacker (the compiled decoders
+# of the unpacker even keep them by id), so they are made read-only.
+# code -> name. Some codes have several names (pll_attrvals 0 is 'UNKNOWN'
+# and 'FALSE'), the first one wins as it did with the linear searches.
+def _reverse(table):
+    res = {}
+    for name, code in table.items():
+        res.setdefault(code, name)
+    return MappingProxyType(res)
+
+iob_attrids = MappingProxyType(iob_attrids)
+iob_attrvals = MappingProxyType(iob_attrvals)
+adc_attrids = MappingProxyType(adc_attrids)
+adc_attrvals = MappingProxyType(adc_attrvals)
+dsp_5a_attrids = MappingProxyType(dsp_5a_attrids)
+dsp_5a_attrvals = MappingProxyType(dsp_5a_attrvals)
+dsp_attrids = MappingProxyType(dsp_attrids)
+dsp_attrvals = MappingProxyType(dsp_attrvals)
+bsram_attrids = MappingProxyType(bsram_attrids)
+bsram_attrvals = MappingProxyType(bsram_attrvals)
+cls_attrids = MappingProxyType(cls_attrids)
+cls_attrvals = MappingProxyType(cls_attrvals)
+dcs_attrids = MappingProxyType(dcs_attrids)
+dcs_attrvals = MappingProxyType(dcs_attrvals)
+dlldly_attrids = MappingProxyType(dlldly_attrids)
+dlldly_attrvals = MappingProxyType(dlldly_attrvals)
+dll_attrids = MappingProxyType(dll_attrids)
+dll_attrvals = MappingProxyType(dll_attrvals)
+pll_attrids = MappingProxyType(pll_attrids)
+pll_attrvals = MappingProxyType(pll_attrvals)
+osc_attrids = MappingProxyType(osc_attrids)
+osc_attrvals = MappingProxyType(osc_attrvals)
+cfg_attrids = MappingProxyType(cfg_attrids)
+cfg_attrvals = MappingProxyType(cfg_attrvals)
+gsr_attrids = MappingProxyType(gsr_attrids)
+gsr_attrvals = MappingProxyType(gsr_attrvals)
+hclk_attrids = MappingProxyType(hclk_attrids)
+hclk_attrvals = MappingProxyType(hclk_attrvals)
+iologic_attrids = MappingProxyType(iologic_attrids)
+iologic_attrvals = MappingProxyType(iologic_attrvals)
+
+# attr code -> attr name
+iob_num2attr = _reverse(iob_attrids)
+adc_num2attr = _reverse(adc_attrids)
+dsp_5a_num2attr = _reverse(dsp_5a_attrids)
+dsp_num2attr = _reverse(dsp_attrids)
+bsram_num2attr = _reverse(bsram_attrids)
+cls_num2attr = _reverse(cls_attrids)
+dcs_num2attr = _reverse(dcs_attrids)
+dlldly_num2attr = _reverse(dlldly_attrids)
+dll_num2attr = _reverse(dll_attrids)
+pll_num2attr = _reverse(pll_attrids)
+osc_num2attr = _reverse(osc_attrids)
+cfg_num2attr = _reverse(cfg_attrids)
+gsr_num2attr = _reverse(gsr_attrids)
+hclk_num2attr = _reverse(hclk_attrids)
+iologic_num2attr = _reverse(iologic_attrids)
+
+# value code -> value name
+iob_num2val = _reverse(iob_attrvals)
+adc_num2val = _reverse(adc_attrvals)
+dsp_5a_num2val = _reverse(dsp_5a_attrvals)
+dsp_num2val = _reverse(dsp_attrvals)
+bsram_num2val = _reverse(bsram_attrvals)
+cls_num2val = _reverse(cls_attrvals)
+dcs_num2val = _reverse(dcs_attrvals)
+dlldly_num2val = _reverse(dlldly_attrvals)
+dll_num2val = _reverse(dll_attrvals)
+pll_num2val = _reverse(pll_attrvals)
+osc_num2val = _reverse(osc_attrvals)
+cfg_num2val = _reverse(cfg_attrvals)
+gsr_num2val = _reverse(gsr_attrvals)
+hclk_num2val = _reverse(hclk_attrvals)
+iologic_num2val = _reverse(iologic_attrvals)
+
+# {id(attrids or attrvals table): reverse table}
+_reverse_tables = {}
+for _fwd, _rev in [
+        (iob_attrids, iob_num2attr), (iob_attrvals, iob_num2val),
+        (adc_attrids, adc_num2attr), (adc_attrvals, adc_num2val),
+        (dsp_5a_attrids, dsp_5a_num2attr), (dsp_5a_attrvals, dsp_5a_num2val),
+        (dsp_attrids, dsp_num2attr), (dsp_attrvals, dsp_num2val),
+        (bsram_attrids, bsram_num2attr), (bsram_attrvals, bsram_num2val),
+        (cls_attrids, cls_num2attr), (cls_attrvals, cls_num2val),
+        (dcs_attrids, dcs_num2attr), (dcs_attrvals, dcs_num2val),
+        (dlldly_attrids, dlldly_num2attr), (dlldly_attrvals, dlldly_num2val),
+        (dll_attrids, dll_num2attr), (dll_attrvals, dll_num2val),
+        (pll_attrids, pll_num2attr), (pll_attrvals, pll_num2val),
+        (osc_attrids, osc_num2attr), (osc_attrvals, osc_num2val),
+        (cfg_attrids, cfg_num2attr), (cfg_attrvals, cfg_num2val),
+        (gsr_attrids, gsr_num2attr), (gsr_attrvals, gsr_num2val),
+        (hclk_attrids, hclk_num2attr), (hclk_attrvals, hclk_num2val),
+        (iologic_attrids, iologic_num2attr), (iologic_attrvals, iologic_num2val),
+        ]:
+    _reverse_tables[id(_fwd)] = _rev
+
+def num2name(table, code):
+    """ name of the code in one of the tables above, None if there is no such code.
+        A table without a reverse table is searched, the first name wins.
+    """
+    rev = _reverse_tables.get(id(table))
+    if rev is None:
+        return next((name for name, num in table.items() if num == code), None)
+    return rev.get(code)
 
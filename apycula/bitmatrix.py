@@ -29,9 +29,15 @@ try:
     def zeros(rows, cols):
         return np.zeros((rows, cols), dtype=np.uint8)
 
+    def copy(bmp):
+        return np.array(bmp, dtype=np.uint8)
+
     def packbits(bmp, axis=None):
         return np.packbits(np.asarray(bmp, dtype=np.uint8), axis=axis)
 
+    def to_int(bmp):
+        return int.from_bytes(np.packbits(np.asarray(bmp, dtype=np.uint8), bitorder='little').tobytes(), 'little')
+
     def bsum(arr):
         return np.asarray(arr).sum()
 
@@ -55,6 +61,12 @@ try:
         h, w = src.shape
         dst[y:y+h, x:x+w] = src
 
+    def scatter(dst, rows, cols, val=1):
+        dst[np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)] = val
+
+    def crop(bmp, y, x, height, width):
+        return np.asarray(bmp)[y:y+height, x:x+width]
+
 except ImportError:
     import warnings
     warnings.warn("Numpy is not available, performance will be degraded.")
@@ -118,6 +130,12 @@ except ImportError:
         """
         return fill(rows, cols, 0)
 
+    def copy(bmp):
+        """
+        Returns a copy of the matrix.
+        """
+        return [list(row) for row in bmp]
+
     def packbits(bmp, axis=None):
         """
         Packs the elements of a bitmap into bytes.
@@ -149,6 +167,15 @@ except ImportError:
                         byte = 0
         return byte_list
 
+    def to_int(bmp):
+        """
+        Packs a bitmap into an integer: element [row][col] becomes
+        bit row * width + col.
+        """
+        from itertools import chain
+        bits = ''.join(map(str, chain.from_iterable(row[::-1] for row in bmp[::-1])))
+        return int(bits or '0', 2)
+
     def bsum(arr):
         return sum(arr)
 
@@ -213,3 +240,13 @@ except ImportError:
                 dst[y][x0] = val
                 x0 += 1
             y += 1
+
+    def scatter(dst, rows, cols, val=1):
+        """
+        Set the elements at (rows[i], cols[i]) to val.
+        """
+        for ri, ci in zip(rows, cols):
+            dst[ri][ci] = val
+
+    def crop(bmp, y, x, height, width):
+        return [row[x:x+width] for row in bmp[y:y+height]]
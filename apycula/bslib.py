@@ -1,5 +1,6 @@
 from math import ceil
 import array
+import itertools
 from apycula import bitmatrix
 from apycula.crc16 import make_crc16_arc
 
@@ -175,7 +176,7 @@ def compressLine(line, key8Z, key4Z, key2Z):
         newline += val
     return newline
 
-def write_gw5_bsram_init_map(f, crcdat, calc, gw5a_bsram_init_map, gw5a_bsrams):
+def gw5_bsram_blocks(gw5a_bsrams):
     # BSRAM init part. Count used columns
     last_col = -1
     used_blocks = 0
@@ -190,12 +191,31 @@ def write_gw5_bsram_init_map(f, crcdat, calc, gw5a_bsram_init_map, gw5a_bsrams):
                 last_block_seq = col // 3
             block_seq[last_block_seq] += 1
             last_col = col
+    return used_blocks, block_seq
+
+def gw5_bsram_init_rows(gw5a_bsram_init_map, used_blocks):
     # rearrange init map - cut unused tail blocks - we don't need zero init data after last used block
-    tail = used_blocks * 256
-    w = bitmatrix.shape(gw5a_bsram_init_map)[1]
-    bitInitMap = [[gw5a_bsram_init_map[i][w - j - 1] for j in range(w)] for i in range(tail)]
+    bitInitMap = bitmatrix.fliplr(gw5a_bsram_init_map[:used_blocks * 256])
     assert bitmatrix.shape(bitInitMap)[1] % 8 == 0
-    byteInitMap = bitmatrix.packbits(bitInitMap, axis = 1)
+    return bitmatrix.packbits(bitInitMap, axis = 1)
+
+def write_frames(f, crcdat, calc, rows):
+    """Write the rows as frames: data, CRC and 48 ones. The CRC of the first
+    frame covers crcdat, the following ones start with six 0xff bytes."""
+    if not len(rows):
+        return crcdat
+    rows = [bytes(row) for row in rows]
+    crcs = [calc(crcdat + rows[0])]
+    crcs.extend(calc(b'\xff' * 6 + row) for row in rows[1:])
+    nbits = len(rows[0]) * 8
+    ones = '1' * 48
+    f.write(''.join(f'{int.from_bytes(row, "big"):0{nbits}b}{_B2B[crc_ & 0xff]}{_B2B[crc_ >> 8]}{ones}\n'
+                    for row, crc_ in zip(rows, crcs)))
+    return bytearray(b'\xff' * 6)
+
+def write_gw5_bsram_init_map(f, crcdat, calc, gw5a_bsram_init_map, gw5a_bsrams):
+    used_blocks, block_seq = gw5_bsram_blocks(gw5a_bsrams)
+    byteInitMap = gw5_bsram_init_rows(gw5a_bsram_init_map, used_blocks)
 
     # write BSRAM init data
     data_first_col = 0
@@ -230,15 +250,7 @@ def write_gw5_bsram_init_map(f, crcdat, calc, gw5a_bsram_init_map, gw5a_bsrams):
         f.write('\n')
 
         # data
-        for data_row in byteInitMap[data_first_col : data_first_col + 256 * cnt]:
-            f.write(''.join(_B2B[b] for b in data_row))
-            crcdat.extend(data_row)
-            crc_ = calc(crcdat)
-            crcdat = bytearray(b'\xff'*6)
-            f.write(_B2B[crc_&0xff]+_B2B[crc_>>8])
-            f.write('1'*48)
-            f.write('\n')
-
+        crcdat = write_frames(f, crcdat, calc, byteInitMap[data_first_col : data_first_col + 256 * cnt])
         data_first_col += 256 * cnt
 
         # end of block
@@ -251,26 +263,8 @@ def write_gw5_bsram_init_map(f, crcdat, calc, gw5a_bsram_init_map, gw5a_bsrams):
         f.write('\n')
 
 def write_gw5_138_bsram_init_map(f, crcdat, calc, gw5a_bsram_init_map, gw5a_bsrams):
-    # BSRAM init part. Count used columns
-    last_col = -1
-    used_blocks = 0
-    block_seq = {}   # start col of block sequence: number of blocks
-    last_block_seq = None
-    for bsram in gw5a_bsrams:
-        col, _, _, _, _ = bsram
-        if col != last_col:
-            used_blocks += 1
-            if col - last_col != 3:         # 3 cells for one BSRAM, if the columns are 3 cells apart
-                block_seq.setdefault(col // 3, 0)  #  when the BSRAMs are neighbours
-                last_block_seq = col // 3
-            block_seq[last_block_seq] += 1
-            last_col = col
-    # rearrange init map - cut unused tail blocks - we don't need zero init data after last used block
-    tail = used_blocks * 256
-    w = bitmatrix.shape(gw5a_bsram_init_map)[1]
-    bitInitMap = [[gw5a_bsram_init_map[i][w - j - 1] for j in range(w)] for i in range(tail)]
-    assert bitmatrix.shape(bitInitMap)[1] % 8 == 0
-    byteInitMap = bitmatrix.packbits(bitInitMap, axis = 1)
+    used_blocks, block_seq = gw5_bsram_blocks(gw5a_bsrams)
+    byteInitMap = gw5_bsram_init_rows(gw5a_bsram_init_map, used_blocks)
 
     # write BSRAM init data
     data_first_col = 0
@@ -305,25 +299,10 @@ def write_gw5_138_bsram_init_map(f, crcdat, calc, gw5a_bsram_init_map, gw5a_bsra
 
         # extra zero frame for first col
         if start == 0:
-            extra_row = bytearray(len(byteInitMap[data_first_col]))
-            f.write(''.join(_B2B[b] for b in extra_row))
-            crcdat.extend(extra_row)
-            crc_ = calc(crcdat)
-            crcdat = bytearray(b'\xff'*6)
-            f.write(_B2B[crc_&0xff]+_B2B[crc_>>8])
-            f.write('1'*48)
-            f.write('\n')
+            crcdat = write_frames(f, crcdat, calc, [bytearray(len(byteInitMap[data_first_col]))])
 
         # data
-        for data_row in byteInitMap[data_first_col : data_first_col + 256 * cnt]:
-            f.write(''.join(_B2B[b] for b in data_row))
-            crcdat.extend(data_row)
-            crc_ = calc(crcdat)
-            crcdat = bytearray(b'\xff'*6)
-            f.write(_B2B[crc_&0xff]+_B2B[crc_>>8])
-            f.write('1'*48)
-            f.write('\n')
-
+        crcdat = write_frames(f, crcdat, calc, byteInitMap[data_first_col : data_first_col + 256 * cnt])
         data_first_col += 256 * cnt
 
         # end of block
@@ -335,14 +314,33 @@ def write_gw5_138_bsram_init_map(f, crcdat, calc, gw5a_bsram_init_map, gw5a_bsra
         f.write(_B2B[crc_&0xff]+_B2B[crc_>>8])
         f.write('\n')
 
-def write_bitstream_with_bsram_init(fname, bs, hdr, ftr, compress, extra_slots, bsram_init):
-    new_bs = bitmatrix.vstack(bs, bsram_init)
-    new_hdr = hdr.copy()
-    write_bitstream(fname, new_bs, new_hdr, ftr, compress, extra_slots)
-
-def write_bitstream(fname, bs, hdr, ftr, compress, extra_slots, gw5a_bsram_init_map = None, gw5a_bsrams = None, is_gw5a_138 = False):
+def bsram_init_bands(width, height, blocks):
+    """Rows of the init map {(y, x): cell map} of height * width bits, one
+    band of rows at a time. Only the cells are stored, the rest is zero."""
+    bands = {}
+    for (y, x), block in blocks.items():
+        bands.setdefault(y, []).append((x, block))
+    row = 0
+    for y in sorted(bands):
+        if y > row:
+            yield bitmatrix.zeros(y - row, width)
+        band_height = max(bitmatrix.shape(block)[0] for _, block in bands[y])
+        band = bitmatrix.zeros(band_height, width)
+        for x, block in bands[y]:
+            bitmatrix.blit(band, 0, x, block)
+        yield band
+        row = y + band_height
+    if row < height:
+        yield bitmatrix.zeros(height - row, width)
+
+def write_bitstream(fname, bs, hdr, ftr, compress, extra_slots, gw5a_bsram_init_map = None, gw5a_bsrams = None, is_gw5a_138 = False, bsram_init = None):
+    # bsram_init = (height, {(y, x): cell map}) is the sparse BSRAM init map
+    # of the chips before GW5A, its rows follow the main grid
+    init_height = 0
+    if bsram_init is not None:
+        init_height, init_blocks = bsram_init
     bs = bitmatrix.fliplr(bs)
-    hdr[-1][2:] = int(bitmatrix.shape(bs)[0]).to_bytes(2, 'big')
+    hdr[-1][2:] = int(bitmatrix.shape(bs)[0] + init_height).to_bytes(2, 'big')
 
     if compress:
         padlen = (ceil(bitmatrix.shape(bs)[1] / 64) * 64) - bitmatrix.shape(bs)[1]
@@ -350,14 +348,24 @@ def write_bitstream(fname, bs, hdr, ftr, compress, extra_slots, gw5a_bsram_init_
         padlen = (ceil(bitmatrix.shape(bs)[1] / 8) * 8) - bitmatrix.shape(bs)[1]
     pad = bitmatrix.ones(bitmatrix.shape(bs)[0], padlen)
     no_compress_pad_bytes = (padlen - ((ceil(bitmatrix.shape(bs)[1] / 8) * 8) - bitmatrix.shape(bs)[1])) // 8
+    width = bitmatrix.shape(bs)[1]
     bs = bitmatrix.hstack(pad, bs)
     assert bitmatrix.shape(bs)[1] % 8 == 0
     bs = bitmatrix.packbits(bs, axis = 1)
+    # the init rows are packed band by band instead of being stacked under the
+    # whole main grid
+    init_bands = []
+    if init_height:
+        for band in bsram_init_bands(width, init_height, init_blocks):
+            band = bitmatrix.hstack(bitmatrix.ones(bitmatrix.shape(band)[0], padlen), bitmatrix.fliplr(band))
+            init_bands.append(bitmatrix.packbits(band, axis = 1))
 
     unused_bytes = []
     if compress:
         # search for smallest values not used in the bitstream
         lst = bitmatrix.byte_histogram(bs)
+        for band in init_bands:
+            lst = [cnt + band_cnt for cnt, band_cnt in zip(lst, bitmatrix.byte_histogram(band))]
         unused_bytes = [i for i,val in enumerate(lst) if val==0]
         if unused_bytes:
             # We may simply not have the bytes we need for the keys.
@@ -383,7 +391,7 @@ def write_bitstream(fname, bs, hdr, ftr, compress, extra_slots, gw5a_bsram_init_
             preamble = max(0, preamble-1)
             f.write(''.join(_B2B[b] for b in ba))
             f.write('\n')
-        for ba in bs:
+        for ba in itertools.chain(bs, *init_bands):
             if compress:
                 if unused_bytes:
                     ba = compressLine(ba, key8Z, key4Z, key2Z)
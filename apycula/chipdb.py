@@ -1,282 +1,19 @@
-from dataclasses import dataclass, field
-from typing import Dict, List, Optional, Set, Tuple, Union, Any
 from itertools import chain
-import re
 import copy
-import lzma
 from functools import reduce
 from collections import namedtuple
 from apycula.dat_parser import Datfile
 import apycula.fse_parser as fuse
 from apycula import wirenames as wnames
 from apycula import pindef
-from apycula import bitmatrix
-
-# the character that marks the I/O attributes that come from the nextpnr
-mode_attr_sep = '&'
-
-# represents a row, column coordinate
-# can be either tiles or bits within tiles
-Coord = Tuple[int, int]
-
-@dataclass
-class Bel:
-    """Respresents a Basic ELement
-    with the specified modes mapped to bits
-    and the specified portmap"""
-    # there can be zero or more flags
-    flags: Dict[int, Set[Coord]] = field(default_factory=dict)
-    # this Bel is IOBUF and needs routing to become IBUF or OBUF
-    simplified_iob: bool = field(default = False)
-    # differential signal capabilities info
-    is_diff:      bool = field(default = False)
-    is_true_lvds: bool = field(default = False)
-    is_diff_p:    bool = field(default = False)
-    # there can be only one mode, modes are exclusive
-    modes: Dict[str, Set[Coord]] = field(default_factory=dict)
-    portmap: Dict[str, Union[str, List[Union[str, List[str]]]]] = field(default_factory=dict)
-    # where to set the fuses for the bel
-    fuse_cell_offset: Optional[Coord] = None
-
-    @property
-    def mode_bits(self):
-        return set().union(*self.modes.values())
-
-@dataclass
-class Tile:
-    """Represents all the configurable features
-    for this specific tile type"""
-    width: int
-    height: int
-    # At the time of packing/unpacking the information about the types of cells
-    # is already lost, it is critical to work through the 'logicinfo' table so
-    # store it.
-    ttyp: int
-    # a mapping from dest, source wire to bit coordinates
-    pips: Dict[str, Dict[str, Set[Coord]]] = field(default_factory=dict)
-    # This table plays an important role when setting the fuse,
-    # The fuse pair specified here is installed in case the sink is not
-    # connected to any of the listed sources. In the old IDE this was an
-    # unnecessary mechanism since all the fuses were listed in the rows of the
-    # [‘wire’][2] table, this is not the case in the new IDE.
-    # {dst: [({src}, {bits})]}
-    alonenode: Dict[str, List[Tuple[Set[str], Set[Coord]]]] = field(default_factory=dict)
-    # Clocks
-    clock_pips: Dict[str, Dict[str, Set[Coord]]] = field(default_factory=dict)
-    # fuses to disable the long wire columns. This is the table 'alonenode[6]' in the vendor file
-    # {dst: [({src}, {bits})]}
-    alonenode_6: Dict[str, List[Tuple[Set[str], Set[Coord]]]] = field(default_factory=dict)
-    # a mapping from bel type to bel
-    bels: Dict[str, Bel] = field(default_factory=dict)
-
-@dataclass
-class Device:
-    # grid of tile type indices (ttyp) - use device[row, col] to get Tile
-    grid: List[List[int]] = field(default_factory=list)
-    # special center cell (DSPs have gap there, also place for some clock MUX)
-    center_row: int = field (default = 0)
-    center_col: int = field (default = 0)
-    # tile type to Tile mapping
-    tiles: Dict[int, Tile] = field(default_factory=dict)
-    timing: Dict[str, Dict[str, Dict[str, Union[List[float], int]]]] = field(default_factory=dict)
-    # {wine_name: type_name}
-    wire_delay: Dict[str, str] = field(default_factory=dict)
-    packages: Dict[str, Tuple[str, str, str]] = field(default_factory=dict)
-    # {variant: {package: {pin#: (pin_name, [cfgs])}}}
-    pinout: Dict[str, Dict[str, Dict[str, Tuple[str, List[str]]]]] = field(default_factory=dict)
-    # {variant: {package: [(net, row, col, AB, iostd), ...]}}
-    sip_cst: Dict[str, Dict[str, List[Tuple[str, int, int, str, Optional[str]]]]] = field(default_factory=dict)
-    pin_bank: Dict[str, int] = field(default_factory = dict)
-    cmd_hdr: List[bytearray] = field(default_factory=list)
-    cmd_ftr: List[bytearray] = field(default_factory=list)
-    template: Optional[List[List[int]]] = None
-    # allowable values of bel attributes
-    # {table_name: {(attr_id, attr_value): code}}
-    logicinfo: Dict[str, Dict[Tuple[int, int], int]] = field(default_factory=dict)
-    # reverse logicinfo, is not stored in the pickle
-    rev_li: Dict[str, Dict[int, Tuple[int, int]]]  = field(default_factory=dict)
-    # fuses for single feature only
-    # {ttype: {table_name: {feature: {bits}}}
-    longfuses: Dict[int, Dict[str, Dict[Tuple[int,], Set[Coord]]]] = field(default_factory=dict)
-    # fuses for a pair of the "features" (or pairs of parameter values)
-    # {ttype: {table_name: {(feature_A, feature_B): {bits}}}
-    shortval: Dict[int, Dict[str, Dict[Tuple[int, int], Set[Coord]]]] = field(default_factory=dict)
-    # fuses for 16 of the "features"
-    # {ttype: {table_name: {(feature_0, feature_1, ..., feature_15): {bits}}}
-    longval: Dict[int, Dict[str, Dict[Tuple[int, int, int, int, int, int, int, int, int, int, int, int, int, int, int, int], Set[Coord]]]] = field(default_factory=dict)
-    # constant fuses
-    # we will use the list in case it turns out that order is important.
-    # {ttype: [(row, col), ...]}
-    const: Dict[int, List[Coord]] = field(default_factory=dict)
-    # for Himbaechel arch
-    # nodes - always connected wires {node_name: (wire_type, {(row, col, wire_name)})}
-    nodes: Dict[str, Tuple[str, Set[Tuple[int, int, str]]]] = field(default_factory = dict)
-    # strange bottom row IO. In order for OBUF and Co. to work, one of the four
-    # combinations must be applied to two special wires.
-    # (wire_a, wire_b, [(wire_a_net, wire_b_net)])
-    bottom_io: Tuple[str, str, List[Tuple[str, str]]] = field(default_factory = tuple)
-    # simplified IO rows
-    simplio_rows: Set[int] = field(default_factory = set)
-    # which PLL does this pad belong to. {IOLOC: (row, col, type, bel_name)}
-    # type = {'CLKIN_T', 'CLKIN_C', 'FB_T', 'FB_C'}
-    pad_pll: Dict[str, Tuple[int, int, str, str]] = field(default_factory = dict)
-    # tile types by func. The same ttyp number can correspond to different
-    # functional blocks on different chips. For example 86 is the PLL head ttyp
-    # for GW2A-18 and the same number is used in GW1N-1 where it has nothing to
-    # do with PLL.  { type_name: {type_num} }
-    tile_types: Dict[str, Set[int]] = field(default_factory = dict)
-    # supported differential IO primitives
-    diff_io_types: List[str] = field(default_factory = list)
-    # HCLK pips depend on the location of the cell, not on the type, so they
-    # are difficult to match with the deduplicated description of the tile
-    # { (y, x) : pips}
-    hclk_pips: Dict[Tuple[int, int], Dict[str, Dict[str, Set[Coord]]]] = field(default_factory=dict)
-    # extra cell functions besides main type like
-    # - OSCx
-    # - GSR
-    # - OSER16/IDES16
-    # - ref to hclk_pips
-    # - disabled blocks
-    # - BUF(G)
-    # - MIPI
-    extra_func: Dict[Tuple[int, int], Dict[str, Any]] = field(default_factory=dict)
-    # Chip features currently related to block memory like "HAS_SP32", "NEED_SP_FIX", etc
-    chip_flags: List[str] = field(default_factory=list)
-    # Segmented clock columns description
-    # { (y, x, idx) : {min_x, min_y, max_x, max_y, top_row, bottom_row, top_wire, bottom_wire,
-    # top_gate_wire[name, ], bottom_gate_wire[name,]}}
-    segments: Dict[Tuple[int, int, int], Dict[str, Any]] = field(default_factory=dict)
-    # GW5A renames the DCS inputs from CLK to CLKIN
-    dcs_prefix: str = field(default = "CLK")
-    # io configurations. { 'IOR3B' : {'MODE0', 'CCLK'}}  (example, not real)
-    # store alternative pin configurations that may not be present in a specific package.
-    io_cfg: Dict[str, Set[str]] = field(default_factory=dict)
-    # Gowin has a way of specifying pin locations in a .CST file as a side
-    # index, for example, IOR12A, which means pin 12 on the right side of the
-    # chip.
-    # We support this mechanism, but it has a peculiarity with corner tiles — let's
-    # say tile (0, 0) is both IOT1 and IOL1. Here we specify how to interpret the
-    # corners.
-    corner_tiles_io: Dict[Tuple[int, int], str] = field(default_factory=dict)
-    # GW5AST-138C has an interesting mechanism for clock spines - to use some
-    # of them, it is not enough to set the fuses, you also need to supply VCC
-    # or GND to some kind of MUX. This can only be done in nextpnr, so we pass
-    # a list of spines and MUX inputs, as well as which network to connect to (1/0).
-    # { 'top'/'bottom' : { spine : [(row, col, wire, 1/0), (row, col, wire, 1/0)...]}}
-    spine_select_wires: Dict[str, Dict[str, List[Tuple[int, int, str, int]]]] = field(default_factory=dict)
-    last_top_row: int = field(default=0)
-    # Which HCLK block can be used for an IOLOGIC located at the specified IO coordinates
-    # hclk idx : {(row, col), }
-    io2hclk: Dict[int, Set[Tuple[int, int]]] = field(default_factory=dict)
-    # Where are the CLKDIV2s associated with a specific HCLK located
-    # hclk idx : {(row, col, div2_idx), }
-    hclk_div2: Dict[int, Set[Tuple[int, int, int]]] = field(default_factory=dict)
-
-    def __getitem__(self, pos: Tuple[int, int]) -> Tile:
-        """Get tile at (row, col)."""
-        row, col = pos
-        return self.tiles[self.grid[row][col]]
-
-    def __setitem__(self, pos: Tuple[int, int], tile: Tile):
-        """Set tile at (row, col)."""
-        row, col = pos
-        self.tiles[tile.ttyp] = tile
-        self.grid[row][col] = tile.ttyp
-
-    @property
-    def rows(self):
-        return len(self.grid)
-
-    @property
-    def cols(self):
-        return len(self.grid[0])
-
-    @property
-    def height(self):
-        return sum(self[row, 0].height for row in range(self.rows))
-
-    @property
-    def width(self):
-        return sum(self[0, col].width for col in range(self.cols))
-
-    # Some chips have bits responsible for different banks in the same corner tile.
-    # Here stores the correspondence of the bank number to the (row, col) of the tile.
-    @property
-    def bank_tiles(self):
-        # { bank# : (row, col) }
-        res = {}
-        for row in range(self.rows):
-            for col in range(self.cols):
-                for bel in self[row, col].bels.keys():
-                    if bel.startswith('BANK'):
-                        res.update({ int(bel[4:]) : (row, col) })
-        return res
-
-    # make reverse logicinfo tables on demand
-    def rev_logicinfo(self, name):
-        if name not in self.rev_li:
-            table = self.rev_li.setdefault(name, {})
-            for attrval, code in self.logicinfo[name].items():
-                table[code] = attrval
-        return self.rev_li[name]
-
-
-try:
-    import msgspec
-
-    def save_chipdb(db: Device, path: str) -> None:
-        """Save a Device database to a compressed MessagePack file."""
-        data = msgspec.msgpack.encode(db)
-        with lzma.open(path, 'wb', preset=1) as f:
-            f.write(data)
-
-    def load_chipdb(path: str) -> Device:
-        """Load a Device database from a compressed MessagePack file."""
-        with lzma.open(path, 'rb') as f:
-            data = f.read()
-        return msgspec.msgpack.decode(data, type=Device)
-
-except ImportError:
-    import warnings
-    warnings.warn("Msgspec is not available, performance will be degraded.")
-    import msgpack
-    import cattrs
-
-    _converter = cattrs.Converter()
-
-    # cattrs handles most types automatically (dataclasses, List, Set, Tuple,
-    # Dict, Optional) but needs help with ambiguous unions and bytearray.
-
-    _converter.register_structure_hook(
-        bytearray, lambda v, _: bytearray(v))
-    # timing: Union[List[float], int]
-    _converter.register_structure_hook(
-        Union[List[float], int],
-        lambda v, _: v if isinstance(v, int) else list(v))
-    # portmap inner: Union[str, List[str]]
-    _converter.register_structure_hook(
-        Union[str, List[str]],
-        lambda v, _: v if isinstance(v, str) else list(v))
-    # portmap outer: Union[str, List[Union[str, List[str]]]]
-    _converter.register_structure_hook(
-        Union[str, List[Union[str, List[str]]]],
-        lambda v, _: v if isinstance(v, str) else [
-            x if isinstance(x, str) else list(x) for x in v])
-
-    def save_chipdb(db: Device, path: str) -> None:
-        raise RuntimeError("save_chipdb requires msgspec")
-
-    def load_chipdb(path: str) -> Device:
-        """Load a Device database from a compressed MessagePack file."""
-        with lzma.open(path, 'rb') as f:
-            data = f.read()
-        raw = msgpack.unpackb(data, raw=False, strict_map_key=False,
-                              use_list=False)
-        return _converter.structure(raw, Device)
-
-
-def is_GW5_family(device):
-    return device in {'GW5A-25A', 'GW5AST-138C'}
+# the runtime part, re-exported for the builder code and the old imports
+from apycula.chipdb_rt import (
+    mode_attr_sep, Coord, Bel, Tile, Device, save_chipdb, load_chipdb,
+    is_GW5_family, gw5_hclk_idx, get_table_fuses, get_long_fuses,
+    get_shortval_fuses, get_longval_fuses, get_bank_fuses, get_bank_io_fuses,
+    add_attr_val, tile_offsets, tile_bitmap, fuse_bitmap, get_route_bits,
+    uturnlut, dirlut, WireResolver, wire_resolver, wire2global, global2wire,
+    make_wire_roots, get_wire_roots, rc2tbrl_0, rc2tbrl, loc2pin_name, loc2bank)
 
 def set_corners_io(db, device):
     if device in {'GW5A-25A'}:
@@ -1003,21 +740,6 @@ def fse_fill_logic_tables(dev, fse, device):
                 for f0, f1, f2, f3, f4, f5, f6, f7, f8, f9, f10, f11, f12, f13, f14, f15, *fuses in fse[ttyp]['longval'][ltable]:
                     table[(f0, f1, f2, f3, f4, f5, f6, f7, f8, f9, f10, f11, f12, f13, f14, f15)] = {fuse.fuse_lookup(fse, ttyp, f, device) for f in unpad(fuses)}
 
-def gw5_hclk_idx(dev, device, row, col):
-    if device == 'GW5A-25A':
-        if row == 0:
-            if col < 28:
-                return 2
-            return 0
-        if row == dev.rows - 1:
-            if col < 64:
-                return 1
-            return 3
-        if col == 0:
-            return 2
-        return 3
-    return -1
-
 # Table 48 describes the HCLK wire connections, but the problem is that it also
 # includes HCLK->GlobalCLK connections and HCLK->unknown-purpose-wire
 # connections.
@@ -4015,71 +3737,6 @@ def from_fse(device, fse, dat: Datfile):
     set_chip_flags(dev, device)
     return dev
 
-# get fuses for attr/val set using short/longval table
-# returns a bit set
-def get_table_fuses(attrs, table):
-    bits = set()
-    for key, fuses in table.items():
-        # all 1/2/16 "features" must be present to be able to use a set of bits from the record
-        have_full_key = True
-        for attrval in key:
-            if attrval == 0: # no "feature"
-                break
-            if attrval > 0:
-                # this "feature" must present
-                if attrval not in attrs:
-                    have_full_key = False
-                    break
-                continue
-            if attrval < 0:
-                # this "feature" is set by default and can only be unset
-                if abs(attrval) in attrs:
-                    have_full_key = False
-                    break
-        if not have_full_key:
-            continue
-        bits.update(fuses)
-    return bits
-
-# get fuses for attr/val set using longfuses table for ttyp
-# returns a bit set
-def get_long_fuses(dev, ttyp, attrs, table_name):
-    return get_table_fuses(attrs, dev.longfuses[ttyp][table_name])
-
-# get fuses for attr/val set using shortval table for ttyp
-# returns a bit set
-def get_shortval_fuses(dev, ttyp, attrs, table_name):
-    return get_table_fuses(attrs, dev.shortval[ttyp][table_name])
-
-# get fuses for attr/val set using longval table for ttyp
-# returns a bit set
-def get_longval_fuses(dev, ttyp, attrs, table_name):
-    return get_table_fuses(attrs, dev.longval[ttyp][table_name])
-
-# get bank fuses
-# The table for banks is different in that the first element in it is the
-# number of the bank, thus allowing the repetition of elements in the key
-def get_bank_fuses(dev, ttyp, attrs, table_name, bank_num):
-    return get_table_fuses(attrs, {k[1:]:val for k, val in dev.longval[ttyp][table_name].items() if k[0] == bank_num})
-
-# get fuses for attr/val set for bank use whatever table is preset in the cell: IOBA or IOBB
-# returns a bit set
-def get_bank_io_fuses(dev, ttyp, attrs):
-    tablename = 'IOBA'
-    if tablename not in dev.longval[ttyp]:
-        tablename = 'IOBB'
-        if tablename not in dev.longval[ttyp]:
-            return set()
-    return get_table_fuses(attrs, dev.longval[ttyp][tablename])
-
-# add the attribute/value pair into an set, which is then passed to
-# get_longval_fuses() and get_shortval_fuses()
-def add_attr_val(dev, logic_table, attrs, attr, val):
-    table = dev.logicinfo[logic_table]
-    attrval = table.get((attr, val))
-    if attrval:
-        attrs.add(attrval)
-
 def get_pins(device):
     if device not in {"GW1N-1", "GW1NZ-1", "GW1N-4", "GW1N-9", "GW1NR-9", "GW1N-9C", "GW1NR-9C", "GW1NSR-4C", "GW1N-1P5C", "GW2A-18", "GW2A-18C", "GW2AR-18C", "GW5A-25A", "GW5AST-138C"}:
         raise Exception(f"unsupported device {device}")
@@ -5727,120 +5384,6 @@ def dat_portmap(dat, dev, device):
                         bel.portmap[port] = port
                         #dev.aliases[row, col, port] = alias
 
-def tile_bitmap(dev, bitmap, empty=False):
-    res = {}
-    y = 0
-    for idx in range(dev.rows):
-        x=0
-        for jdx in range(dev.cols):
-            td = dev[idx, jdx]
-            w = td.width
-            h = td.height
-            tile = [row[x:x+w] for row in bitmap[y:y+h]]
-            if bitmatrix.any(tile) or empty:
-                res[(idx, jdx)] = tile
-            x+=w
-        y+=h
-
-    return res
-
-def fuse_bitmap(db, bitmap):
-    res = bitmatrix.zeros(db.height, db.width)
-    y = 0
-    for idx in range(db.rows):
-        x=0
-        for jdx in range(db.cols):
-            td = db[idx, jdx]
-            w = td.width
-            h = td.height
-            bitmatrix.blit(res, y, x, bitmap[(idx, jdx)])
-            x += w
-        y += h
-
-    return res
-
-def get_route_bits(db, row, col):
-    """ All routing bits for the cell """
-    bits = set()
-    for w in db[row, col].pips.values():
-        for v in w.values():
-            bits.update(v)
-    for w in db[row, col].clock_pips.values():
-        for v in w.values():
-            bits.update(v)
-    return bits
-
-uturnlut = {'N': 'S', 'S': 'N', 'E': 'W', 'W': 'E'}
-dirlut = {'N': (1, 0),
-          'E': (0, -1),
-          'S': (-1, 0),
-          'W': (0, 1)}
-def wire2global(row, col, db, wire):
-    if wire in {'VCC', 'VSS'}:
-        return wire
-
-    m = re.match(r"([NESW])([128]\d)(\d)", wire)
-    if not m: # not an inter-tile wire
-        return f"R{row}C{col}_{wire}"
-    direction, num, segment = m.groups()
-
-    rootrow = row + dirlut[direction][0]*int(segment)
-    rootcol = col + dirlut[direction][1]*int(segment)
-    # wires wrap around the edges
-    # assumes 1-based indexes
-    if rootrow < 1:
-        rootrow = 1 - rootrow
-        direction = uturnlut[direction]
-    if rootcol < 1:
-        rootcol = 1 - rootcol
-        direction = uturnlut[direction]
-    if rootrow > db.rows:
-        rootrow = 2*db.rows+1 - rootrow
-        direction = uturnlut[direction]
-    if rootcol > db.cols:
-        rootcol = 2*db.cols+1 - rootcol
-        direction = uturnlut[direction]
-    # map cross wires to their origin
-    #name = diaglut.get(direction+num, direction+num)
-    return f"R{rootrow}C{rootcol}_{direction}{num}"
-
-# row and col is zero-based
-def rc2tbrl_0(db, row, col, num = ''):
-    edge = db.corner_tiles_io.get((row, col), None)
-    if not edge:
-        if row == 0:
-            edge = 'T'
-        elif row == db.rows - 1:
-            edge = 'B'
-        elif col == 0:
-            edge = 'L'
-        elif col == db.cols - 1:
-            edge = 'R'
-    if edge in "TB":
-        idx = col + 1
-    else:
-        idx = row + 1
-    return f"IO{edge}{idx}{num}"
-
-def rc2tbrl(db, row, col, num = ''):
-    return rc2tbrl_0(db, row - 1, col - 1, num)
-
-def loc2pin_name(db, row, col):
-    """ returns name like "IOB3" without [A,B,C...]
-    """
-    return rc2tbrl_0(db, row, col)
-
-def loc2bank(db, row, col):
-    """ returns bank index 0...n
-    """
-    name = loc2pin_name(db, row, col)
-    nameA = name + 'A'
-    if nameA in db.pin_bank:
-        bank = db.pin_bank[nameA]
-    else:
-        bank = db.pin_bank[name + 'B']
-    return bank
-
 def fse_wire_delays(db, dev):
     wnames.select_wires(dev)
     for i in range(33): # A0-D7
@@ -473,12 +473,16 @@ def main():
             pinmap = run_sdram_script(db, device_args["pins"], device_args["device"], device_args["package"], device_args["partnumber"])
             db.sip_cst.setdefault(device_args["device"], {})[device_args["package"]] = pinmap
 
+    # the wire alias index for the unpacker
+    db.wire_roots = chipdb.make_wire_roots(db)
+
     # the reverse logicinfo does not make sense to store in the database
     db.rev_li = {}
 
     # Save output
     output = args.output or f"apycula/{device}.msgpack.xz"
-    save_chipdb(db, output)
+    refs, unique = save_chipdb(db, output)
+    print(f"{device}: {refs} fuse bit sets, {unique} distinct ({refs / max(unique, 1):.1f}x)")
 
 if __name__ == "__main__":
     main()
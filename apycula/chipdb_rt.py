@@ -0,0 +1,765 @@
+# The part of the chip database that packing and unpacking need: the Device
+# model, the loaders and the fuse/wire helpers. The builder code lives in
+# chipdb, which re-exports everything from here, so this module must not
+# import dat_parser, fse_parser or the rest of the vendor file tooling.
+from dataclasses import dataclass, field, fields, is_dataclass, make_dataclass
+from typing import Dict, List, Optional, Set, FrozenSet, Tuple, Union, Any, get_args, get_origin
+from functools import lru_cache
+import re
+import sys
+import lzma
+import weakref
+from apycula import bitmatrix
+
+# the character that marks the I/O attributes that come from the nextpnr
+mode_attr_sep = '&'
+
+# represents a row, column coordinate
+# can be either tiles or bits within tiles
+Coord = Tuple[int, int]
+
+# A big chip has thousands of Bels and Tiles, the slots save their
+# __dict__s. The builder assigns the fields after creation, so they are not
+# frozen. Slotted dataclasses need Python 3.10.
+_slots = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+@dataclass(**_slots)
+class Bel:
+    """Respresents a Basic ELement
+    with the specified modes mapped to bits
+    and the specified portmap"""
+    # there can be zero or more flags
+    flags: Dict[int, Set[Coord]] = field(default_factory=dict)
+    # this Bel is IOBUF and needs routing to become IBUF or OBUF
+    simplified_iob: bool = field(default = False)
+    # differential signal capabilities info
+    is_diff:      bool = field(default = False)
+    is_true_lvds: bool = field(default = False)
+    is_diff_p:    bool = field(default = False)
+    # there can be only one mode, modes are exclusive
+    modes: Dict[str, Set[Coord]] = field(default_factory=dict)
+    portmap: Dict[str, Union[str, List[Union[str, List[str]]]]] = field(default_factory=dict)
+    # where to set the fuses for the bel
+    fuse_cell_offset: Optional[Coord] = None
+
+    @property
+    def mode_bits(self):
+        return set().union(*self.modes.values())
+
+@dataclass(**_slots)
+class Tile:
+    """Represents all the configurable features
+    for this specific tile type"""
+    width: int
+    height: int
+    # At the time of packing/unpacking the information about the types of cells
+    # is already lost, it is critical to work through the 'logicinfo' table so
+    # store it.
+    ttyp: int
+    # a mapping from dest, source wire to bit coordinates
+    pips: Dict[str, Dict[str, Set[Coord]]] = field(default_factory=dict)
+    # This table plays an important role when setting the fuse,
+    # The fuse pair specified here is installed in case the sink is not
+    # connected to any of the listed sources. In the old IDE this was an
+    # unnecessary mechanism since all the fuses were listed in the rows of the
+    # [‘wire’][2] table, this is not the case in the new IDE.
+    # {dst: [({src}, {bits})]}
+    alonenode: Dict[str, List[Tuple[Set[str], Set[Coord]]]] = field(default_factory=dict)
+    # Clocks
+    clock_pips: Dict[str, Dict[str, Set[Coord]]] = field(default_factory=dict)
+    # fuses to disable the long wire columns. This is the table 'alonenode[6]' in the vendor file
+    # {dst: [({src}, {bits})]}
+    alonenode_6: Dict[str, List[Tuple[Set[str], Set[Coord]]]] = field(default_factory=dict)
+    # a mapping from bel type to bel
+    bels: Dict[str, Bel] = field(default_factory=dict)
+
+@dataclass
+class Device:
+    # grid of tile type indices (ttyp) - use device[row, col] to get Tile
+    grid: List[List[int]] = field(default_factory=list)
+    # special center cell (DSPs have gap there, also place for some clock MUX)
+    center_row: int = field (default = 0)
+    center_col: int = field (default = 0)
+    # tile type to Tile mapping
+    tiles: Dict[int, Tile] = field(default_factory=dict)
+    timing: Dict[str, Dict[str, Dict[str, Union[List[float], int]]]] = field(default_factory=dict)
+    # {wine_name: type_name}
+    wire_delay: Dict[str, str] = field(default_factory=dict)
+    packages: Dict[str, Tuple[str, str, str]] = field(default_factory=dict)
+    # {variant: {package: {pin#: (pin_name, [cfgs])}}}
+    pinout: Dict[str, Dict[str, Dict[str, Tuple[str, List[str]]]]] = field(default_factory=dict)
+    # {variant: {package: [(net, row, col, AB, iostd), ...]}}
+    sip_cst: Dict[str, Dict[str, List[Tuple[str, int, int, str, Optional[str]]]]] = field(default_factory=dict)
+    pin_bank: Dict[str, int] = field(default_factory = dict)
+    cmd_hdr: List[bytearray] = field(default_factory=list)
+    cmd_ftr: List[bytearray] = field(default_factory=list)
+    template: Optional[List[List[int]]] = None
+    # allowable values of bel attributes
+    # {table_name: {(attr_id, attr_value): code}}
+    logicinfo: Dict[str, Dict[Tuple[int, int], int]] = field(default_factory=dict)
+    # reverse logicinfo, is not stored in the pickle
+    rev_li: Dict[str, Dict[int, Tuple[int, int]]]  = field(default_factory=dict)
+    # fuses for single feature only
+    # {ttype: {table_name: {feature: {bits}}}
+    longfuses: Dict[int, Dict[str, Dict[Tuple[int,], Set[Coord]]]] = field(default_factory=dict)
+    # fuses for a pair of the "features" (or pairs of parameter values)
+    # {ttype: {table_name: {(feature_A, feature_B): {bits}}}
+    shortval: Dict[int, Dict[str, Dict[Tuple[int, int], Set[Coord]]]] = field(default_factory=dict)
+    # fuses for 16 of the "features"
+    # {ttype: {table_name: {(feature_0, feature_1, ..., feature_15): {bits}}}
+    longval: Dict[int, Dict[str, Dict[Tuple[int, int, int, int, int, int, int, int, int, int, int, int, int, int, int, int], Set[Coord]]]] = field(default_factory=dict)
+    # constant fuses
+    # we will use the list in case it turns out that order is important.
+    # {ttype: [(row, col), ...]}
+    const: Dict[int, List[Coord]] = field(default_factory=dict)
+    # for Himbaechel arch
+    # nodes - always connected wires {node_name: (wire_type, {(row, col, wire_name)})}
+    nodes: Dict[str, Tuple[str, Set[Tuple[int, int, str]]]] = field(default_factory = dict)
+    # the unpacker names all the wires of a node and the short SN/EW wires
+    # after a single root wire, see make_wire_roots()
+    # {(row, col, wire_name): root_wire_global_name}
+    wire_roots: Dict[Tuple[int, int, str], str] = field(default_factory = dict)
+    # strange bottom row IO. In order for OBUF and Co. to work, one of the four
+    # combinations must be applied to two special wires.
+    # (wire_a, wire_b, [(wire_a_net, wire_b_net)])
+    bottom_io: Tuple[str, str, List[Tuple[str, str]]] = field(default_factory = tuple)
+    # simplified IO rows
+    simplio_rows: Set[int] = field(default_factory = set)
+    # which PLL does this pad belong to. {IOLOC: (row, col, type, bel_name)}
+    # type = {'CLKIN_T', 'CLKIN_C', 'FB_T', 'FB_C'}
+    pad_pll: Dict[str, Tuple[int, int, str, str]] = field(default_factory = dict)
+    # tile types by func. The same ttyp number can correspond to different
+    # functional blocks on different chips. For example 86 is the PLL head ttyp
+    # for GW2A-18 and the same number is used in GW1N-1 where it has nothing to
+    # do with PLL.  { type_name: {type_num} }
+    tile_types: Dict[str, Set[int]] = field(default_factory = dict)
+    # supported differential IO primitives
+    diff_io_types: List[str] = field(default_factory = list)
+    # HCLK pips depend on the location of the cell, not on the type, so they
+    # are difficult to match with the deduplicated description of the tile
+    # { (y, x) : pips}
+    hclk_pips: Dict[Tuple[int, int], Dict[str, Dict[str, Set[Coord]]]] = field(default_factory=dict)
+    # extra cell functions besides main type like
+    # - OSCx
+    # - GSR
+    # - OSER16/IDES16
+    # - ref to hclk_pips
+    # - disabled blocks
+    # - BUF(G)
+    # - MIPI
+    extra_func: Dict[Tuple[int, int], Dict[str, Any]] = field(default_factory=dict)
+    # Chip features currently related to block memory like "HAS_SP32", "NEED_SP_FIX", etc
+    chip_flags: List[str] = field(default_factory=list)
+    # Segmented clock columns description
+    # { (y, x, idx) : {min_x, min_y, max_x, max_y, top_row, bottom_row, top_wire, bottom_wire,
+    # top_gate_wire[name, ], bottom_gate_wire[name,]}}
+    segments: Dict[Tuple[int, int, int], Dict[str, Any]] = field(default_factory=dict)
+    # GW5A renames the DCS inputs from CLK to CLKIN
+    dcs_prefix: str = field(default = "CLK")
+    # io configurations. { 'IOR3B' : {'MODE0', 'CCLK'}}  (example, not real)
+    # store alternative pin configurations that may not be present in a specific package.
+    io_cfg: Dict[str, Set[str]] = field(default_factory=dict)
+    # Gowin has a way of specifying pin locations in a .CST file as a side
+    # index, for example, IOR12A, which means pin 12 on the right side of the
+    # chip.
+    # We support this mechanism, but it has a peculiarity with corner tiles — let's
+    # say tile (0, 0) is both IOT1 and IOL1. Here we specify how to interpret the
+    # corners.
+    corner_tiles_io: Dict[Tuple[int, int], str] = field(default_factory=dict)
+    # GW5AST-138C has an interesting mechanism for clock spines - to use some
+    # of them, it is not enough to set the fuses, you also need to supply VCC
+    # or GND to some kind of MUX. This can only be done in nextpnr, so we pass
+    # a list of spines and MUX inputs, as well as which network to connect to (1/0).
+    # { 'top'/'bottom' : { spine : [(row, col, wire, 1/0), (row, col, wire, 1/0)...]}}
+    spine_select_wires: Dict[str, Dict[str, List[Tuple[int, int, str, int]]]] = field(default_factory=dict)
+    last_top_row: int = field(default=0)
+    # Which HCLK block can be used for an IOLOGIC located at the specified IO coordinates
+    # hclk idx : {(row, col), }
+    io2hclk: Dict[int, Set[Tuple[int, int]]] = field(default_factory=dict)
+    # Where are the CLKDIV2s associated with a specific HCLK located
+    # hclk idx : {(row, col, div2_idx), }
+    hclk_div2: Dict[int, Set[Tuple[int, int, int]]] = field(default_factory=dict)
+
+    def __getitem__(self, pos: Tuple[int, int]) -> Tile:
+        """Get tile at (row, col)."""
+        row, col = pos
+        return self.tiles[self.grid[row][col]]
+
+    def __setitem__(self, pos: Tuple[int, int], tile: Tile):
+        """Set tile at (row, col)."""
+        row, col = pos
+        self.tiles[tile.ttyp] = tile
+        self.grid[row][col] = tile.ttyp
+
+    @property
+    def rows(self):
+        return len(self.grid)
+
+    @property
+    def cols(self):
+        return len(self.grid[0])
+
+    @property
+    def height(self):
+        return sum(self[row, 0].height for row in range(self.rows))
+
+    @property
+    def width(self):
+        return sum(self[0, col].width for col in range(self.cols))
+
+    # Some chips have bits responsible for different banks in the same corner tile.
+    # Here stores the correspondence of the bank number to the (row, col) of the tile.
+    @property
+    def bank_tiles(self):
+        # { bank# : (row, col) }
+        res = {}
+        for row in range(self.rows):
+            for col in range(self.cols):
+                for bel in self[row, col].bels.keys():
+                    if bel.startswith('BANK'):
+                        res.update({ int(bel[4:]) : (row, col) })
+        return res
+
+    # make reverse logicinfo tables on demand
+    def rev_logicinfo(self, name):
+        if name not in self.rev_li:
+            table = self.rev_li.setdefault(name, {})
+            for attrval, code in self.logicinfo[name].items():
+                table[code] = attrval
+        return self.rev_li[name]
+
+
+# The same fuse bit sets appear in many tiles and tables. The file keeps one
+# copy of every distinct set in a pool and the Device refers to them by
+# index, the loader makes a frozenset per pool entry and shares it. The sets
+# of a loaded Device are therefore read-only.
+# The file is a [pool, device] array, the older files are a bare device map.
+_BitSet = Set[Coord]
+
+@lru_cache(maxsize = None)
+def _has_bitset(tp):
+    if tp == _BitSet:
+        return True
+    if is_dataclass(tp):
+        return any(_has_bitset(f.type) for f in fields(tp))
+    return any(_has_bitset(arg) for arg in get_args(tp))
+
+@lru_cache(maxsize = None)
+def _pooled_type(tp):
+    """ the type with the bit sets replaced by the pool indices """
+    if tp == _BitSet:
+        return int
+    if not _has_bitset(tp):
+        return tp
+    if is_dataclass(tp):
+        return make_dataclass(f'Pooled{tp.__name__}', [(f.name, _pooled_type(f.type)) for f in fields(tp)])
+    return tp.copy_with(tuple(_pooled_type(arg) for arg in get_args(tp)))
+
+def _walker(tp, leaf, make):
+    """ a function that rebuilds the value of type tp, the bit sets are
+        replaced with leaf(bits, ctx), the dataclasses with make(tp, {field: value})
+    """
+    if tp == _BitSet:
+        return leaf
+    if not _has_bitset(tp):
+        return None
+    if is_dataclass(tp):
+        walks = [(f.name, _walker(f.type, leaf, make)) for f in fields(tp)]
+        def walk(val, ctx):
+            return make(tp, {name: fn(getattr(val, name), ctx) if fn else getattr(val, name) for name, fn in walks})
+        return walk
+    origin = get_origin(tp)
+    args = get_args(tp)
+    if origin is dict:
+        fn = _walker(args[1], leaf, make)
+        return lambda val, ctx: {key: fn(item, ctx) for key, item in val.items()}
+    if origin is list or (origin is tuple and args[-1] is Ellipsis):
+        fn = _walker(args[0], leaf, make)
+        if origin is list:
+            return lambda val, ctx: [fn(item, ctx) for item in val]
+        return lambda val, ctx: tuple(fn(item, ctx) for item in val)
+    if origin is tuple:
+        fns = [_walker(arg, leaf, make) for arg in args]
+        return lambda val, ctx: tuple(fn(item, ctx) if fn else item for fn, item in zip(fns, val))
+    raise TypeError(f"can not pool the bit sets of {tp}")
+
+def _pool_bits(bits, ctx):
+    index, pool, refs = ctx
+    refs[0] += 1
+    key = frozenset(bits)
+    idx = index.get(key)
+    if idx is None:
+        idx = index.setdefault(key, len(pool))
+        pool.append(sorted(key))
+    return idx
+
+# the encoder writes the dicts of the fields the same way as the dataclasses,
+# the loader walks the decoded Pooled* objects by the fields of the originals
+_pool_device = _walker(Device, _pool_bits, lambda tp, vals: vals)
+_unpool_device = _walker(Device, lambda idx, pool: pool[idx], lambda tp, vals: tp(**vals))
+
+def pool_bitsets(db):
+    """ ([distinct bit sets], device as dicts with the pool indices, number of bit set references) """
+    pool = []
+    refs = [0]
+    data = _pool_device(db, ({}, pool, refs))
+    return pool, data, refs[0]
+
+
+try:
+    import msgspec
+
+    def save_chipdb(db: Device, path: str) -> Tuple[int, int]:
+        """Save a Device database to a compressed MessagePack file.
+        Returns the number of the bit set references and of the distinct sets."""
+        pool, data, refs = pool_bitsets(db)
+        data = msgspec.msgpack.encode([pool, data])
+        with lzma.open(path, 'wb', preset=1) as f:
+            f.write(data)
+        return refs, len(pool)
+
+    def load_chipdb(path: str) -> Device:
+        """Load a Device database from a compressed MessagePack file."""
+        with lzma.open(path, 'rb') as f:
+            data = f.read()
+        if data[0] != 0x92:
+            return msgspec.msgpack.decode(data, type=Device)
+        pool, pooled = msgspec.msgpack.decode(data, type=Tuple[List[FrozenSet[Coord]], _pooled_type(Device)])
+        return _unpool_device(pooled, pool)
+
+except ImportError:
+    import warnings
+    warnings.warn("Msgspec is not available, performance will be degraded.")
+    import msgpack
+    import cattrs
+
+    _converter = cattrs.Converter()
+
+    # cattrs handles most types automatically (dataclasses, List, Set, Tuple,
+    # Dict, Optional) but needs help with ambiguous unions and bytearray.
+
+    _converter.register_structure_hook(
+        bytearray, lambda v, _: bytearray(v))
+    # timing: Union[List[float], int]
+    _converter.register_structure_hook(
+        Union[List[float], int],
+        lambda v, _: v if isinstance(v, int) else list(v))
+    # portmap inner: Union[str, List[str]]
+    _converter.register_structure_hook(
+        Union[str, List[str]],
+        lambda v, _: v if isinstance(v, str) else list(v))
+    # portmap outer: Union[str, List[Union[str, List[str]]]]
+    _converter.register_structure_hook(
+        Union[str, List[Union[str, List[str]]]],
+        lambda v, _: v if isinstance(v, str) else [
+            x if isinstance(x, str) else list(x) for x in v])
+
+    def save_chipdb(db: Device, path: str) -> Tuple[int, int]:
+        raise RuntimeError("save_chipdb requires msgspec")
+
+    def load_chipdb(path: str) -> Device:
+        """Load a Device database from a compressed MessagePack file."""
+        with lzma.open(path, 'rb') as f:
+            data = f.read()
+        raw = msgpack.unpackb(data, raw=False, strict_map_key=False,
+                              use_list=False)
+        if not isinstance(raw, tuple):
+            return _converter.structure(raw, Device)
+        pool = [frozenset(tuple(coord) for coord in bits) for bits in raw[0]]
+        return _unpool_device(_converter.structure(raw[1], _pooled_type(Device)), pool)
+
+
+def is_GW5_family(device):
+    return device in {'GW5A-25A', 'GW5AST-138C'}
+
+def gw5_hclk_idx(dev, device, row, col):
+    if device == 'GW5A-25A':
+        if row == 0:
+            if col < 28:
+                return 2
+            return 0
+        if row == dev.rows - 1:
+            if col < 64:
+                return 1
+            return 3
+        if col == 0:
+            return 2
+        return 3
+    return -1
+
+# get fuses for attr/val set using short/longval table
+# returns a bit set
+def get_table_fuses(attrs, table):
+    bits = set()
+    for key, fuses in table.items():
+        # all 1/2/16 "features" must be present to be able to use a set of bits from the record
+        have_full_key = True
+        for attrval in key:
+            if attrval == 0: # no "feature"
+                break
+            if attrval > 0:
+                # this "feature" must present
+                if attrval not in attrs:
+                    have_full_key = False
+                    break
+                continue
+            if attrval < 0:
+                # this "feature" is set by default and can only be unset
+                if abs(attrval) in attrs:
+                    have_full_key = False
+                    break
+        if not have_full_key:
+            continue
+        bits.update(fuses)
+    return bits
+
+# get fuses for attr/val set using longfuses table for ttyp
+# returns a bit set
+def get_long_fuses(dev, ttyp, attrs, table_name):
+    return get_table_fuses(attrs, dev.longfuses[ttyp][table_name])
+
+# get fuses for attr/val set using shortval table for ttyp
+# returns a bit set
+def get_shortval_fuses(dev, ttyp, attrs, table_name):
+    return get_table_fuses(attrs, dev.shortval[ttyp][table_name])
+
+# get fuses for attr/val set using longval table for ttyp
+# returns a bit set
+def get_longval_fuses(dev, ttyp, attrs, table_name):
+    return get_table_fuses(attrs, dev.longval[ttyp][table_name])
+
+# get bank fuses
+# The table for banks is different in that the first element in it is the
+# number of the bank, thus allowing the repetition of elements in the key
+def get_bank_fuses(dev, ttyp, attrs, table_name, bank_num):
+    return get_table_fuses(attrs, {k[1:]:val for k, val in dev.longval[ttyp][table_name].items() if k[0] == bank_num})
+
+# get fuses for attr/val set for bank use whatever table is preset in the cell: IOBA or IOBB
+# returns a bit set
+def get_bank_io_fuses(dev, ttyp, attrs):
+    tablename = 'IOBA'
+    if tablename not in dev.longval[ttyp]:
+        tablename = 'IOBB'
+        if tablename not in dev.longval[ttyp]:
+            return set()
+    return get_table_fuses(attrs, dev.longval[ttyp][tablename])
+
+# add the attribute/value pair into an set, which is then passed to
+# get_longval_fuses() and get_shortval_fuses()
+def add_attr_val(dev, logic_table, attrs, attr, val):
+    table = dev.logicinfo[logic_table]
+    attrval = table.get((attr, val))
+    if attrval:
+        attrs.add(attrval)
+
+def tile_offsets(dev):
+    """ first bit row of every tile row and first bit column of every tile
+        column, the last elements are the full height and width
+    """
+    ys = [0]
+    for idx in range(dev.rows):
+        ys.append(ys[-1] + dev[idx, 0].height)
+    xs = [0]
+    for jdx in range(dev.cols):
+        xs.append(xs[-1] + dev[0, jdx].width)
+    return ys, xs
+
+# tiles - cut only these (row, col) tiles
+def tile_bitmap(dev, bitmap, empty=False, tiles=None):
+    res = {}
+    if tiles is not None:
+        ys, xs = tile_offsets(dev)
+        for idx, jdx in sorted(tiles):
+            td = dev[idx, jdx]
+            y = ys[idx]
+            x = xs[jdx]
+            tile = [row[x:x+td.width] for row in bitmap[y:y+td.height]]
+            if bitmatrix.any(tile) or empty:
+                res[(idx, jdx)] = tile
+        return res
+    y = 0
+    for idx in range(dev.rows):
+        x=0
+        for jdx in range(dev.cols):
+            td = dev[idx, jdx]
+            w = td.width
+            h = td.height
+            tile = [row[x:x+w] for row in bitmap[y:y+h]]
+            if bitmatrix.any(tile) or empty:
+                res[(idx, jdx)] = tile
+            x+=w
+        y+=h
+
+    return res
+
+def fuse_bitmap(db, bitmap):
+    res = bitmatrix.zeros(db.height, db.width)
+    y = 0
+    for idx in range(db.rows):
+        x=0
+        for jdx in range(db.cols):
+            td = db[idx, jdx]
+            w = td.width
+            h = td.height
+            bitmatrix.blit(res, y, x, bitmap[(idx, jdx)])
+            x += w
+        y += h
+
+    return res
+
+def get_route_bits(db, row, col):
+    """ All routing bits for the cell """
+    bits = set()
+    for w in db[row, col].pips.values():
+        for v in w.values():
+            bits.update(v)
+    for w in db[row, col].clock_pips.values():
+        for v in w.values():
+            bits.update(v)
+    return bits
+
+uturnlut = {'N': 'S', 'S': 'N', 'E': 'W', 'W': 'E'}
+dirlut = {'N': (1, 0),
+          'E': (0, -1),
+          'S': (-1, 0),
+          'W': (0, 1)}
+_intertile_wire_re = re.compile(r"([NESW])([128]\d)(\d)")
+
+def _fold(x, n):
+    # wires wrap around the edges, zero-based
+    flips = 0
+    if x < 0:
+        x = -1 - x
+        flips += 1
+    if x > n - 1:
+        x = 2 * n - 1 - x
+        flips += 1
+    return x, flips
+
+class WireResolver:
+    """ wire2global and the edge U-turns of the tracer for one device.
+        The wire names are parsed once, the edges are folded by table and
+        the global names are remembered.
+    """
+    # the longest wire is 8 cells, the tracer may look a wire further
+    _margin = 16
+
+    def __init__(self, db):
+        self.rows = db.rows
+        self.cols = db.cols
+        # {wire: (direction, num, segment) or None}
+        self._wires = {}
+        # folded coordinate and number of U-turns, zero-based, shifted by _margin
+        self._row_fold = [_fold(x - self._margin, self.rows) for x in range(self.rows + 2 * self._margin)]
+        self._col_fold = [_fold(x - self._margin, self.cols) for x in range(self.cols + 2 * self._margin)]
+        # {(row, col, wire): global name}
+        self._globals = {}
+
+    def wire_info(self, wire):
+        """ (direction, num, segment, row shift, col shift) of an inter-tile
+            wire, None for the rest
+        """
+        if wire in self._wires:
+            return self._wires[wire]
+        m = _intertile_wire_re.match(wire)
+        info = None
+        if m:
+            direction, num, segment = m.groups()
+            segment = int(segment)
+            info = (direction, num, segment, dirlut[direction][0] * segment, dirlut[direction][1] * segment)
+        self._wires[sys.intern(wire)] = info
+        return info
+
+    def fold(self, row, col, direction):
+        idx = row + self._margin
+        if 0 <= idx < len(self._row_fold):
+            row, row_flips = self._row_fold[idx]
+        else:
+            row, row_flips = _fold(row, self.rows)
+        idx = col + self._margin
+        if 0 <= idx < len(self._col_fold):
+            col, col_flips = self._col_fold[idx]
+        else:
+            col, col_flips = _fold(col, self.cols)
+        if (row_flips + col_flips) % 2:
+            direction = uturnlut[direction]
+        return row, col, direction
+
+    def uturn(self, row, col, wire):
+        """ zero-based (row, col, wire) that may be outside the chip -> the wire it turns into
+        """
+        info = self.wire_info(wire)
+        if info is None:
+            return row, col, wire
+        direction, num, segment, _, _ = info
+        if not (0 <= row < self.rows and 0 <= col < self.cols):
+            row, col, direction = self.fold(row, col, direction)
+        return row, col, f'{direction}{num}{segment}'
+
+    def wire2global(self, row, col, wire):
+        """ one-based row and col
+        """
+        key = (row, col, wire)
+        name = self._globals.get(key)
+        if name is not None:
+            return name
+        if wire in {'VCC', 'VSS'}:
+            name = wire
+        else:
+            info = self.wire_info(wire)
+            if info is None: # not an inter-tile wire
+                name = f"R{row}C{col}_{wire}"
+            else:
+                direction, num, _, drow, dcol = info
+                rootrow = row - 1 + drow
+                rootcol = col - 1 + dcol
+                if not (0 <= rootrow < self.rows and 0 <= rootcol < self.cols):
+                    rootrow, rootcol, direction = self.fold(rootrow, rootcol, direction)
+                # map cross wires to their origin
+                #name = diaglut.get(direction+num, direction+num)
+                name = f"R{rootrow + 1}C{rootcol + 1}_{direction}{num}"
+        self._globals[key] = name
+        return name
+
+def db_cache(cache, db):
+    """The part of a module level cache {id(db): {key: value}} that belongs
+    to db. It is dropped when db goes away, so the cache keeps no device
+    alive and a new db at the same address starts empty."""
+    entry = cache.get(id(db))
+    if entry is None:
+        entry = cache[id(db)] = {}
+        weakref.finalize(db, cache.pop, id(db), None)
+    return entry
+
+# {id(db): {'resolver': resolver}}
+_wire_resolvers = {}
+
+def wire_resolver(db):
+    cache = db_cache(_wire_resolvers, db)
+    if 'resolver' not in cache:
+        cache['resolver'] = WireResolver(db)
+    return cache['resolver']
+
+def wire2global(row, col, db, wire):
+    return wire_resolver(db).wire2global(row, col, wire)
+
+_global_wire_re = re.compile(r"R(\d+)C(\d+)_(.+)$")
+def global2wire(name):
+    """ 'R2C3_A0' -> (1, 2, 'A0'), None for VCC/VSS
+    """
+    m = _global_wire_re.match(name)
+    if not m:
+        return None
+    return (int(m.group(1)) - 1, int(m.group(2)) - 1, m.group(3))
+
+def make_wire_roots(db):
+    def by_name_len(el):
+        return len(el[2])
+
+    res = {}
+    # Himbaechel nodes
+    for node_desc in db.nodes.values():
+        root_wire = None
+        for row, col, wire in sorted(node_desc[1], key = by_name_len):
+            if not root_wire:
+                root_wire = f'R{row + 1}C{col + 1}_{wire}'
+                continue
+            res[(row, col, wire)] = root_wire
+    # the 1-hop wires are seen from both ends
+    for row in range(db.rows):
+        for col in range(db.cols):
+            for i in [1, 2]:
+                res[global2wire(wire2global(row + 0, col + 1, db, f'N1{i}1'))] = f'R{row + 1}C{col + 1}_SN{i}0'
+                res[global2wire(wire2global(row + 2, col + 1, db, f'S1{i}1'))] = f'R{row + 1}C{col + 1}_SN{i}0'
+                res[global2wire(wire2global(row + 1, col + 0, db, f'W1{i}1'))] = f'R{row + 1}C{col + 1}_EW{i}0'
+                res[global2wire(wire2global(row + 1, col + 2, db, f'E1{i}1'))] = f'R{row + 1}C{col + 1}_EW{i}0'
+    return res
+
+# the databases made before the index was stored get it on demand
+def get_wire_roots(db):
+    if not db.wire_roots:
+        db.wire_roots = make_wire_roots(db)
+    return db.wire_roots
+
+# row and col is zero-based
+def rc2tbrl_0(db, row, col, num = ''):
+    edge = db.corner_tiles_io.get((row, col), None)
+    if not edge:
+        if row == 0:
+            edge = 'T'
+        elif row == db.rows - 1:
+            edge = 'B'
+        elif col == 0:
+            edge = 'L'
+        elif col == db.cols - 1:
+            edge = 'R'
+    if edge in "TB":
+        idx = col + 1
+    else:
+        idx = row + 1
+    return f"IO{edge}{idx}{num}"
+
+def rc2tbrl(db, row, col, num = ''):
+    return rc2tbrl_0(db, row - 1, col - 1, num)
+
+def loc2pin_name(db, row, col):
+    """ returns name like "IOB3" without [A,B,C...]
+    """
+    return rc2tbrl_0(db, row, col)
+
+def loc2bank(db, row, col):
+    """ returns bank index 0...n
+    """
+    name = loc2pin_name(db, row, col)
+    nameA = name + 'A'
+    if nameA in db.pin_bank:
+        bank = db.pin_bank[nameA]
+    else:
+        bank = db.pin_bank[name + 'B']
+    return bank
+
+def _deep_size(obj, seen):
+    size = 0
+    stack = [obj]
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        size += sys.getsizeof(obj)
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple, set, frozenset)):
+            stack.extend(obj)
+        elif is_dataclass(obj):
+            stack.extend(getattr(obj, f.name) for f in fields(obj))
+            if hasattr(obj, '__dict__'):
+                size += sys.getsizeof(obj.__dict__)
+    return size
+
+def memory_report(db):
+    """ {Device field: bytes} of the objects reachable from the field, an
+        object shared between fields is counted once, under the first one
+    """
+    seen = {id(db)}
+    return {f.name: _deep_size(getattr(db, f.name), seen) for f in fields(db)}
+
+def print_memory_report(db, file = sys.stdout):
+    report = memory_report(db)
+    total = sum(report.values())
+    bels = sum(len(tile.bels) for tile in db.tiles.values())
+    print(f"{'field':<20} {'MiB':>10} {'%':>6}", file = file)
+    for name, size in sorted(report.items(), key = lambda kv: -kv[1]):
+        if size >= 1024:
+            print(f"{name:<20} {size / (1024 * 1024):>10.3f} {100.0 * size / total:>6.1f}", file = file)
+    print(f"{'total':<20} {total / (1024 * 1024):>10.3f}, {len(db.tiles)} tiles, {bels} bels", file = file)
+
+if __name__ == "__main__":
+    import importlib.resources
+    for device in sys.argv[1:]:
+        with importlib.resources.path('apycula', f'{device}.msgpack.xz') as path:
+            db = load_chipdb(path)
+        pool, _, refs = pool_bitsets(db)
+        print(f"{device}: {refs} fuse bit sets, {len(pool)} distinct ({refs / max(len(pool), 1):.1f}x)")
+        print_memory_report(db)
@@ -2,6 +2,7 @@ from collections import namedtuple
 from itertools import chain
 import os
 import re
+import json
 import subprocess
 import tempfile
 import shutil
@@ -20,19 +21,56 @@ class Module:
 
     def __add__(self, other):
         m = Module()
-        m.inputs = self.inputs | other.inputs
-        m.outputs = self.outputs | other.outputs
-        m.inouts = self.inouts | other.inouts
-        m.wires = self.wires | other.wires
-        m.wire_aliases = self.wire_aliases | other.wire_aliases
-        m.assigns = self.assigns + other.assigns
-        m.primitives = {**self.primitives, **other.primitives}
+        m.extend([self, other])
         return m
 
+    def merge(self, other):
+        """ add the other module to this one in place """
+        self.inputs |= other.inputs
+        self.outputs |= other.outputs
+        self.inouts |= other.inouts
+        self.wires |= other.wires
+        self.wire_aliases.update(other.wire_aliases)
+        self.assigns.extend(other.assigns)
+        for name, prim in other.primitives.items():
+            if name in self.primitives:
+                # some primitives (PLL) are assembled from several tiles
+                prim = self.primitives[name] + prim
+            self.primitives[name] = prim
+        return self
+
+    def extend(self, others):
+        """ merge the modules in the given order, later ones win the conflicts
+            like they do with a chain of + """
+        for other in others:
+            self.merge(other)
+        return self
+
     def write(self, f):
+        self.write_declarations(f)
+
+        # unique assignments or not
+        #for dest, src in self.assigns:
+        for dest, src in dict(self.assigns).items():
+            dest_px = ''
+            src_px = ''
+            if dest in self.wire_aliases:
+                dest_px = '`'
+            if src in self.wire_aliases:
+                src_px = '`'
+            f.write("assign {}{} = {}{};\n".format(dest_px, dest, src_px, src))
+
+        for module in self.primitives.values():
+            module.write(f)
+
+        f.write("endmodule\n")
+
+    def write_declarations(self, f):
+        # sets are written sorted so that the output does not depend on the
+        # hash seed or on the order in which the module was put together
         f.write("module top(")
         first = True
-        for port in chain(self.inputs, self.outputs, self.inouts):
+        for port in chain(sorted(self.inputs), sorted(self.outputs), sorted(self.inouts)):
             if not first:
                 f.write(", ")
             first = False
@@ -40,35 +78,230 @@ class Module:
             f.write(bare)
         f.write(");\n")
 
-        for port in self.inputs:
+        for port in sorted(self.inputs):
             f.write("input {};\n".format(port))
-        for port in self.outputs:
+        for port in sorted(self.outputs):
             f.write("output {};\n".format(port))
-        for port in self.inouts:
+        for port in sorted(self.inouts):
             f.write("inout {};\n".format(port))
 
-        for wire in self.wires:
+        for wire in sorted(self.wires):
             if wire in self.wire_aliases:
                 f.write("`define {} {}\n".format(wire, self.wire_aliases[wire]))
             else:
                 f.write("wire {};\n".format(wire))
 
-        # unique assignments or not
-        #for dest, src in self.assigns:
-        for dest, src in dict(self.assigns).items():
-            dest_px = ''
-            src_px = ''
-            if dest in self.wire_aliases:
-                dest_px = '`'
-            if src in self.wire_aliases:
-                src_px = '`'
+    def write_json(self, f, top = "top"):
+        """ Yosys JSON netlist. Aliased and assigned wires become one net. """
+        parent = {}
+        def find(name):
+            parent.setdefault(name, name)
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+        def union(a, b):
+            a = find(a)
+            b = find(b)
+            if a != b:
+                # the smaller name represents the net so the numbering is stable
+                if b < a:
+                    a, b = b, a
+                parent[b] = a
+
+        ports = {}
+        for direction, names in (('input', self.inputs), ('output', self.outputs), ('inout', self.inouts)):
+            for port in sorted(names):
+                bare = re.sub(r" *\[.*\] *", "", port)
+                ports[bare] = direction
+                find(bare)
+        for wire in self.wires:
+            find(wire)
+        for prim in self.primitives.values():
+            for wire in prim.portmap.values():
+                for name in (wire if isinstance(wire, list) else [wire]):
+                    if _const_bits(name) is None:
+                        find(name)
+        assigns = dict(self.assigns)
+        for dest, src in assigns.items():
+            find(dest)
+            if _const_bits(src) is None:
+                find(src)
+        # only the aliases of the wires in use, like write() does
+        for wire in list(parent):
+            if wire in self.wire_aliases:
+                union(wire, self.wire_aliases[wire])
+        consts = {}
+        for dest, src in assigns.items():
+            bits = _const_bits(src)
+            if bits is None:
+                union(dest, src)
+            else:
+                consts[dest] = bits[0]
+        consts = {find(name): bit for name, bit in consts.items()}
+
+        # nets are numbered in the order of their names, 0 and 1 are the constants
+        nets = {}
+        net_bits = {}
+        for name in sorted(parent):
+            root = find(name)
+            if root in consts:
+                net_bits[name] = consts[root]
+            else:
+                net_bits[name] = nets.setdefault(root, len(nets) + 2)
+
+        def bits_of(wire):
+            if isinstance(wire, list):
+                # Verilog concatenation is MSB first, the JSON bits are LSB first
+                return list(chain.from_iterable(bits_of(x) for x in reversed(wire)))
+            const = _const_bits(wire)
+            if const is not None:
+                return const
+            return [net_bits[wire]]
+
+        cells = {}
+        for prim in self.primitives.values():
+            cells[prim.inst] = {
+                "hide_name": 0,
+                "type": prim.typ,
+                "parameters": {key: _json_param(val) for key, val in prim.params.items()},
+                "attributes": {},
+                "connections": {port: bits_of(wire) for port, wire in prim.portmap.items()},
+            }
+        json.dump({
+            "creator": "apycula",
+            "modules": {
+                top: {
+                    "attributes": {"top": "00000000000000000000000000000001"},
+                    "ports": {name: {"direction": direction, "bits": bits_of(name)}
+                              for name, direction in ports.items()},
+                    "cells": cells,
+                    "netnames": {name: {"hide_name": 0, "bits": [bits], "attributes": {}}
+                                 for name, bits in net_bits.items()},
+                },
+            },
+        }, f)
+
+class StreamingModule(Module):
+    """ A Module that does not keep its assigns and primitives: flush() writes
+        them to a temporary file, write() puts the port and wire declarations
+        in front of it. Only the names of the wires and of the assigned nets
+        stay in memory, and the primitives of the types in `deferred`, which
+        are assembled from several tiles and written at the end.
+        alias(wire) returns the alias root of the wire or None. Like with
+        Module.write the last assign to a net wins, the earlier ones are only
+        remembered by their line number and skipped when the file is copied.
+    """
+    def __init__(self, alias = None, deferred = ()):
+        super().__init__()
+        self.alias = alias
+        self.deferred = set(deferred)
+        # {net: line number of its last assign}, line numbers of the overridden ones
+        self._assigned = {}
+        self._overridden = set()
+        self._assign_lines = 0
+        self._assign_body = tempfile.TemporaryFile('w+')
+        self._body = tempfile.TemporaryFile('w+')
+
+    def alias_of(self, wire):
+        if wire in self.wire_aliases:
+            return self.wire_aliases[wire]
+        root = self.alias(wire) if self.alias else None
+        if root is not None:
+            self.wire_aliases[wire] = root
+        return root
+
+    def merge(self, other):
+        """ take over a fragment decoded elsewhere and write it out """
+        super().merge(other)
+        self.flush()
+        return self
+
+    def flush(self):
+        f = self._assign_body
+        for dest, src in self.assigns:
+            if dest in self._assigned:
+                self._overridden.add(self._assigned[dest])
+            self._assigned[dest] = self._assign_lines
+            self._assign_lines += 1
+            dest_px = '`' if self.alias_of(dest) is not None else ''
+            src_px = '`' if self.alias_of(src) is not None else ''
             f.write("assign {}{} = {}{};\n".format(dest_px, dest, src_px, src))
+        self.assigns = []
+        f = self._body
+        for name, prim in list(self.primitives.items()):
+            if prim.typ in self.deferred:
+                continue
+            prim.write(f)
+            del self.primitives[name]
+
+    def write_json(self, f, top = "top"):
+        raise Exception("A streamed module can only be written as Verilog")
 
+    def write(self, f):
+        self.flush()
+        # the wires that only appear in the declarations
+        for wire in self.wires:
+            self.alias_of(wire)
+        self.write_declarations(f)
+        self._assign_body.seek(0)
+        for idx, line in enumerate(self._assign_body):
+            if idx not in self._overridden:
+                f.write(line)
+        self._body.seek(0)
+        shutil.copyfileobj(self._body, f)
+        self._assign_body.close()
+        self._body.close()
+        self._assigned = {}
+        self._overridden = set()
+        self._assign_lines = 0
+        self._assign_body = tempfile.TemporaryFile('w+')
+        self._body = tempfile.TemporaryFile('w+')
         for module in self.primitives.values():
             module.write(f)
-
         f.write("endmodule\n")
 
+# Verilog sized constant -> list of '0'/'1'/'x'/'z', LSB first
+_verilog_const_re = re.compile(r"(\d+)'([bhd])([0-9a-fA-FxXzZ_]+)$")
+def _const_bits(val):
+    m = _verilog_const_re.match(str(val))
+    if not m:
+        return None
+    width, base, digits = m.groups()
+    width = int(width)
+    digits = digits.replace('_', '').lower()
+    if base == 'b':
+        bits = digits
+    elif base == 'h':
+        bits = ''.join(c * 4 if c in 'xz' else f'{int(c, 16):04b}' for c in digits)
+    elif digits in {'x', 'z'}:
+        # 'dx and 'dz set all the bits
+        bits = digits * width
+    elif digits.isdigit():
+        bits = f'{int(digits):b}'
+    else:
+        return None
+    bits = bits[-width:].rjust(width, '0')
+    return list(reversed(bits))
+
+# Verilog parameter value -> Yosys JSON parameter value
+def _json_param(val):
+    if isinstance(val, int):
+        return f'{val & 0xffffffff:032b}'
+    val = str(val)
+    if len(val) >= 2 and val[0] == '"' and val[-1] == '"':
+        val = val[1:-1]
+        # a string that looks like bits is marked with a trailing space
+        if re.fullmatch(r"[01xz]*", val):
+            val += ' '
+        return val
+    bits = _const_bits(val)
+    if bits is not None:
+        return ''.join(reversed(bits))
+    if re.fullmatch(r"-?\d+", val):
+        return f'{int(val) & 0xffffffff:032b}'
+    return val
+
 class Primitive:
     def __init__(self, typ, inst):
         self.typ = typ
@@ -76,6 +309,12 @@ class Primitive:
         self.portmap = {}
         self.params = {}
 
+    def __add__(self, other):
+        prim = Primitive(self.typ, self.inst)
+        prim.portmap = {**self.portmap, **other.portmap}
+        prim.params = {**self.params, **other.params}
+        return prim
+
     def write(self, f):
         f.write("{} {} (".format(self.typ, self.inst))
         first = True
@@ -100,12 +339,21 @@ class Constraints:
 
     def __add__(self, other):
         cst = Constraints()
-        cst.cells = {**self.cells, **other.cells}
-        cst.ports = {**self.ports, **other.ports}
-        cst.attrs = {**self.attrs, **other.attrs}
-        cst.clocks = {**self.clocks, **other.clocks}
+        cst.extend([self, other])
         return cst
 
+    def merge(self, other):
+        self.cells.update(other.cells)
+        self.ports.update(other.ports)
+        self.attrs.update(other.attrs)
+        self.clocks.update(other.clocks)
+        return self
+
+    def extend(self, others):
+        for other in others:
+            self.merge(other)
+        return self
+
     def write(self, f):
         for key, val in self.cells.items():
             row, col, side, lut = val
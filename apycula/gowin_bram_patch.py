@@ -0,0 +1,270 @@
+import re
+import argparse
+import importlib.resources
+from apycula import gowin_pack
+from apycula.chipdb_rt import load_chipdb
+from apycula.bslib import bytearr, chunks, compressLine, _B2B
+from apycula.crc16 import make_crc16_arc
+
+# Replace the init data of BSRAMs in an existing bitstream without running
+# place and route again. Only the frames that carry the init data of the
+# patched BSRAMs are rewritten, everything else is copied as is.
+#
+# The init data of the chips before GW5A is stacked under the main grid, one
+# frame per init map row. GW5A chips write the init data in blocks of frames
+# after the main grid, one block per run of neighbouring BSRAM columns.
+#
+# Every frame CRC starts from a constant, so a changed frame only needs its
+# own CRC fixed. CRC-16/ARC is linear: for messages of the same length
+# crc(a ^ b) == crc(a) ^ crc(b), so the new CRC of an uncompressed frame is
+# the old one xor the CRC of the difference, no matter what precedes the frame
+# (the first frame of a GW5A init block also covers the block command bytes).
+# A compressed frame changes its length and is recompressed, its CRC is
+# computed anew over the 0xff filler and the frame. Only the init rows of the
+# chips before GW5A can be compressed.
+# The footer checksum is computed over the main grid only and stays valid.
+
+_gw5_devices = {'GW5A-25A', 'GW5AST-138C'}
+_loc_re = re.compile(r'R(\d+)C(\d+)$')
+_init_re = re.compile(r"INIT_RAM_([0-9A-Fa-f]{2})\s*=\s*(?:\d*'([hHbB]))?([0-9A-Fa-fxXzZ_]+)")
+_x9_widths = {9, 18, 36}
+
+def read_init(fname):
+    """INIT_RAM_xx = value lines, as in a Verilog defparam (256'h...) or as
+    binary strings like in the nextpnr JSON."""
+    parms = {}
+    with open(fname) as f:
+        for m in _init_re.finditer(f.read()):
+            val = m.group(3).replace('_', '')
+            if m.group(2) in {'h', 'H'}:
+                val = ''.join('0000' if c in 'xXzZ' else f'{int(c, 16):04b}' for c in val)
+            else:
+                val = ''.join('0' if c in 'xXzZ' else c for c in val)
+            parms[f'INIT_RAM_{int(m.group(1), 16):02X}'] = val
+    return parms
+
+def read_hex(fname, width):
+    """$readmemh style: one word per token, @addr sets the word address."""
+    data = 0
+    addr = 0
+    mask = (1 << width) - 1
+    with open(fname) as f:
+        for line in f:
+            for tok in line.split('//')[0].split():
+                if tok[0] == '@':
+                    addr = int(tok[1:], 16)
+                    continue
+                data |= (int(tok.replace('_', ''), 16) & mask) << (addr * width)
+                addr += 1
+    return data
+
+def read_bin(fname, width):
+    """Raw words of width bits, each in (width + 7) // 8 little endian bytes."""
+    with open(fname, 'rb') as f:
+        raw = f.read()
+    nbytes = (width + 7) // 8
+    if nbytes == width // 8:
+        return int.from_bytes(raw, 'little')
+    data = 0
+    mask = (1 << width) - 1
+    for addr, word in enumerate(chunks(raw, nbytes)):
+        data |= (int.from_bytes(word, 'little') & mask) << (addr * width)
+    return data
+
+def data2init(data, width):
+    """Cut the memory contents into INIT_RAM_xx strings, bit 0 is the last char."""
+    row_bits = 288 if width in _x9_widths else 256
+    if data >> (row_bits * 0x40):
+        raise Exception(f"The contents do not fit into the BSRAM ({row_bits * 0x40} bits)")
+    mask = (1 << row_bits) - 1
+    return {f'INIT_RAM_{init_row:02X}': f'{(data >> (init_row * row_bits)) & mask:0{row_bits}b}'
+            for init_row in range(0x40)}
+
+def read_contents(fname, fmt, width):
+    if fmt == 'init':
+        parms = read_init(fname)
+        if not parms:
+            raise Exception(f"No INIT_RAM_xx values in {fname}")
+        if width is None:
+            width = 9 if max(len(val) for val in parms.values()) > 256 else 8
+        row_bits = 288 if width in _x9_widths else 256
+        # every row is replaced, the missing ones are zeroed
+        return {f'INIT_RAM_{init_row:02X}': parms.get(f'INIT_RAM_{init_row:02X}', '0').zfill(row_bits)
+                for init_row in range(0x40)}, width
+    if width is None:
+        width = 8
+    if fmt == 'hex':
+        return data2init(read_hex(fname, width), width), width
+    return data2init(read_bin(fname, width), width), width
+
+class Bitstream:
+    """Lines of a .fs file with the positions of the frames."""
+    def __init__(self, fname):
+        with open(fname) as f:
+            self.lines = f.read().splitlines()
+        self.frame_start = None
+        self.frames = 0
+        # {key char string: zero bytes} as in bslib.read_bitstream
+        self.compress_keys = {}
+        compressed = False
+        preamble = 3
+        for idx, line in enumerate(self.lines):
+            if line.startswith('//') or not line.strip():
+                continue
+            ba = bytearr(line)
+            if ba[0] == 0x10 and (int.from_bytes(ba, 'big') & (1 << 13)):
+                compressed = True
+            if ba[0] == 0x51:
+                self.compress_keys[f'{ba[5]:08b}'] = 8
+                if ba[6]:
+                    self.compress_keys[f'{ba[6]:08b}'] = 4
+                    if ba[7]:
+                        self.compress_keys[f'{ba[7]:08b}'] = 2
+            if not preamble and ba[0] == 0x3b: # frame count
+                self.frames = int.from_bytes(ba[2:], 'big')
+                self.frame_start = idx + 1
+                break
+            preamble = max(0, preamble - 1)
+        if self.frame_start is None:
+            raise Exception(f"No frames in {fname}")
+        if not compressed:
+            self.compress_keys = {}
+        self.frame_end = self.frame_start + self.frames
+
+    def gw5_blocks(self, is_138):
+        """[(first BSRAM column // 3, number of columns, index of the first
+        data frame)] of the init blocks written by bslib.write_gw5_*_bsram_init_map."""
+        blocks = []
+        in_init = False
+        start = 0
+        idx = self.frame_end
+        while idx < len(self.lines):
+            line = self.lines[idx]
+            idx += 1
+            if line.startswith('//') or not line.strip():
+                continue
+            ba = bytearr(line)
+            if ba[0] == 0x12:
+                in_init = True
+                start = 0
+            elif not in_init:
+                continue
+            elif ba[0] == 0x98:
+                # onehot column address
+                start = (2720 - next(i for i, b in enumerate(ba) if i and b)) // 45
+            elif ba[0] == 0x70:
+                start = ba[3] - 1
+            elif ba[0] == 0x4e and ba[1] == 0x80:
+                if is_138:
+                    cnt = ba[2]
+                    if ba[3]:
+                        # extra zero frame in the first column
+                        idx += 1
+                else:
+                    cnt = ba[2] + (ba[3] << 8)
+                blocks.append((start, cnt, idx))
+                idx += 256 * cnt
+        return blocks
+
+    def patch(self, idx, end, bits, calc, compressed = True):
+        """Put the bits string into the uncompressed frame data so that it
+        ends end chars before the end of the data. The compression keys of
+        the header apply to the main grid frames only, the GW5A init blocks
+        are never compressed and pass compressed = False."""
+        line = self.lines[idx]
+        data = line[:-64]
+        compressed = compressed and self.compress_keys
+        if compressed:
+            data = ''.join('00000000' * self.compress_keys[byte_str] if byte_str in self.compress_keys else byte_str
+                           for byte_str in chunks(data, 8))
+        pos = len(data) - end - len(bits)
+        new_data = data[:pos] + bits + data[len(data) - end:]
+        if new_data == data:
+            return False
+        nbytes = len(data) // 8
+        if compressed:
+            new_bytes = int(new_data, 2).to_bytes(nbytes, 'big')
+            keys = [int(key, 2) for key in self.compress_keys]
+            if set(keys) & set(new_bytes):
+                raise Exception("The new contents use the bytes reserved for the compression, repack without -c")
+            keys = {n: int(key, 2) for key, n in self.compress_keys.items()}
+            ba = compressLine(list(new_bytes), keys[8], keys.get(4, 0), keys.get(2, 0))
+            crc_ = calc(b'\xff' * 6 + bytes(ba))
+            new_data = ''.join(_B2B[b] for b in ba)
+        else:
+            crc_ = int(line[-56:-48] + line[-64:-56], 2)
+            crc_ ^= calc((int(data, 2) ^ int(new_data, 2)).to_bytes(nbytes, 'big'))
+        self.lines[idx] = new_data + _B2B[crc_ & 0xff] + _B2B[crc_ >> 8] + line[-48:]
+        return True
+
+    def write(self, fname):
+        with open(fname, 'w') as f:
+            for line in self.lines:
+                f.write(line)
+                f.write('\n')
+
+def patch_bsram(db, bs, row, col, parms, subtype, calc, gw5_blocks = None):
+    """Rewrite the init frames of the BSRAM at (row, col), 0-based. Returns
+    the number of changed frames."""
+    if 'BSRAM' not in db[row, col].bels or row not in db.simplio_rows:
+        raise Exception(f"No BSRAM at R{row + 1}C{col + 1}")
+    loc_map = gowin_pack.bsram_init_cell_map(db, subtype, parms)
+    y, x = gowin_pack.bsram_init_cell_pos(db, row, col)
+    changed = 0
+    if gw5_blocks is None:
+        init_rows = 256 * len(db.simplio_rows)
+        main_rows = db.height
+        if bs.frames != main_rows + init_rows:
+            raise Exception("The bitstream has no BSRAM init data, run gowin_pack with the init values set")
+        for i, map_row in enumerate(loc_map):
+            # the frames are the rows of the map mirrored left to right
+            idx = bs.frame_start + main_rows + y + i
+            changed += bs.patch(idx, x, ''.join(str(int(v)) for v in reversed(map_row)), calc)
+        return changed
+
+    for start, cnt, first in gw5_blocks:
+        if start <= col // 3 < start + cnt:
+            break
+    else:
+        raise Exception(f"The bitstream has no init data for the BSRAM column {col + 1}, run gowin_pack with the init values set")
+    first += (col // 3 - start) * 256
+    # the frames are the columns of the cell map, mirrored
+    for k, map_col in enumerate(zip(*loc_map)):
+        changed += bs.patch(first + k, y, ''.join(str(int(v)) for v in reversed(map_col)), calc, compressed = False)
+    return changed
+
+def main():
+    parser = argparse.ArgumentParser(description='Replace the BSRAM init data of a Gowin bitstream')
+    parser.add_argument('bitstream')
+    parser.add_argument('-d', '--device', required=True)
+    parser.add_argument('-o', '--output', default=None, help='output file, the input is overwritten by default')
+    parser.add_argument('-b', '--bsram', action='append', required=True, metavar='RxCy=FILE',
+                        help='BSRAM location as in the bel name and the file with the new contents')
+    parser.add_argument('-f', '--format', choices=['init', 'hex', 'bin'], default='init',
+                        help='INIT_RAM_xx values, $readmemh words or raw binary words')
+    parser.add_argument('-w', '--width', type=int, default=None,
+                        help='data width of the hex/bin words, 9, 18 and 36 select the X9 mode')
+    args = parser.parse_args()
+
+    with importlib.resources.path('apycula', f'{args.device}.msgpack.xz') as path:
+        db = load_chipdb(path)
+    gowin_pack.device = args.device
+
+    bs = Bitstream(args.bitstream)
+    gw5_blocks = None
+    if args.device in _gw5_devices:
+        gw5_blocks = bs.gw5_blocks(args.device == 'GW5AST-138C')
+    calc = make_crc16_arc()
+    for spec in args.bsram:
+        loc, _, fname = spec.partition('=')
+        m = _loc_re.match(loc.upper())
+        if not m or not fname:
+            raise Exception(f"Bad BSRAM spec {spec}, expected RxCy=FILE")
+        parms, width = read_contents(fname, args.format, args.width)
+        subtype = 'X9' if width in _x9_widths else ''
+        changed = patch_bsram(db, bs, int(m.group(1)) - 1, int(m.group(2)) - 1, parms, subtype, calc, gw5_blocks)
+        print(f'{loc}: {changed} frames changed')
+    bs.write(args.output or args.bitstream)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+import sys
+import argparse
+import importlib.resources
+from bisect import bisect_right
+from apycula import bitmatrix
+from apycula import gowin_unpack
+from apycula.chipdb_rt import load_chipdb, tile_offsets
+from apycula.bslib import read_bitstream
+
+# Compare two bitstreams for the same device. Only the tiles that contain
+# changed bits are decoded, so the run time depends on the size of the change
+# rather than on the size of the chip. The chips before GW5A keep the BSRAM
+# init rows below the main grid, these are only counted, like the header and
+# the slots.
+
+class TileBitmap:
+    """Tiles of a bitmap cut out on demand, looks like the result of
+    chipdb_rt.tile_bitmap(db, bitmap, empty = True) to parse_tile_."""
+    def __init__(self, db, bitmap, offsets):
+        self.db = db
+        self.bitmap = bitmap
+        self.ys, self.xs = offsets
+
+    def __getitem__(self, pos):
+        row, col = pos
+        y, x = self.ys[row], self.xs[col]
+        td = self.db[row, col]
+        return [bmp_row[x:x + td.width] for bmp_row in self.bitmap[y:y + td.height]]
+
+def changed_bits(bitmap_a, bitmap_b, offsets):
+    # {(row, col): [(bit row, bit col) within the tile]}
+    ys, xs = offsets
+    res = {}
+    diff = bitmatrix.xor(bitmatrix.crop(bitmap_a, 0, 0, ys[-1], xs[-1]),
+                         bitmatrix.crop(bitmap_b, 0, 0, ys[-1], xs[-1]))
+    for y, x in zip(*bitmatrix.nonzero(diff)):
+        row = bisect_right(ys, y) - 1
+        col = bisect_right(xs, x) - 1
+        res.setdefault((row, col), []).append((int(y) - ys[row], int(x) - xs[col]))
+    return res
+
+def changed_init_bits(bitmap_a, bitmap_b, offsets):
+    # number of the changed bits in the rows below the main grid
+    ys, _ = offsets
+    height, width = bitmatrix.shape(bitmap_a)
+    if height <= ys[-1]:
+        return 0
+    diff = bitmatrix.xor(bitmatrix.crop(bitmap_a, ys[-1], 0, height - ys[-1], width),
+                         bitmatrix.crop(bitmap_b, ys[-1], 0, height - ys[-1], width))
+    return len(bitmatrix.nonzero(diff)[0])
+
+def affected_tiles(db, changed):
+    # IOB B of some tiles keeps its fuses in a neighbouring cell, such a tile
+    # is affected by the changes of the neighbour.
+    offsets = {}
+    for ttyp, tiledata in db.tiles.items():
+        for name, bel in tiledata.bels.items():
+            if name.startswith("IOB") and name[-1] == 'B' and bel.fuse_cell_offset:
+                offsets.setdefault(tuple(bel.fuse_cell_offset), set()).add(ttyp)
+    res = set(changed)
+    for row, col in changed:
+        for (drow, dcol), ttyps in offsets.items():
+            orow, ocol = row - drow, col - dcol
+            if 0 <= orow < db.rows and 0 <= ocol < db.cols and db.grid[orow][ocol] in ttyps:
+                res.add((orow, ocol))
+    return sorted(res)
+
+def _flags(val):
+    if isinstance(val, dict):
+        return {f'{k}={v}' for k, v in val.items()}
+    return {str(v) for v in val}
+
+def diff_tile(db, row, col, bm_a, bm_b):
+    bels_a, pips_a, clock_pips_a = gowin_unpack.parse_tile_(db, row, col, bm_a[row, col], bm_a)
+    bels_b, pips_b, clock_pips_b = gowin_unpack.parse_tile_(db, row, col, bm_b[row, col], bm_b)
+    lines = []
+    for name in sorted(bels_a.keys() | bels_b.keys()):
+        if name not in bels_b:
+            lines.append(f'- {name} {sorted(_flags(bels_a[name]))}')
+        elif name not in bels_a:
+            lines.append(f'+ {name} {sorted(_flags(bels_b[name]))}')
+        else:
+            flags_a = _flags(bels_a[name])
+            flags_b = _flags(bels_b[name])
+            if flags_a != flags_b:
+                lines.append(f'  {name} -{sorted(flags_a - flags_b)} +{sorted(flags_b - flags_a)}')
+    for kind, pa, pb in (('pip', pips_a, pips_b), ('clock pip', clock_pips_a, clock_pips_b)):
+        for dest in sorted(pa.keys() | pb.keys()):
+            src_a = pa.get(dest)
+            src_b = pb.get(dest)
+            if src_a == src_b:
+                continue
+            if src_b is None:
+                lines.append(f'- {kind} {src_a} -> {dest}')
+            elif src_a is None:
+                lines.append(f'+ {kind} {src_b} -> {dest}')
+            else:
+                lines.append(f'  {kind} {dest}: {src_a} => {src_b}')
+    return lines
+
+def main():
+    parser = argparse.ArgumentParser(description='Show the decoded differences of two Gowin bitstreams')
+    parser.add_argument('bitstream_a')
+    parser.add_argument('bitstream_b')
+    parser.add_argument('-d', '--device', required=True)
+    parser.add_argument('-o', '--output', default=None)
+    parser.add_argument('--bits', action = 'store_true', help = 'list the changed bits of every tile')
+    args = parser.parse_args()
+
+    with importlib.resources.path('apycula', f'{args.device}.msgpack.xz') as path:
+        db = load_chipdb(path)
+    gowin_unpack._device = args.device
+
+    bitmap_a, hdr_a, _, slots_a = read_bitstream(args.bitstream_a)
+    bitmap_b, hdr_b, _, slots_b = read_bitstream(args.bitstream_b)
+    if bitmatrix.shape(bitmap_a) != bitmatrix.shape(bitmap_b):
+        raise Exception(f"Bitmap sizes differ: {bitmatrix.shape(bitmap_a)} vs {bitmatrix.shape(bitmap_b)}")
+
+    offsets = tile_offsets(db)
+    changed = changed_bits(bitmap_a, bitmap_b, offsets)
+    bm_a = TileBitmap(db, bitmap_a, offsets)
+    bm_b = TileBitmap(db, bitmap_b, offsets)
+
+    out = open(args.output, 'w') if args.output else sys.stdout
+    try:
+        if hdr_a != hdr_b:
+            print('Headers differ', file = out)
+        for slot_idx in sorted(slots_a.keys() | slots_b.keys()):
+            if slot_idx not in slots_a or slot_idx not in slots_b:
+                print(f'Slot {slot_idx} is present in one bitstream only', file = out)
+            elif bitmatrix.any(bitmatrix.xor(slots_a[slot_idx], slots_b[slot_idx])):
+                print(f'Slot {slot_idx} differs', file = out)
+        init_bits = changed_init_bits(bitmap_a, bitmap_b, offsets)
+        if init_bits:
+            print(f'BSRAM init data differs: {init_bits} bits changed', file = out)
+
+        for row, col in affected_tiles(db, changed):
+            bits = changed.get((row, col), [])
+            lines = diff_tile(db, row, col, bm_a, bm_b)
+            if not lines and not bits:
+                continue
+            print(f'R{row + 1}C{col + 1} ttyp {db.grid[row][col]}: {len(bits)} bits changed', file = out)
+            if args.bits:
+                print(f'  bits {sorted(bits)}', file = out)
+            for line in lines:
+                print(f'  {line}', file = out)
+        print(f'{sum(len(bits) for bits in changed.values())} bits changed in {len(changed)} tiles', file = out)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
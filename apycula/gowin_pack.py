@@ -9,16 +9,20 @@ import argparse
 import importlib.resources
 from collections import namedtuple
 from apycula import codegen
-from apycula import chipdb
-from apycula.chipdb import add_attr_val, get_shortval_fuses, get_longval_fuses, get_bank_fuses, get_bank_io_fuses, get_long_fuses, load_chipdb
+from apycula import chipdb_rt
+from apycula.chipdb_rt import add_attr_val, get_shortval_fuses, get_longval_fuses, get_bank_fuses, get_bank_io_fuses, get_long_fuses, load_chipdb
 from apycula import attrids
 from apycula import bslib
 from apycula import bitmatrix
 from apycula import wirenames as wnames
+from apycula.profiling import Profiler
 
 device = ""
 pnr = None
 bsram_init_map = None
+# BSRAM init data of the chips before GW5A: {(y, x): cell map}, the rest of
+# the init map is zero
+bsram_init_blocks = {}
 gw5a_bsrams = []
 adc_iolocs = {} # pos: {}
 
@@ -154,28 +158,57 @@ def extra_dsp_bels(cell, row, col, num, cellname):
 # is present - bits 4 and 5 radically change the position of the bits in the
 # chip, we take this into account.
 # We repeat for bits up to the 13th --- since this is the maximum address in one SRAM block.
-def store_bsram_init_val(db, row, col, typ, parms, attrs, map_offset = 0):
-    global bsram_init_map
-
-    if typ == 'BSRAM_AUX' or 'INIT_RAM_00' not in parms:
-        return
-
-    attrs_upper(attrs)
-    subtype = attrs['BSRAM_SUBTYPE']
-    if bsram_init_map is None:
-        if device in {'GW5A-25A', 'GW5AST-138C'}:
-            # 72 * bsram rows * chip bit width
-            bsram_init_map = bitmatrix.zeros(72 * len(db.simplio_rows), db.width)
-        else:
-            # 256 * bsram rows * chip bit width
-            bsram_init_map = bitmatrix.zeros(256 * len(db.simplio_rows), db.width)
+# {id(db): {(GW5A, width): (rows, cols)}} - where each bit of the init rows goes
+# in the final (flipped, for GW5A also transposed) cell map. Bit number
+# init_row * width + p is the p-th character from the end of INIT_RAM_{init_row}.
+_bsram_init_perms = {}
+# anything but '0' is a one
+_bsram_set_bit_re = re.compile('[^0]')
+
+def bsram_init_perm(db, width):
+    gw5 = device in {'GW5A-25A', 'GW5AST-138C'}
+    perms = chipdb_rt.db_cache(_bsram_init_perms, db)
+    if (gw5, width) in perms:
+        return perms[gw5, width]
+    logicinfo = db.rev_logicinfo('BSRAM_INIT')
+    quads = {0x30: 0xc0, 0x20: 0x40, 0x10: 0x80, 0x00: 0x00}
+    rows = []
+    cols = []
+    addr = -1
+    for init_row in range(0x40):
+        bit_no = 0
+        ptr = 0
+        while ptr < width:
+            if bit_no == 8 or bit_no == 17:
+                # parity bits share the address of the preceding data bit
+                # and are present only in X9 mode
+                if width != 288:
+                    bit_no = (bit_no + 1) % 18
+                    continue
+            else:
+                addr += 1
+            logic_line = bit_no * 4 + (addr >> 12)
+            bit = logicinfo[logic_line][0] - 1
+            map_row = quads[addr & 0x30] + ((addr >> 6) & 0x3f)
+            if gw5:
+                rows.append(71 - bit)
+                cols.append(map_row)
+            else:
+                rows.append(255 - map_row)
+                cols.append(bit)
+            ptr += 1
+            bit_no = (bit_no + 1) % 18
+    perms[gw5, width] = (rows, cols)
+    return rows, cols
+
+def bsram_init_cell_map(db, subtype, parms):
+    """Init data of one BSRAM as it is placed in the init map."""
     if device in {'GW5A-25A', 'GW5AST-138C'}:
-        # 1 BSRAM cell have width 72
-        loc_map = bitmatrix.zeros(256, 72)
+        # 1 BSRAM cell have width 72, the map is already transposed
+        loc_map = bitmatrix.zeros(72, 256)
     else:
         # 3 BSRAM cells have width 3 * 60
         loc_map = bitmatrix.zeros(256, 3 * 60)
-    #print("mapping")
     if not subtype.strip():
         width = 256
     elif subtype in {'X9'}:
@@ -183,47 +216,25 @@ def store_bsram_init_val(db, row, col, typ, parms, attrs, map_offset = 0):
     else:
         raise Exception(f"Init for {subtype} is not supported")
 
-    def get_bits(init_data):
-        bit_no = 0
-        ptr = -1
-        while ptr >= -width:
-            if bit_no == 8 or bit_no == 17:
-                if width == 288:
-                    yield (init_data[ptr], bit_no, lambda x: x)
-                    ptr -= 1
-                else:
-                    yield ('0', bit_no, lambda x: x)
-                bit_no = (bit_no + 1) % 18
-            else:
-                yield (init_data[ptr], bit_no, lambda x: x + 1)
-                ptr -= 1
-                bit_no = (bit_no + 1) % 18
-
-    addr = -1
+    # collect the numbers of all set bits and scatter them at once
+    perm_rows, perm_cols = bsram_init_perm(db, width)
+    set_bits = []
     for init_row in range(0x40):
         row_name = f'INIT_RAM_{init_row:02X}'
         # skip missing init rows
         if row_name not in parms:
-            addr += 0x100
             continue
-        init_data = parms[row_name]
-        #print(init_data)
-        for ptr_bit_inc in get_bits(init_data):
-            addr = ptr_bit_inc[2](addr)
-            if ptr_bit_inc[0] == '0':
-                continue
-            logic_line = ptr_bit_inc[1] * 4 + (addr >> 12)
-            bit = db.rev_logicinfo('BSRAM_INIT')[logic_line][0] - 1
-            quad = {0x30: 0xc0, 0x20: 0x40, 0x10: 0x80, 0x00: 0x00}[addr & 0x30]
-            map_row = quad + ((addr >> 6) & 0x3f)
-            #print(f'map_row:{map_row}, addr: {addr}, bit {ptr_bit_inc[1]}, bit:{bit}')
-            loc_map[map_row][bit] = 1
-
-    # now put one cell init data into global space
+        base = init_row * width
+        init_data = parms[row_name][-width:][::-1]
+        set_bits.extend(base + m.start() for m in _bsram_set_bit_re.finditer(init_data))
+    bitmatrix.scatter(loc_map, [perm_rows[i] for i in set_bits], [perm_cols[i] for i in set_bits])
+    return loc_map
+
+def bsram_init_cell_pos(db, row, col, map_offset = 0):
+    """Position (y, x) of the BSRAM cell data in the init map."""
     height = 256
     if device in {'GW5A-25A', 'GW5AST-138C'}:
         height = 72
-        loc_map = bitmatrix.transpose(loc_map)
     y = 0
     for brow in sorted(db.simplio_rows):
         if row == brow:
@@ -236,13 +247,29 @@ def store_bsram_init_val(db, row, col, typ, parms, attrs, map_offset = 0):
         x = 0
         for jdx in range(col):
             x += db[0, jdx].width
-    loc_map = bitmatrix.flipud(loc_map)
-    for row in loc_map:
-        x0 = x
-        for val in row:
-            bsram_init_map[y][x0] = val
-            x0 += 1
-        y += 1
+    return y, x
+
+def store_bsram_init_val(db, row, col, typ, parms, attrs, map_offset = 0):
+    global bsram_init_map
+
+    if typ == 'BSRAM_AUX' or 'INIT_RAM_00' not in parms:
+        return
+
+    attrs_upper(attrs)
+    subtype = attrs['BSRAM_SUBTYPE']
+    loc_map = bsram_init_cell_map(db, subtype, parms)
+
+    # now put one cell init data into global space
+    y, x = bsram_init_cell_pos(db, row, col, map_offset)
+    if device in {'GW5A-25A', 'GW5AST-138C'}:
+        if bsram_init_map is None:
+            # 72 * bsram rows * chip bit width
+            bsram_init_map = bitmatrix.zeros(72 * len(db.simplio_rows), db.width)
+        bitmatrix.blit(bsram_init_map, y, x, loc_map)
+    else:
+        # the map of 256 * bsram rows * chip bit width is mostly empty, keep
+        # only the cells and let the writer fill the gaps
+        bsram_init_blocks[(y, x)] = loc_map
 
 def is_ram_pin(db, r, c, idx):
     """ Internal SDRAM/HyperRAM pins do not have an IO standard, so we will ignore them """
@@ -3661,7 +3688,7 @@ def place(db, tilemap, bels, cst, args, slice_attrvals, extra_slots):
 
             pinless_io = False
             try:
-                bank = chipdb.loc2bank(db, row - 1, col - 1)
+                bank = chipdb_rt.loc2bank(db, row - 1, col - 1)
                 iostd = _banks.setdefault(bank, BankDesc(None, set())).iostd
             except KeyError:
                 if not args.allow_pinless_io:
@@ -3684,9 +3711,9 @@ def place(db, tilemap, bels, cst, args, slice_attrvals, extra_slots):
                 flag_name_val = flag.split("=")
                 if len(flag_name_val) < 2:
                     continue
-                if flag[0] != chipdb.mode_attr_sep:
+                if flag[0] != chipdb_rt.mode_attr_sep:
                     continue
-                if flag_name_val[0] == chipdb.mode_attr_sep + "IO_TYPE":
+                if flag_name_val[0] == chipdb_rt.mode_attr_sep + "IO_TYPE":
                     iostd = _iostd_alias.get(flag_name_val[1], flag_name_val[1])
                 else:
                     io_desc.attrs[flag_name_val[0][1:]] = flag_name_val[1]
@@ -3728,7 +3755,7 @@ def place(db, tilemap, bels, cst, args, slice_attrvals, extra_slots):
             ram_attrs.update({'CLKMUX_CLK': 'SIG'})
         elif typ ==  'IOLOGIC':
             #print('IOLOGIC', num, row, col, cellname)
-            #bank = chipdb.loc2bank(db, row - 1, col - 1)
+            #bank = chipdb_rt.loc2bank(db, row - 1, col - 1)
             #_banks.setdefault.add(bank, BankDesc(None, set())).bels.add(rc2tbrl(db, row - 1, col - 1, num))
 
             iologic_attrs = set_iologic_attrs(db, parms, attrs)
@@ -4226,7 +4253,7 @@ def do_gw5_ihclk(db, tilemap):
             ttyp = db.grid[row][col]
             if ttyp in db.shortval and 'HCLK' in db.shortval[ttyp]:
                 for wire in _used_ihclk_wires:
-                    hclk_idx = chipdb.gw5_hclk_idx(db, device, row, col)
+                    hclk_idx = chipdb_rt.gw5_hclk_idx(db, device, row, col)
                     if hclk_idx != int(wire[-2]):
                         continue
                     print(f'Enable gate {wire} ({row}, {col})')
@@ -4306,7 +4333,7 @@ def route(db, tilemap, pips):
                     bits = set()
                     if dest in rc.clock_pips:
                         if src in rc.clock_pips[dest]:
-                            bits = rc.clock_pips[dest][src]
+                            bits = set(rc.clock_pips[dest][src])
                     if spine_enable_table in db.shortval[ttyp] and (1, 0) in db.shortval[ttyp][spine_enable_table]:
                         bits.update(db.shortval[ttyp][spine_enable_table][(1, 0)]) # XXX move to attrs?
                         print(f"Enable spine {dest} <- {src} ({row_}, {col_}) by {spine_enable_table} at ({row}, {col})")
@@ -4321,7 +4348,7 @@ def route(db, tilemap, pips):
             for col in range(db.cols):
                 if (row, col) in db.hclk_pips and dest in db.hclk_pips[row, col] and src in db.hclk_pips[row, col][dest]:
                     fuse_set = True
-                    bits = db.hclk_pips[row, col][dest][src]
+                    bits = set(db.hclk_pips[row, col][dest][src])
                     #print(f'set hclk pip fuse {bits} at ({row}, {col}) {src}->{dest}')
                     bits.update(do_hclk_banks(db, row, col, src, dest))
                     tile = tilemap[(row, col)]
@@ -4346,8 +4373,7 @@ def route(db, tilemap, pips):
             elif device in {'GW5A-25A', 'GW5AST-138C'} and set_5a_hclk_wire_fuses(src, dest):
                 continue
             elif (row - 1, col - 1) in db.hclk_pips and dest in db.hclk_pips[row - 1, col - 1] and src in db.hclk_pips[row - 1, col - 1][dest]:
-                bits = db.hclk_pips[row - 1, col - 1][dest][src]
-                bits.update(do_hclk_banks(db, row - 1, col - 1, src, dest))
+                bits = db.hclk_pips[row - 1, col - 1][dest][src] | do_hclk_banks(db, row - 1, col - 1, src, dest)
             else:
                 bits = tiledata.pips[dest][src]
                 # check if we have 'not conencted to' situation
@@ -4355,7 +4381,7 @@ def route(db, tilemap, pips):
                     for srcs_fuses in tiledata.alonenode[dest]:
                         srcs, fuses = srcs_fuses
                         if src not in srcs:
-                            bits |= fuses
+                            bits = bits | fuses
         except KeyError:
             print(src, dest, "not found in tile", row, col)
             breakpoint()
@@ -4430,7 +4456,8 @@ def gsr(db, tilemap, args):
                 for brow, bcol in bits:
                     btile[brow][bcol] = 1
 
-def dualmode_pins(db, tilemap, args):
+def dualmode_fuses(db, args):
+    # {(row, col): (bits to clear, bits to set)}
     pin_flags = {'JTAG_AS_GPIO': 'UNKNOWN', 'SSPI_AS_GPIO': 'UNKNOWN', 'MSPI_AS_GPIO': 'UNKNOWN',
             'DONE_AS_GPIO': 'UNKNOWN', 'RECONFIG_AS_GPIO': 'UNKNOWN', 'READY_AS_GPIO': 'UNKNOWN',
                  'CPU_AS_GPIO_25': 'UNKNOWN', 'CPU_AS_GPIO_0': 'UNKNOWN', 'CPU_AS_GPIO_1': 'UNKNOWN',
@@ -4475,6 +4502,7 @@ def dualmode_pins(db, tilemap, args):
     elif device in {'GW5AST-138C'}:
         cfg_type = {220}
 
+    fuses = {}
     for row in range(db.rows):
         for col in range(db.cols):
             ttyp = db.grid[row][col]
@@ -4484,18 +4512,63 @@ def dualmode_pins(db, tilemap, args):
                 bits.update(get_shortval_fuses(db, ttyp, set_attrs, 'CFG'))
                 clr_bits.update(get_shortval_fuses(db, ttyp, clr_attrs, 'CFG'))
             if clr_bits:
-                btile = tilemap[(row, col)]
-                for brow, bcol in clr_bits:
-                    btile[brow][bcol] = 0
-                for brow, bcol in bits:
-                    btile[brow][bcol] = 1
-
-def set_const_fuses(db, row, col, tile):
-    tiledata = db[row, col]
-    if tiledata.ttyp in db.const:
-        for bits in db.const[tiledata.ttyp]:
-            brow, bcol = bits
-            tile[brow][bcol] = 1
+                fuses[(row, col)] = (clr_bits, bits)
+    return fuses
+
+def dualmode_pins(db, tilemap, args, fuses = None):
+    if fuses is None:
+        fuses = dualmode_fuses(db, args)
+    for pos, (clr_bits, bits) in fuses.items():
+        btile = tilemap[pos]
+        for brow, bcol in clr_bits:
+            btile[brow][bcol] = 0
+        for brow, bcol in bits:
+            btile[brow][bcol] = 1
+
+# {id(db): {'bits': (rows, cols)}} chip coordinates of all const fuses
+_const_fuse_bits = {}
+
+def const_fuse_bits(db):
+    cache = chipdb_rt.db_cache(_const_fuse_bits, db)
+    if 'bits' in cache:
+        return cache['bits']
+    ys, xs = chipdb_rt.tile_offsets(db)
+    rows = []
+    cols = []
+    for row in range(db.rows):
+        for col in range(db.cols):
+            for brow, bcol in db.const.get(db.grid[row][col], ()):
+                rows.append(ys[row] + brow)
+                cols.append(xs[col] + bcol)
+    cache['bits'] = (rows, cols)
+    return rows, cols
+
+_dualmode_options = ('jtag_as_gpio', 'sspi_as_gpio', 'mspi_as_gpio', 'ready_as_gpio', 'done_as_gpio',
+                     'reconfign_as_gpio', 'cpu_as_gpio', 'i2c_as_gpio')
+# {id(db): {'template': image without the dual-mode pins,
+#           dual-mode pin options: (image, dual-mode pin fuses)}}
+_baselines = {}
+
+def baseline_image(db, args):
+    """Fuses every design has: GSR/CFG defaults, the dual-mode pin settings
+    and the const fuses. Returns a fresh copy of the image and the dual-mode
+    pin fuses."""
+    cache = chipdb_rt.db_cache(_baselines, db)
+    key = tuple(bool(getattr(args, opt)) for opt in _dualmode_options)
+    if key not in cache:
+        if 'template' not in cache:
+            # the part that does not depend on the options
+            tilemap = chipdb_rt.tile_bitmap(db, bitmatrix.zeros(db.height, db.width), empty=True)
+            gsr(db, tilemap, args)
+            template = chipdb_rt.fuse_bitmap(db, tilemap)
+            bitmatrix.scatter(template, *const_fuse_bits(db))
+            cache['template'] = template
+        tilemap = chipdb_rt.tile_bitmap(db, bitmatrix.copy(cache['template']), empty=True)
+        fuses = dualmode_fuses(db, args)
+        dualmode_pins(db, tilemap, args, fuses)
+        cache[key] = (chipdb_rt.fuse_bitmap(db, tilemap), fuses)
+    image, fuses = cache[key]
+    return bitmatrix.copy(image), fuses
 
 def set_adc_iobuf_fuses(db, tilemap):
     for ioloc in adc_iolocs.keys():
@@ -4592,6 +4665,45 @@ def set_slice_fuses(db, tilemap, slice_attrvals):
             for brow, bcol in bits:
                 tile[brow][bcol] = 1
 
+def write_bitstream(db, main_map, args, extra_slots):
+    global bsram_init_map
+    if device in {'GW5A-25A', 'GW5AST-138C'} and gw5a_bsrams:
+        # In the series preceding GW5A, the data for initialising BSRAM was
+        # specified as one huge array describing all BSRAM primitives at once.
+        # As a result, this array was unloaded immediately after the main grid
+        # without any identifying marks.
+        # In the GW5A series, the approach is different: only data for those
+        # primitives that are actually used is unloaded.
+        # This requires the use of commands describing BSRAM positions in the
+        # output file. When testing file generation using Gowin IDE and setting
+        # BSRAM positions as specified in the documentation for the GW5A series
+        # (SUG1018-1.7E_Arora Ⅴ Design Physical Constraints User Guide. pdf),
+        # it was found that the number of blocks in the output file describing
+        # BSRAM is not proportional to the number of primitives used — that is,
+        # one command block describes several primitives located next to each
+        # other, and another block begins only if there is a gap in the BSRAM
+        # location.
+        # Thus, for the GW5A series, we first need to collect data on the
+        # location of BSRAM primitives, and only then proceed directly to
+        # encoding the initialisation data.
+        #import ipdb; ipdb.set_trace()
+        last_col = -1
+        map_offset = -1
+        for bsram in gw5a_bsrams:
+            col, row, typ, parms, attrs = bsram
+            if col != last_col:
+                last_col = col
+                map_offset += 1
+            store_bsram_init_val(db, row, col, typ, parms, attrs, map_offset)
+
+        bsram_init_map = bitmatrix.transpose(bsram_init_map)
+        bslib.write_bitstream(args.output, main_map, db.cmd_hdr, db.cmd_ftr, args.compress, extra_slots, bsram_init_map, gw5a_bsrams, is_gw5a_138=(device == 'GW5AST-138C'))
+    elif bsram_init_blocks:
+        bslib.write_bitstream(args.output, main_map, db.cmd_hdr, db.cmd_ftr, args.compress, extra_slots,
+                              bsram_init = (256 * len(db.simplio_rows), bsram_init_blocks))
+    else:
+        bslib.write_bitstream(args.output, main_map, db.cmd_hdr, db.cmd_ftr, args.compress, extra_slots)
+
 def main():
     global device
     global pnr
@@ -4618,11 +4730,14 @@ def main():
     parser.add_argument('--reconfign_as_gpio', action = 'store_true')
     parser.add_argument('--cpu_as_gpio', action = 'store_true')
     parser.add_argument('--i2c_as_gpio', action = 'store_true')
+    parser.add_argument('--profile', action = 'store_true', help = 'print time and peak memory per stage')
+    parser.add_argument('--profile-json', default = None, metavar = 'FILE', help = 'write the profile report as JSON')
     if pil_available:
         parser.add_argument('--png')
 
     args = parser.parse_args()
     device = args.device
+    prof = Profiler(args.profile or args.profile_json is not None)
 
     # if not forced try to load from json
     if device is None:
@@ -4643,7 +4758,7 @@ def main():
         num = m.group(4)
         device = f"{series}{mods}-{num}"
 
-    with importlib.resources.path('apycula', f'{device}.msgpack.xz') as path:
+    with prof.stage('load_chipdb'), importlib.resources.path('apycula', f'{device}.msgpack.xz') as path:
         db = load_chipdb(path)
 
     wnames.select_wires(device)
@@ -4666,16 +4781,19 @@ def main():
     _gnd_net = pnr['modules']['top']['netnames'].get(const_nets['GND'], {'bits': []})['bits']
     _vcc_net = pnr['modules']['top']['netnames'].get(const_nets['VCC'], {'bits': []})['bits']
 
-    tilemap = chipdb.tile_bitmap(db, bitmatrix.zeros(db.height, db.width), empty=True)
+    # start from the fuses that do not depend on the design
+    with prof.stage('baseline'):
+        base_map, dualmode = baseline_image(db, args)
+    tilemap = chipdb_rt.tile_bitmap(db, base_map, empty=True)
     extra_slots = {}
 
     cst = codegen.Constraints()
-    pips = get_pips(pnr)
-    route(db, tilemap, pips)
-    do_gw5_ihclk(db, tilemap)
-    isolate_segments(pnr, db, tilemap)
+    with prof.stage('route'):
+        pips = get_pips(pnr)
+        route(db, tilemap, pips)
+        do_gw5_ihclk(db, tilemap)
+        isolate_segments(pnr, db, tilemap)
     bels = get_bels(db, pnr)
-    gsr(db, tilemap, args)
     # LUT/RAM/ALU/DFF use shortval[][CLS0/1/2/3]
     # Their fuses corresponding to attributes can be set independently, but the
     # problem arises with default attributes, i.e., those whose fuses are set
@@ -4688,9 +4806,14 @@ def main():
     # {(row, col, idx): {attr:val, attr:val}}
     slice_attrvals = {}
     # routing can add pass-through LUTs
-    place(db, tilemap, itertools.chain(bels, _pip_bels) , cst, args, slice_attrvals, extra_slots)
-    set_slice_fuses(db, tilemap, slice_attrvals)
-    dualmode_pins(db, tilemap, args)
+    with prof.stage('place'):
+        place(db, tilemap, prof.iterate('place', itertools.chain(bels, _pip_bels), lambda bel: bel[0]),
+              cst, args, slice_attrvals, extra_slots)
+    with prof.stage('set_slice_fuses'):
+        set_slice_fuses(db, tilemap, slice_attrvals)
+    # placement may have touched the configuration fuses, set them again
+    with prof.stage('dualmode_pins'):
+        dualmode_pins(db, tilemap, args, dualmode)
     # XXX Z-1 some kind of power saving for pll, disable
     # When comparing images with a working (IDE) and non-working PLL (apicula),
     # no differences were found in the fuses of the PLL cell itself, but a
@@ -4705,10 +4828,11 @@ def main():
 
     set_adc_iobuf_fuses(db, tilemap)
 
-    for row in range(db.rows):
-        for col in range(db.cols):
-            set_const_fuses(db, row, col, tilemap[(row, col)])
-    main_map = chipdb.fuse_bitmap(db, tilemap)
+    with prof.stage('fuse_bitmap'):
+        main_map = chipdb_rt.fuse_bitmap(db, tilemap)
+    # the const fuses are in the baseline, but placement could clear some
+    with prof.stage('set_const_fuses'):
+        bitmatrix.scatter(main_map, *const_fuse_bits(db))
 
     if pil_available and args.png:
         bslib.display(args.png, main_map)
@@ -4716,48 +4840,21 @@ def main():
     if device in {'GW5A-25A', 'GW5AST-138C'}:
         main_map = bitmatrix.transpose(main_map)
 
-    header_footer(db, main_map, args.compress)
-
-    if device in {'GW5A-25A', 'GW5AST-138C'} and gw5a_bsrams:
-        # In the series preceding GW5A, the data for initialising BSRAM was
-        # specified as one huge array describing all BSRAM primitives at once.
-        # As a result, this array was unloaded immediately after the main grid
-        # without any identifying marks.
-        # In the GW5A series, the approach is different: only data for those
-        # primitives that are actually used is unloaded.
-        # This requires the use of commands describing BSRAM positions in the
-        # output file. When testing file generation using Gowin IDE and setting
-        # BSRAM positions as specified in the documentation for the GW5A series
-        # (SUG1018-1.7E_Arora Ⅴ Design Physical Constraints User Guide. pdf),
-        # it was found that the number of blocks in the output file describing
-        # BSRAM is not proportional to the number of primitives used — that is,
-        # one command block describes several primitives located next to each
-        # other, and another block begins only if there is a gap in the BSRAM
-        # location.
-        # Thus, for the GW5A series, we first need to collect data on the
-        # location of BSRAM primitives, and only then proceed directly to
-        # encoding the initialisation data.
-        #import ipdb; ipdb.set_trace()
-        last_col = -1
-        map_offset = -1
-        for bsram in gw5a_bsrams:
-            col, row, typ, parms, attrs = bsram
-            if col != last_col:
-                last_col = col
-                map_offset += 1
-            store_bsram_init_val(db, row, col, typ, parms, attrs, map_offset)
+    with prof.stage('header_footer'):
+        header_footer(db, main_map, args.compress)
 
-        bsram_init_map = bitmatrix.transpose(bsram_init_map)
-        bslib.write_bitstream(args.output, main_map, db.cmd_hdr, db.cmd_ftr, args.compress, extra_slots, bsram_init_map, gw5a_bsrams, is_gw5a_138=(device == 'GW5AST-138C'))
-    elif bsram_init_map is not None:
-        bslib.write_bitstream_with_bsram_init(args.output, main_map, db.cmd_hdr, db.cmd_ftr, args.compress, extra_slots, bsram_init_map)
-    else:
-        bslib.write_bitstream(args.output, main_map, db.cmd_hdr, db.cmd_ftr, args.compress, extra_slots)
+    with prof.stage('write_bitstream'):
+        write_bitstream(db, main_map, args, extra_slots)
 
     if args.cst:
         with open(args.cst, "w") as f:
                 cst.write(f)
 
+    prof.stop()
+    prof.report()
+    if args.profile_json:
+        prof.write_json(args.profile_json)
+
 if __name__ == '__main__':
     main()
 
@@ -6,9 +6,553 @@
 # - https://cdn.gowinsemi.com.cn/DS226E.pdf
 
 import argparse
+import math
 import re
 import sys
 
+device_limits = {
+    "GW1N-1 C6/I5": {
+        "comment": "Untested",
+        "pll_name": "rPLL",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 900,
+        "clkout_min": 3.125,
+        "clkout_max": 450,
+    },
+    "GW1N-1 C5/I4": {
+        "comment": "Untested",
+        "pll_name": "rPLL",
+        "pfd_min": 3,
+        "pfd_max": 320,
+        "vco_min": 320,
+        "vco_max": 720,
+        "clkout_min": 2.5,
+        "clkout_max": 360,
+    },
+    "GW1NR-2 C7/I6": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 800,
+        "clkout_min": 3.125,
+        "clkout_max": 750,
+    },
+    "GW1NR-2 C6/I5": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 800,
+        "clkout_min": 3.125,
+        "clkout_max": 750,
+    },
+    "GW1NR-2 C5/I4": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 320,
+        "vco_min": 320,
+        "vco_max": 640,
+        "clkout_min": 2.5,
+        "clkout_max": 640,
+    },
+    "GW1NR-4 C6/I5": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 1000,
+        "clkout_min": 3.125,
+        "clkout_max": 500,
+    },
+    "GW1NR-4 C5/I4": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 320,
+        "vco_min": 320,
+        "vco_max": 800,
+        "clkout_min": 2.5,
+        "clkout_max": 400,
+    },
+    "GW1NSR-4 C7/I6": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 1200,
+        "clkout_min": 3.125,
+        "clkout_max": 600,
+    },
+    "GW1NSR-4 C6/I5": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 1200,
+        "clkout_min": 3.125,
+        "clkout_max": 600,
+    },
+    "GW1NSR-4 C5/I4": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 320,
+        "vco_min": 320,
+        "vco_max": 960,
+        "clkout_min": 2.5,
+        "clkout_max": 480,
+    },
+    "GW1NSR-4C C7/I6": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 1200,
+        "clkout_min": 3.125,
+        "clkout_max": 600,
+    },
+    "GW1NSR-4C C6/I5": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 1200,
+        "clkout_min": 3.125,
+        "clkout_max": 600,
+    },
+    "GW1NSR-4C C5/I4": {
+        "comment": "Untested",
+        "pll_name": "PLLVR",
+        "pfd_min": 3,
+        "pfd_max": 320,
+        "vco_min": 320,
+        "vco_max": 960,
+        "clkout_min": 2.5,
+        "clkout_max": 480,
+    },
+    "GW1NR-9 C7/I6": {
+        "comment": "Untested",
+        "pll_name": "rPLL",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 1200,
+        "clkout_min": 3.125,
+        "clkout_max": 600,
+    },
+    "GW1NR-9 C6/I5": {
+        "comment": "tested on TangNano9K Board",
+        "pll_name": "rPLL",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 1200,
+        "clkout_min": 3.125,
+        "clkout_max": 600,
+    },
+    "GW1NR-9 C6/I4": {
+        "comment": "Untested",
+        "pll_name": "rPLL",
+        "pfd_min": 3,
+        "pfd_max": 320,
+        "vco_min": 3200,
+        "vco_max": 960,
+        "clkout_min": 2.5,
+        "clkout_max": 480,
+    },
+    "GW1NZ-1 C6/I5": {
+        "comment": "untested",
+        "pll_name": "rPLL",
+        "pfd_min": 3,
+        "pfd_max": 400,
+        "vco_min": 400,
+        "vco_max": 800,
+        "clkout_min": 3.125,
+        "clkout_max": 400,
+    },
+    "GW2A-18 C8/I7": {
+        "comment": "untested",
+        "pll_name": "rPLL",
+        "pfd_min": 3,
+        "pfd_max": 500,
+        "vco_min": 500,
+        "vco_max": 1250,
+        "clkout_min": 3.90625,
+        "clkout_max": 625,
+    },
+    "GW2AR-18 C8/I7": {
+        "comment": "untested",
+        "pll_name": "rPLL",
+        "pfd_min": 3,
+        "pfd_max": 500,
+        "vco_min": 500,
+        "vco_max": 1250,
+        "clkout_min": 3.90625,
+        "clkout_max": 625,
+    },
+    "GW5A-25 ES": {
+        "comment": "untested",
+        "pll_name": "PLLA",
+        "pfd_min": 19,
+        "pfd_max": 800,
+        "vco_min": 800,
+        "vco_max": 1600,
+        # The previous four parameters are taken from the datasheet (as in
+        # this case from https://cdn.gowinsemi.com.cn/DS1103E.pdf), but I
+        # don't know where these two come from:(
+        "clkout_min": 6.25,
+        "clkout_max": 1600,
+    },
+}
+
+
+ODIV_SEL_VALUES = (2, 4, 8, 16, 32, 48, 64, 80, 96, 112, 128)
+
+# PLLA (GW5A): VCO = FCLKIN / IDIV_SEL * FBDIV_SEL * MDIV_SEL with the internal
+# feedback, CLKOUTn = VCO / ODIVn_SEL. The phase of an output is set in
+# 1/8 steps of the VCO period: (8 * PE_COARSE + PE_FINE) / (8 * ODIVn_SEL) turns.
+PLLA_IDIV_SEL = (1, 64)
+PLLA_FBDIV_SEL = (1, 64)
+PLLA_MDIV_SEL = (2, 128)
+PLLA_ODIV_SEL = (1, 128)
+PLLA_OUTPUTS = 7
+
+# Every valid (IDIV_SEL, FBDIV_SEL, ODIV_SEL) of a device and an input
+# frequency is found once, the targets are then matched against the list.
+# The frequencies are computed in the same order of operations as the
+# original loops so that the range checks give the same answers.
+try:
+    import numpy as np
+
+    def _candidates(limits, fin):
+        idiv = np.arange(64, dtype=np.float64)[:, None, None]
+        fbdiv = np.arange(64, dtype=np.float64)[None, :, None]
+        odiv = np.array(ODIV_SEL_VALUES, dtype=np.float64)[None, None, :]
+        pfd = fin / (idiv + 1)
+        clkout = fin * (fbdiv + 1) / (idiv + 1)
+        vco = (fin * (fbdiv + 1) * odiv) / (idiv + 1)
+        ok = ((limits["pfd_min"] <= pfd) & (pfd <= limits["pfd_max"])
+              & (limits["clkout_min"] < clkout) & (clkout < limits["clkout_max"])
+              & (limits["vco_min"] < vco) & (vco < limits["vco_max"]))
+        i, f, o = np.nonzero(ok)
+        odiv = np.array(ODIV_SEL_VALUES)[o]
+        return {
+            "IDIV_SEL": i,
+            "FBDIV_SEL": f,
+            "ODIV_SEL": odiv,
+            "PFD": fin / (i + 1),
+            "CLKOUT": fin * (f + 1) / (i + 1),
+            "VCO": (fin * (f + 1) * odiv) / (i + 1),
+        }
+
+    def _match(cands, targets, tolerance, limits):
+        vco = cands["VCO"]
+        margin = np.minimum(vco - limits["vco_min"], limits["vco_max"] - vco)
+        targets = np.asarray(targets, dtype=np.float64)
+        if not len(vco):
+            return [[] for _ in targets], margin
+        # candidates with the same error go farthest from the VCO range edges
+        # first, then by the highest PFD
+        rank = np.empty(len(vco), dtype=np.int64)
+        rank[np.lexsort((-cands["PFD"], -margin))] = np.arange(len(vco))
+        res = []
+        # keep the error matrix at a few million elements
+        step = max(1, (1 << 22) // len(vco))
+        for start in range(0, len(targets), step):
+            err = np.abs(targets[start:start + step, None] - cands["CLKOUT"][None, :])
+            rows, idx = np.nonzero(err <= (err.min(axis = 1) + tolerance)[:, None])
+            errs = err[rows, idx]
+            order = np.lexsort((rank[idx], np.round(errs, 9), rows))
+            rows, idx, errs = rows[order], idx[order], errs[order]
+            bounds = np.searchsorted(rows, np.arange(len(err) + 1))
+            idx = idx.tolist()
+            errs = errs.tolist()
+            res.extend(list(zip(idx[lo:hi], errs[lo:hi])) for lo, hi in zip(bounds[:-1], bounds[1:]))
+        return res, margin
+
+    def _plla_candidates(limits, fin):
+        idiv = np.arange(PLLA_IDIV_SEL[0], PLLA_IDIV_SEL[1] + 1)
+        fbdiv = np.arange(PLLA_FBDIV_SEL[0], PLLA_FBDIV_SEL[1] + 1)
+        mdiv = np.arange(PLLA_MDIV_SEL[0], PLLA_MDIV_SEL[1] + 1)
+        pfd = fin / idiv[:, None, None]
+        vco = pfd * fbdiv[None, :, None] * mdiv[None, None, :]
+        ok = ((limits["pfd_min"] <= pfd) & (pfd <= limits["pfd_max"])
+              & (limits["vco_min"] < vco) & (vco < limits["vco_max"]))
+        i, f, m = np.nonzero(ok)
+        pfd = pfd[i, 0, 0]
+        vco = vco[i, f, m]
+        # the outputs depend on the VCO only, keep the highest PFD of every VCO
+        key = np.round(vco, 9)
+        order = np.lexsort((-pfd, key))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = key[order][1:] != key[order][:-1]
+        sel = order[first]
+        return {
+            "IDIV_SEL": idiv[i[sel]],
+            "FBDIV_SEL": fbdiv[f[sel]],
+            "MDIV_SEL": mdiv[m[sel]],
+            "PFD": pfd[sel],
+            "VCO": vco[sel],
+        }
+
+    def _plla_match(cands, targets, tolerance, limits):
+        vco = cands["VCO"][:, None]
+        targets = np.asarray(targets, dtype=np.float64)[None, :]
+        # the error only grows away from VCO / target, so the best divider
+        # is one of its two neighbours
+        lo = np.clip(np.floor(vco / targets), PLLA_ODIV_SEL[0], PLLA_ODIV_SEL[1])
+        odiv = np.stack((lo, np.minimum(lo + 1, PLLA_ODIV_SEL[1])))
+        clkout = vco / odiv
+        err = np.abs(clkout - targets)
+        err[(clkout <= limits["clkout_min"]) | (clkout >= limits["clkout_max"])] = np.inf
+        pick = np.argmin(err, axis = 0)[None]
+        odiv = np.take_along_axis(odiv, pick, 0)[0].astype(np.int64)
+        err = np.take_along_axis(err, pick, 0)[0]
+        total = np.zeros(len(err))
+        for col in err.T:
+            total += col
+        vco = cands["VCO"]
+        margin = np.minimum(vco - limits["vco_min"], limits["vco_max"] - vco)
+        ok = np.isfinite(total)
+        if not ok.any():
+            return [], odiv, err, margin
+        keep = np.nonzero(total <= total[ok].min() + tolerance)[0]
+        order = keep[np.lexsort((-cands["PFD"][keep], -margin[keep], np.round(total[keep], 9)))]
+        return order.tolist(), odiv, err, margin
+
+except ImportError:
+    def _candidates(limits, fin):
+        cands = {"IDIV_SEL": [], "FBDIV_SEL": [], "ODIV_SEL": [], "PFD": [], "CLKOUT": [], "VCO": []}
+        for IDIV_SEL in range(64):
+            PFD = fin / (IDIV_SEL + 1)
+            if not (limits["pfd_min"] <= PFD <= limits["pfd_max"]):
+                continue
+            for FBDIV_SEL in range(64):
+                CLKOUT = fin * (FBDIV_SEL + 1) / (IDIV_SEL + 1)
+                if not (limits["clkout_min"] < CLKOUT < limits["clkout_max"]):
+                    continue
+                for ODIV_SEL in ODIV_SEL_VALUES:
+                    VCO = (fin * (FBDIV_SEL + 1) * ODIV_SEL) / (IDIV_SEL + 1)
+                    if not (limits["vco_min"] < VCO < limits["vco_max"]):
+                        continue
+                    for key, val in (("IDIV_SEL", IDIV_SEL), ("FBDIV_SEL", FBDIV_SEL), ("ODIV_SEL", ODIV_SEL),
+                                     ("PFD", PFD), ("CLKOUT", CLKOUT), ("VCO", VCO)):
+                        cands[key].append(val)
+        return cands
+
+    def _match(cands, targets, tolerance, limits):
+        margin = [min(vco - limits["vco_min"], limits["vco_max"] - vco) for vco in cands["VCO"]]
+        res = []
+        for target in targets:
+            err = [abs(target - clkout) for clkout in cands["CLKOUT"]]
+            if not err:
+                res.append([])
+                continue
+            limit = min(err) + tolerance
+            idx = [i for i, e in enumerate(err) if e <= limit]
+            idx.sort(key = lambda i: (round(err[i], 9), -margin[i], -cands["PFD"][i]))
+            res.append([(i, err[i]) for i in idx])
+        return res, margin
+
+    def _plla_candidates(limits, fin):
+        best = {}
+        for IDIV_SEL in range(PLLA_IDIV_SEL[0], PLLA_IDIV_SEL[1] + 1):
+            PFD = fin / IDIV_SEL
+            if not (limits["pfd_min"] <= PFD <= limits["pfd_max"]):
+                continue
+            for FBDIV_SEL in range(PLLA_FBDIV_SEL[0], PLLA_FBDIV_SEL[1] + 1):
+                for MDIV_SEL in range(PLLA_MDIV_SEL[0], PLLA_MDIV_SEL[1] + 1):
+                    VCO = PFD * FBDIV_SEL * MDIV_SEL
+                    if not (limits["vco_min"] < VCO < limits["vco_max"]):
+                        continue
+                    # the outputs depend on the VCO only, keep the highest PFD of every VCO
+                    key = round(VCO, 9)
+                    if key not in best or PFD > best[key][3]:
+                        best[key] = (IDIV_SEL, FBDIV_SEL, MDIV_SEL, PFD, VCO)
+        cands = {"IDIV_SEL": [], "FBDIV_SEL": [], "MDIV_SEL": [], "PFD": [], "VCO": []}
+        for key in sorted(best):
+            for name, val in zip(cands, best[key]):
+                cands[name].append(val)
+        return cands
+
+    def _plla_match(cands, targets, tolerance, limits):
+        odivs = []
+        errs = []
+        total = []
+        for vco in cands["VCO"]:
+            odiv_row = []
+            err_row = []
+            for target in targets:
+                # the error only grows away from VCO / target, so the best
+                # divider is one of its two neighbours
+                lo = min(max(math.floor(vco / target), PLLA_ODIV_SEL[0]), PLLA_ODIV_SEL[1])
+                best = None
+                for odiv in (lo, min(lo + 1, PLLA_ODIV_SEL[1])):
+                    clkout = vco / odiv
+                    err = abs(clkout - target)
+                    if not (limits["clkout_min"] < clkout < limits["clkout_max"]):
+                        err = math.inf
+                    if best is None or err < best[1]:
+                        best = (odiv, err)
+                odiv_row.append(best[0])
+                err_row.append(best[1])
+            odivs.append(odiv_row)
+            errs.append(err_row)
+            total.append(sum(err_row))
+        margin = [min(vco - limits["vco_min"], limits["vco_max"] - vco) for vco in cands["VCO"]]
+        finite = [t for t in total if t != math.inf]
+        if not finite:
+            return [], odivs, errs, margin
+        limit = min(finite) + tolerance
+        order = [i for i, t in enumerate(total) if t <= limit]
+        order.sort(key = lambda i: (round(total[i], 9), -margin[i], -cands["PFD"][i]))
+        return order, odivs, errs, margin
+
+def get_limits(device):
+    if isinstance(device, dict):
+        return device
+    if device not in device_limits:
+        raise KeyError(f"device '{device}' not found")
+    return device_limits[device]
+
+def solve_pll(device, fin, fout, tolerance = 0.0):
+    """Settings of the rPLL/PLLVR that produce CLKOUT closest to fout from
+    the fin input clock (MHz).
+
+    device is a device_limits key or a dict of the same form. Returns the
+    solutions with an error of at most tolerance MHz above the best one,
+    ranked by error, then by the distance of the VCO from its range edges
+    (VCO_MARGIN), then by PFD. If fout is a sequence of frequencies, a list
+    of such lists is returned, one per target.
+    """
+    limits = get_limits(device)
+    scalar = isinstance(fout, (int, float))
+    targets = [fout] if scalar else fout
+    cands = _candidates(limits, fin)
+    matches, margin = _match(cands, targets, tolerance, limits)
+    res = []
+    for match in matches:
+        sols = []
+        for idx, err in match:
+            sol = {key: cands[key][idx] for key in ("IDIV_SEL", "FBDIV_SEL", "ODIV_SEL")}
+            sol = {key: int(val) for key, val in sol.items()}
+            sol.update({key: float(cands[key][idx]) for key in ("PFD", "CLKOUT", "VCO")})
+            sol["VCO_MARGIN"] = float(margin[idx])
+            sol["ERROR"] = float(err)
+            sols.append(sol)
+        res.append(sols)
+    return res[0] if scalar else res
+
+def solve_plla(device, fin, fouts, phases = None, tolerance = 0.0):
+    """Settings of the GW5A PLLA that produce up to seven outputs from the fin
+    input clock (MHz). The dividers before the VCO are shared, every output
+    gets its own ODIVn_SEL.
+
+    phases is an optional list of the output phases in degrees, the nearest
+    PE_COARSE/PE_FINE step is chosen. Returns the solutions with the sum of
+    the output errors at most tolerance MHz above the best one, ranked by
+    the error, then by VCO_MARGIN, then by PFD. OUTPUTS of a solution has a
+    dict per requested frequency.
+    """
+    limits = get_limits(device)
+    if not 1 <= len(fouts) <= PLLA_OUTPUTS:
+        raise ValueError(f"PLLA has 1 to {PLLA_OUTPUTS} outputs, {len(fouts)} requested")
+    phases = list(phases or [])
+    if len(phases) > len(fouts):
+        raise ValueError(f"{len(phases)} phases for {len(fouts)} outputs")
+    phases += [0.0] * (len(fouts) - len(phases))
+    cands = _plla_candidates(limits, fin)
+    order, odivs, errs, margin = _plla_match(cands, fouts, tolerance, limits)
+    res = []
+    for idx in order:
+        sol = {key: int(cands[key][idx]) for key in ("IDIV_SEL", "FBDIV_SEL", "MDIV_SEL")}
+        sol.update({key: float(cands[key][idx]) for key in ("PFD", "VCO")})
+        sol["VCO_MARGIN"] = float(margin[idx])
+        outputs = []
+        for odiv, err, phase in zip(odivs[idx], errs[idx], phases):
+            odiv = int(odiv)
+            steps = round(phase * 8 * odiv / 360) % (8 * odiv)
+            outputs.append({
+                "ODIV_SEL": odiv,
+                "CLKOUT": sol["VCO"] / odiv,
+                "ERROR": float(err),
+                "PE_COARSE": steps // 8,
+                "PE_FINE": steps % 8,
+                "PHASE": steps * 360 / (8 * odiv),
+            })
+        sol["OUTPUTS"] = outputs
+        sol["ERROR"] = sum(out["ERROR"] for out in outputs)
+        res.append(sol)
+    return res
+
+def plla_verilog(module_name, device_name, fin, fouts, setup, limits):
+    outputs = setup["OUTPUTS"]
+    requested = "\n".join(f" * Output {n}: requested {fout:0.3f} MHz, achieved {out['CLKOUT']:0.3f} MHz, phase {out['PHASE']:0.3f} deg"
+                          for n, (fout, out) in enumerate(zip(fouts, outputs)))
+    ports = "\n".join(f"        output clock_out{n}," for n in range(len(outputs)))
+    params = []
+    conns = []
+    for n in range(PLLA_OUTPUTS):
+        if n < len(outputs):
+            out = outputs[n]
+            params.append(f'        .ODIV{n}_SEL({out["ODIV_SEL"]}), // -> CLKOUT{n} = {out["CLKOUT"]} MHz '
+                          f'(range: {limits["clkout_min"]}-{limits["clkout_max"]} MHz)')
+            params.append(f'        .CLKOUT{n}_EN("TRUE"),')
+            params.append(f'        .CLKOUT{n}_PE_COARSE({out["PE_COARSE"]}),')
+            params.append(f'        .CLKOUT{n}_PE_FINE({out["PE_FINE"]}), // -> {out["PHASE"]} deg')
+            conns.append(f"        .CLKOUT{n}(clock_out{n}), // {out['CLKOUT']} MHz")
+        else:
+            params.append(f'        .CLKOUT{n}_EN("FALSE"),')
+            conns.append(f"        .CLKOUT{n}(),")
+    params = "\n".join(params)
+    conns = "\n".join(conns)
+    return f"""/**
+ * PLL configuration
+ *
+ * This Verilog module was generated automatically
+ * using the gowin-pll tool.
+ * Use at your own risk.
+ *
+ * Target-Device:                {device_name}
+ * Given input frequency:        {fin:0.3f} MHz
+{requested}
+ */
+
+module {module_name}(
+        input  clock_in,
+{ports}
+        output locked
+    );
+
+    PLLA #(
+        .FCLKIN("{fin}"),
+        .IDIV_SEL({setup['IDIV_SEL']}), // -> PFD = {setup['PFD']} MHz (range: {limits['pfd_min']}-{limits['pfd_max']} MHz)
+        .FBDIV_SEL({setup['FBDIV_SEL']}),
+        .MDIV_SEL({setup['MDIV_SEL']}), // -> VCO = {setup['VCO']} MHz (range: {limits['vco_min']}-{limits['vco_max']} MHz)
+{params}
+        .CLKFB_SEL("INTERNAL")
+    ) pll (.CLKFB(1'b0), .RESET(1'b0), .PLLPWD(1'b0), .RESET_I(1'b0), .RESET_O(1'b0),
+        .PSSEL(3'b0), .PSDIR(1'b0), .PSPULSE(1'b0), .SSCPOL(1'b0), .SSCON(1'b0), .SSCMDSEL(7'b0), .SSCMDSEL_FRAC(3'b0),
+        .MDCLK(1'b0), .MDOPC(2'b0), .MDAINC(1'b0), .MDWDI(8'b0), .MDRDO(), .CLKFBOUT(),
+        .CLKIN(clock_in), // {fin} MHz
+{conns}
+        .LOCK(locked)
+    );
+
+endmodule
+"""
+
 
 def main():
     parser = argparse.ArgumentParser()
@@ -16,7 +560,10 @@ def main():
         "-i", "--input-freq-mhz", help="PLL Input Frequency", type=float, default=27
     )
     parser.add_argument(
-        "-o", "--output-freq-mhz", help="PLL Output Frequency", type=float, default=108
+        "-o", "--output-freq-mhz", help="PLL Output Frequency, up to 7 for PLLA", type=float, nargs="+", default=[108]
+    )
+    parser.add_argument(
+        "-p", "--phase", help="PLLA output phases in degrees", type=float, nargs="+", default=None
     )
     parser.add_argument(
         "-d", "--device", help="Device", type=str, default="GW1NR-9 C6/I5"
@@ -36,6 +583,12 @@ def main():
         default="pll",
     )
     parser.add_argument("-l", "--list-devices", help="list device", action="store_true")
+    parser.add_argument(
+        "-t", "--tolerance", help="Also accept solutions this many MHz worse than the best one", type=float, default=0.0
+    )
+    parser.add_argument(
+        "-s", "--solutions", help="Print the ranked solutions instead of the Verilog", action="store_true"
+    )
 
     args = parser.parse_args()
 
@@ -49,212 +602,6 @@ def main():
     else:
         print(f'Warning: cannot decipher the name of the device {device_name}.')
 
-    device_limits = {
-        "GW1N-1 C6/I5": {
-            "comment": "Untested",
-            "pll_name": "rPLL",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 900,
-            "clkout_min": 3.125,
-            "clkout_max": 450,
-        },
-        "GW1N-1 C5/I4": {
-            "comment": "Untested",
-            "pll_name": "rPLL",
-            "pfd_min": 3,
-            "pfd_max": 320,
-            "vco_min": 320,
-            "vco_max": 720,
-            "clkout_min": 2.5,
-            "clkout_max": 360,
-        },
-        "GW1NR-2 C7/I6": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 800,
-            "clkout_min": 3.125,
-            "clkout_max": 750,
-        },
-        "GW1NR-2 C6/I5": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 800,
-            "clkout_min": 3.125,
-            "clkout_max": 750,
-        },
-        "GW1NR-2 C5/I4": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 320,
-            "vco_min": 320,
-            "vco_max": 640,
-            "clkout_min": 2.5,
-            "clkout_max": 640,
-        },
-        "GW1NR-4 C6/I5": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 1000,
-            "clkout_min": 3.125,
-            "clkout_max": 500,
-        },
-        "GW1NR-4 C5/I4": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 320,
-            "vco_min": 320,
-            "vco_max": 800,
-            "clkout_min": 2.5,
-            "clkout_max": 400,
-        },
-        "GW1NSR-4 C7/I6": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 1200,
-            "clkout_min": 3.125,
-            "clkout_max": 600,
-        },
-        "GW1NSR-4 C6/I5": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 1200,
-            "clkout_min": 3.125,
-            "clkout_max": 600,
-        },
-        "GW1NSR-4 C5/I4": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 320,
-            "vco_min": 320,
-            "vco_max": 960,
-            "clkout_min": 2.5,
-            "clkout_max": 480,
-        },
-        "GW1NSR-4C C7/I6": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 1200,
-            "clkout_min": 3.125,
-            "clkout_max": 600,
-        },
-        "GW1NSR-4C C6/I5": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 1200,
-            "clkout_min": 3.125,
-            "clkout_max": 600,
-        },
-        "GW1NSR-4C C5/I4": {
-            "comment": "Untested",
-            "pll_name": "PLLVR",
-            "pfd_min": 3,
-            "pfd_max": 320,
-            "vco_min": 320,
-            "vco_max": 960,
-            "clkout_min": 2.5,
-            "clkout_max": 480,
-        },
-        "GW1NR-9 C7/I6": {
-            "comment": "Untested",
-            "pll_name": "rPLL",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 1200,
-            "clkout_min": 3.125,
-            "clkout_max": 600,
-        },
-        "GW1NR-9 C6/I5": {
-            "comment": "tested on TangNano9K Board",
-            "pll_name": "rPLL",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 1200,
-            "clkout_min": 3.125,
-            "clkout_max": 600,
-        },
-        "GW1NR-9 C6/I4": {
-            "comment": "Untested",
-            "pll_name": "rPLL",
-            "pfd_min": 3,
-            "pfd_max": 320,
-            "vco_min": 3200,
-            "vco_max": 960,
-            "clkout_min": 2.5,
-            "clkout_max": 480,
-        },
-        "GW1NZ-1 C6/I5": {
-            "comment": "untested",
-            "pll_name": "rPLL",
-            "pfd_min": 3,
-            "pfd_max": 400,
-            "vco_min": 400,
-            "vco_max": 800,
-            "clkout_min": 3.125,
-            "clkout_max": 400,
-        },
-        "GW2A-18 C8/I7": {
-            "comment": "untested",
-            "pll_name": "rPLL",
-            "pfd_min": 3,
-            "pfd_max": 500,
-            "vco_min": 500,
-            "vco_max": 1250,
-            "clkout_min": 3.90625,
-            "clkout_max": 625,
-        },
-        "GW2AR-18 C8/I7": {
-            "comment": "untested",
-            "pll_name": "rPLL",
-            "pfd_min": 3,
-            "pfd_max": 500,
-            "vco_min": 500,
-            "vco_max": 1250,
-            "clkout_min": 3.90625,
-            "clkout_max": 625,
-        },
-        "GW5A-25 ES": {
-            "comment": "untested",
-            "pll_name": "rPLL",
-            "pfd_min": 19,
-            "pfd_max": 800,
-            "vco_min": 800,
-            "vco_max": 1600,
-            # The previous four parameters are taken from the datasheet (as in
-            # this case from https://cdn.gowinsemi.com.cn/DS1103E.pdf), but I
-            # don't know where these two come from:(
-            "clkout_min": 6.25,
-            "clkout_max": 1600,
-        },
-    }
-
     if args.list_devices:
         for device in device_limits:
             print(f"{device} - {device_limits[device]['comment']}")
@@ -265,35 +612,47 @@ def main():
         sys.exit(1)
 
     limits = device_limits[device_name]
-    setup = {}
-
     FCLKIN = args.input_freq_mhz
-    min_diff = FCLKIN
+    fouts = args.output_freq_mhz
 
-    for IDIV_SEL in range(64):
-        for FBDIV_SEL in range(64):
-            for ODIV_SEL in [2, 4, 8, 16, 32, 48, 64, 80, 96, 112, 128]:
-                PFD = FCLKIN / (IDIV_SEL + 1)
-                if not (limits["pfd_min"] <= PFD <= limits["pfd_max"]):
-                    continue
-                CLKOUT = FCLKIN * (FBDIV_SEL + 1) / (IDIV_SEL + 1)
-                if not (limits["clkout_min"] < CLKOUT < limits["clkout_max"]):
-                    continue
-                VCO = (FCLKIN * (FBDIV_SEL + 1) * ODIV_SEL) / (IDIV_SEL + 1)
-                if not (limits["vco_min"] < VCO < limits["vco_max"]):
-                    continue
-                diff = abs(args.output_freq_mhz - CLKOUT)
-                if diff < min_diff:
-                    min_diff = diff
-                    setup = {
-                        "IDIV_SEL": IDIV_SEL,
-                        "FBDIV_SEL": FBDIV_SEL,
-                        "ODIV_SEL": ODIV_SEL,
-                        "PFD": PFD,
-                        "CLKOUT": CLKOUT,
-                        "VCO": VCO,
-                        "ERROR": diff,
-                    }
+    if limits["pll_name"] == "PLLA":
+        try:
+            solutions = solve_plla(limits, FCLKIN, fouts, args.phase, args.tolerance)
+        except ValueError as e:
+            print(f"ERROR: {e}")
+            sys.exit(1)
+        if args.solutions:
+            print(f"{'IDIV_SEL':>8} {'FBDIV_SEL':>9} {'MDIV_SEL':>8} {'PFD':>10} {'VCO':>10} {'VCO margin':>10} {'error':>10}  ODIV_SEL")
+            for sol in solutions:
+                print(f"{sol['IDIV_SEL']:>8} {sol['FBDIV_SEL']:>9} {sol['MDIV_SEL']:>8} {sol['PFD']:>10.4f} {sol['VCO']:>10.4f} "
+                      f"{sol['VCO_MARGIN']:>10.4f} {sol['ERROR']:>10.6f}  {' '.join(str(out['ODIV_SEL']) for out in sol['OUTPUTS'])}")
+            sys.exit(0)
+        if not solutions:
+            print("ERROR: no PLLA settings for these frequencies")
+            sys.exit(1)
+        pll_v = plla_verilog(args.module_name, device_name, FCLKIN, fouts, solutions[0], limits)
+        if args.filename:
+            open(args.filename, "w").write(pll_v)
+        else:
+            print(pll_v)
+        sys.exit(0)
+
+    if len(fouts) > 1 or args.phase:
+        print(f"ERROR: {limits['pll_name']} has one output frequency and no phase setting")
+        sys.exit(1)
+    fout = fouts[0]
+    solutions = solve_pll(limits, FCLKIN, fout, args.tolerance)
+
+    if args.solutions:
+        print(f"{'IDIV_SEL':>8} {'FBDIV_SEL':>9} {'ODIV_SEL':>8} {'PFD':>10} {'CLKOUT':>10} {'VCO':>10} {'VCO margin':>10} {'error':>10}")
+        for sol in solutions:
+            print(f"{sol['IDIV_SEL']:>8} {sol['FBDIV_SEL']:>9} {sol['ODIV_SEL']:>8} {sol['PFD']:>10.4f} {sol['CLKOUT']:>10.4f} "
+                  f"{sol['VCO']:>10.4f} {sol['VCO_MARGIN']:>10.4f} {sol['ERROR']:>10.6f}")
+        sys.exit(0)
+
+    setup = {}
+    if solutions and solutions[0]["ERROR"] < FCLKIN:
+        setup = solutions[0]
 
     if setup:
 
@@ -310,7 +669,7 @@ def main():
  *
  * Target-Device:                {device_name}
  * Given input frequency:        {args.input_freq_mhz:0.3f} MHz
- * Requested output frequency:   {args.output_freq_mhz:0.3f} MHz
+ * Requested output frequency:   {fout:0.3f} MHz
  * Achieved output frequency:    {setup['CLKOUT']:0.3f} MHz
  */
 
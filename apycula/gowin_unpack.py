@@ -4,12 +4,16 @@ import re
 import random
 from itertools import chain, count
 import argparse
+import fnmatch
 import importlib.resources
+import multiprocessing
 from apycula import codegen
-from apycula import chipdb
-from apycula.chipdb import load_chipdb
+from apycula import chipdb_rt
+from apycula import bitmatrix
+from apycula.chipdb_rt import load_chipdb
 from apycula import attrids
 from apycula.bslib import read_bitstream, display
+from apycula.profiling import Profiler
 
 _device = ""
 _pinout = ""
@@ -60,11 +64,11 @@ def _io_mode_sort_func(mode):
 
 #
 def get_attr_name(attrname_table, code, tableName):
-    for name, cod in attrname_table.items():
-        if cod == code:
-            return name
-    print(f'Unknown attr name for table: {tableName} code:{code}')
-    return ''
+    name = attrids.num2name(attrname_table, code)
+    if name is None:
+        print(f'Unknown attr name for table: {tableName} code:{code}')
+        return ''
+    return name
 
 # fix names and types of the PLL attributes
 # { internal_name: external_name }
@@ -102,7 +106,7 @@ def pll_attrs_refine(in_attrs):
         #print(attr, val)
         if attr not in _pll_attrs.keys():
             if attr in ['INSEL', 'FBSEL', 'PWDEN', 'RSTEN', 'CLKOUTDIV3', 'CLKOUTPS']:
-                res.add(f'{attr}="{[ name for name, vl in attrids.pll_attrvals.items() if vl == val ][0]}"')
+                res.add(f'{attr}="{attrids.pll_num2val[val]}"')
             continue
         attr = _pll_attrs[attr]
         if attr in ['CLKOUTP_DLY_STEP', 'CLKOUT_DLY_STEP']:
@@ -114,11 +118,11 @@ def pll_attrs_refine(in_attrs):
         elif attr in ['DYN_SDIV_SEL', 'ODIV_SEL']:
             new_val = val
         else:
-            attrvals = [ name for name, vl in attrids.pll_attrvals.items() if vl == val ]
-            if not attrvals:
+            val_name = attrids.pll_num2val.get(val)
+            if val_name is None:
                 raise Exception(f"PLL no {attr} = {val}")
-            if attrvals[0] in _pll_vals.keys():
-                new_val = _pll_vals[attrvals[0]]
+            if val_name in _pll_vals.keys():
+                new_val = _pll_vals[val_name]
             new_val = f'"{new_val}"'
         res.add(f'{attr}={new_val}')
     return res
@@ -137,10 +141,7 @@ def osc_attrs_refine(in_attrs):
         if attr == 'FREQ_DIV':
             new_val = val
         else:
-            attrvals = [ name for name, vl in osc_attrvals.items() if vl == val ]
-            if attrvals[0] in osc_attrvals.keys():
-                new_val = attrvals[0]
-            new_val = f'"{new_val}"'
+            new_val = f'"{attrids.osc_num2val[val]}"'
         res.add(f'{attr}={new_val}')
     if 'MCLKCIB' not in in_attrs.keys() and 'MCLKCIB_EN' in in_attrs.keys():
         res.add('FREQ_DIV=128')
@@ -171,11 +172,7 @@ _latch_types = {
 }
 
 def get_latch_type(dff_idx, in_attrs):
-    def get_attrval_name(val):
-        for nam, vl in attrids.cls_attrvals.items():
-            if vl == val:
-                return nam
-        return None
+    get_attrval_name = attrids.cls_num2val.get
 
     attrs = {}
     if 'LSRONMUX' in in_attrs.keys():
@@ -197,11 +194,7 @@ def get_latch_type(dff_idx, in_attrs):
     return _latch_types.get((attrs['REGSET'], attrs['LSRONMUX'], attrs['CLKMUX_CLK'], attrs['SRMODE']))
 
 def get_dff_type(dff_idx, in_attrs):
-    def get_attrval_name(val):
-        for nam, vl in attrids.cls_attrvals.items():
-            if vl == val:
-                return nam
-        return None
+    get_attrval_name = attrids.cls_num2val.get
 
     attrs = {}
     if 'LSRONMUX' in in_attrs.keys():
@@ -226,86 +219,296 @@ def get_dff_type(dff_idx, in_attrs):
 # returns {attr: value}
 # attribute names are decoded with the attribute table, but the values are returned in raw form
 def parse_attrvals(tile, logicinfo_table, fuse_table, attrname_table, tableName):
+    return decode_attrvals(bitmatrix.to_int(tile), len(tile[0]), logicinfo_table, fuse_table, attrname_table, tableName)
+
+# same as parse_attrvals, but for a tile packed with bitmatrix.to_int()
+def decode_attrvals(tile_bits, width, logicinfo_table, fuse_table, attrname_table, tableName):
+    key = (id(fuse_table), id(logicinfo_table), id(attrname_table), width)
+    decoder = _attrval_decoders.get(key)
+    if decoder is None:
+        decoder = compile_attrvals(logicinfo_table, fuse_table, attrname_table, tableName, width)
+        # the tables are kept referenced so that their ids stay valid
+        _attrval_decoders[key] = (decoder, fuse_table, logicinfo_table, attrname_table)
+    else:
+        decoder = decoder[0]
+    return decoder(tile_bits)
+
+# {(id(fuse_table), id(logicinfo_table), id(attrname_table), width): (decoder, tables...)}
+_attrval_decoders = {}
+
+# Everything in the fuse table that does not depend on the tile is worked out
+# here once: the fuse bits of a key become a mask over the tile packed into an
+# int (bit row * width + col), the keys with the same fuses share the mask,
+# the masks that strictly contain a given mask are known in advance, and the
+# attribute names are looked up once. The result for each combination of the
+# table fuses met in the tiles is remembered.
+# The returned function gives the same result as the straightforward
+# set-based decoding:
+#  - a record with positive key is used if its fuses are all set and no
+#    other such record has a larger set of fuses that includes them;
+#  - the same for the records with negative keys, but the positive part of
+#    the key is used as values and the negative part as the attributes
+#    that are ignored;
+#  - a record with negative key whose fuses are not set gives the default
+#    values for the negative part of the key if all the positive part is
+#    already found and none of the attributes is ignored.
+def compile_attrvals(logicinfo_table, fuse_table, attrname_table, tableName, width):
     def is_neg_key(key):
         for k in key:
             if k < 0:
                 return True
         return False
 
-    def is_pos_key(key):
-        return not is_neg_key(key)
-
     def get_positive(av):
         return {a for a in av if a > 0}
 
     def get_negative(av):
         return {abs(a) for a in av if a < 0}
 
-    res = {}
-    set_mask = set()
-    zero_mask = set()
-    # collect masks
+    def get_mask(bits):
+        mask = 0
+        for row, col in bits:
+            mask |= 1 << (row * width + col)
+        return mask
+
+    # names are looked up on first use, so unknown codes are reported only
+    # for the records that are actually found in a tile
+    names = {}
+    def attr_vals(idxs):
+        res = names.get(idxs)
+        if res is None:
+            res = []
+            for idx in idxs:
+                attr, val = logicinfo_table[idx]
+                res.append((get_attr_name(attrname_table, attr, tableName), val))
+            res = names.setdefault(idxs, tuple(res))
+        return res
+
+    # masks: unique masks, keys_of: mask index -> key numbers in the table
+    # order, dominators: mask index -> bitset of mask indices which strictly
+    # contain this mask.
+    def compile_masks(keys):
+        masks = {}
+        keys_of = []
+        for num, (av, mask) in enumerate(keys):
+            if mask not in masks:
+                masks[mask] = len(masks)
+                keys_of.append([])
+            keys_of[masks[mask]].append(num)
+        masks = list(masks)
+        # bit number + 1 -> bitset of the masks with this bit
+        with_bit = {}
+        for idx, mask in enumerate(masks):
+            m = mask
+            while m:
+                low = m & -m
+                bit = low.bit_length()
+                with_bit[bit] = with_bit.get(bit, 0) | (1 << idx)
+                m ^= low
+        all_masks = (1 << len(masks)) - 1
+        dominators = []
+        for idx, mask in enumerate(masks):
+            dom = all_masks
+            m = mask
+            while m:
+                low = m & -m
+                dom &= with_bit[low.bit_length()]
+                m ^= low
+            dominators.append(dom & ~(1 << idx))
+        empty = 0
+        if 0 in masks:
+            empty = 1 << masks.index(0)
+        all_bits = 0
+        for mask in masks:
+            all_bits |= mask
+        return (masks, with_bit, empty, all_bits), keys_of, dominators
+
+    # returns the bitset of the masks which are fully set in the tile and
+    # the bitset of those of them that are not dominated by another such mask
+    def find_used(tile_bits, checks, dominators):
+        masks, with_bit, cand, all_bits = checks
+        # only the masks with at least one set bit can be fully set
+        on = tile_bits & all_bits
+        touched = 0
+        while on:
+            low = on & -on
+            touched |= with_bit[low.bit_length()]
+            on ^= low
+        while touched:
+            low = touched & -touched
+            mask = masks[low.bit_length() - 1]
+            if tile_bits & mask == mask:
+                cand |= low
+            touched ^= low
+        used = cand
+        c = cand
+        while c:
+            low = c & -c
+            if dominators[low.bit_length() - 1] & cand:
+                used ^= low
+            c ^= low
+        return cand, used
+
+    def used_keys(used, keys_of):
+        nums = []
+        while used:
+            low = used & -used
+            nums.extend(keys_of[low.bit_length() - 1])
+            used ^= low
+        nums.sort()
+        return nums
+
+    pos_keys = []
+    neg_keys = []
     for av, bits in fuse_table.items():
         if is_neg_key(av):
-            zero_mask.update(bits)
+            neg_keys.append((av, get_mask(bits)))
         else:
-            set_mask.update(bits)
-    set_bits = {(row, col) for row, col in set_mask if tile[row][col] == 1}
-    neg_bits = {(row, col) for row, col in zero_mask if tile[row][col] == 1}
-
-    # find candidates from fuse table
-    # the set bits are more unique
-    attrvals = set()
-    cnd = {av: bits for av, bits in fuse_table.items() if is_pos_key(av) and bits.issubset(set_bits)}
-    for av, bits in cnd.items():
-        keep = True
-        for bt in cnd.values():
-            if bits != bt and bits.issubset(bt):
-                keep = False
-                break
-        if keep:
-            clean_av = get_positive(av)
+            pos_keys.append((av, get_mask(bits)))
+
+    pos_checks, pos_keys_of, pos_dominators = compile_masks(pos_keys)
+    # positive codes of the keys
+    pos_codes = [tuple(get_positive(av)) for av, _ in pos_keys]
+
+    neg_checks, neg_keys_of, neg_dominators = compile_masks(neg_keys)
+    # key number -> mask index
+    neg_key_mask = [0] * len(neg_keys)
+    for idx, nums in enumerate(neg_keys_of):
+        for num in nums:
+            neg_key_mask[num] = idx
+    # (positive codes, negative codes)
+    neg_codes = [(get_positive(av), tuple(get_negative(av))) for av, _ in neg_keys]
+    # the defaults need all the positive part of the key present, so index
+    # the keys by positive codes
+    neg_by_code = {}
+    neg_no_pos = set()
+    for num, (pos, neg) in enumerate(neg_codes):
+        if not neg:
+            continue
+        if not pos:
+            neg_no_pos.add(num)
+        for code in pos:
+            neg_by_code.setdefault(code, []).append(num)
+
+    table_bits = pos_checks[3] | neg_checks[3]
+    # many tiles have the same configuration
+    decoded = {}
+    def decode(tile_bits):
+        tile_bits &= table_bits
+        res = decoded.get(tile_bits)
+        if res is None:
+            res = decoded.setdefault(tile_bits, decode_bits(tile_bits))
+        return dict(res)
+
+    def decode_bits(tile_bits):
+        res = {}
+        attrvals = set()
+        _, used = find_used(tile_bits, pos_checks, pos_dominators)
+        for num in used_keys(used, pos_keys_of):
+            clean_av = pos_codes[num]
             attrvals.update(clean_av) # set attributes
-            for idx in clean_av:
-                attr, val = logicinfo_table[idx]
-                res[get_attr_name(attrname_table, attr, tableName)] = val
-
-    # records with a negative keys and used fuses
-    neg_attrvals = set()
-    ignore_attrs = set()
-    cnd = {av: bits for av, bits in fuse_table.items() if is_neg_key(av) and bits.issubset(neg_bits)}
-    for av, bits in cnd.items():
-        keep = True
-        for bt in cnd.values():
-            if bits != bt and bits.issubset(bt):
-                keep = False
-                break
-            for idx in av:
-                attr, _ = logicinfo_table[abs(idx)]
-                if attr in res.keys():
-                    keep = False
-                    break
-        if keep:
-            neg_attrvals.update(get_positive(av))
-            ignore_attrs.update(get_negative(av))
-
-    for idx in neg_attrvals:
-        attr, val = logicinfo_table[idx]
-        res[get_attr_name(attrname_table, attr, tableName)] = val
-
-    # records with a negative keys and unused fuses
-    cnd = {av for av, bits in fuse_table.items() if is_neg_key(av) and not bits.issubset(neg_bits)}
-    for av in cnd:
-        keep = True
-        for idx in get_negative(av):
-            if idx in ignore_attrs or not get_positive(av).issubset(attrvals):
-                keep = False
-                break
-        if keep:
-            for idx in get_negative(av):
-                attr, val = logicinfo_table[idx]
-                res[get_attr_name(attrname_table, attr, tableName)] = val
-    return res
+            for name, val in attr_vals(clean_av):
+                res[name] = val
+
+        # records with a negative keys and used fuses
+        neg_attrvals = set()
+        ignore_attrs = set()
+        cand, used = find_used(tile_bits, neg_checks, neg_dominators)
+        for num in used_keys(used, neg_keys_of):
+            neg_attrvals.update(neg_codes[num][0])
+            ignore_attrs.update(neg_codes[num][1])
+
+        for idx in neg_attrvals:
+            attr, val = logicinfo_table[idx]
+            res[get_attr_name(attrname_table, attr, tableName)] = val
+
+        # records with a negative keys and unused fuses
+        found = {}
+        for code in attrvals:
+            for num in neg_by_code.get(code, ()):
+                found[num] = found.get(num, 0) + 1
+        defaults = [num for num in chain(neg_no_pos, found)
+                    if (num in neg_no_pos or found[num] == len(neg_codes[num][0]))
+                    and not (cand >> neg_key_mask[num]) & 1
+                    and ignore_attrs.isdisjoint(neg_codes[num][1])]
+        if len(defaults) > 1:
+            # the defaults are applied in the iteration order of the set of
+            # the keys with unused fuses, which is built here exactly as it
+            # was built by the set-based decoding
+            defaults = set(defaults)
+            unused = {av for num, (av, _) in enumerate(neg_keys) if not (cand >> neg_key_mask[num]) & 1}
+            key_num = {neg_keys[num][0]: num for num in defaults}
+            defaults = [key_num[av] for av in unused if av in key_num]
+        for num in defaults:
+            for name, val in attr_vals(neg_codes[num][1]):
+                res[name] = val
+        return res
+    return decode
+
+# returns the active ({dest: src} pips, {dest: src} clock pips) of the tile
+def get_tile_pips(db, row, col, tile, default = True):
+    tiledata = db[row, col]
+    tile_bits = bitmatrix.to_int(tile)
+    return (decode_pips(tile_bits, tiledata.width, tiledata.pips, default),
+            decode_pips(tile_bits, tiledata.width, tiledata.clock_pips))
+
+# same as get_tile_pips, but for a tile packed with bitmatrix.to_int()
+def decode_pips(tile_bits, width, pip_table, default = True):
+    key = (id(pip_table), width)
+    decoder = _pip_decoders.get(key)
+    if decoder is None:
+        decoder = compile_pips(pip_table, width)
+        _pip_decoders[key] = (decoder, pip_table)
+    else:
+        decoder = decoder[0]
+    return decoder(tile_bits, default)
+
+# {(id(pip_table), width): (decoder, pip_table)}
+_pip_decoders = {}
+
+# A pip is used if the fuses of the destination that are set in the tile are
+# exactly the fuses of the pip; if several pips of the destination have the
+# same fuses the last one wins. So for each destination there is a mask of all
+# its fuses and a dictionary {pip mask: src}, with masks over the tile packed
+# into an int (bit row * width + col). Pips without fuses are the default
+# state and are used only if default is set.
+def compile_pips(pip_table, width):
+    def get_mask(bits):
+        mask = 0
+        for row, col in bits:
+            mask |= 1 << (row * width + col)
+        return mask
+
+    dests = []
+    default_pips = {}
+    all_bits = 0
+    for dest, srcs in pip_table.items():
+        dest_bits = 0
+        by_mask = {}
+        for src, bits in srcs.items():
+            mask = get_mask(bits)
+            dest_bits |= mask
+            by_mask[mask] = src
+        all_bits |= dest_bits
+        dests.append((dest, dest_bits, by_mask))
+        if 0 in by_mask:
+            default_pips[dest] = by_mask[0]
+
+    def decode(tile_bits, default):
+        tile_bits &= all_bits
+        if not tile_bits:
+            if default:
+                return dict(default_pips)
+            return {}
+        pips = {}
+        for dest, dest_bits, by_mask in dests:
+            used = tile_bits & dest_bits
+            if used or default:
+                src = by_mask.get(used)
+                if src is not None:
+                    pips[dest] = src
+        return pips
+    return decode
 
 # { (row, col, type) : idx}
 # type 'A'| 'B'
@@ -354,6 +557,44 @@ def get_dsp_main_cell(db, row, col, typ):
             col = 1 + (col - 1) // 9
     return row, col
 
+# Tiles of the same type with the same fuses decode the same way, except for
+# the few things that depend on the location: PLL and BSRAM indices, the
+# neighbouring tile with the fuses of IOB B, the row of BUFS and the
+# special IO row of GW1N(Z)-1. These go into the cache key along with the
+# fuses. DSP tiles are not cached because a DSP_AUX bel changes the location
+# for the bels that follow it.
+# {(ttyp, default, tile bits, location): (bels, pips, clock_pips)}
+# {id(db): {cache key: (bels, pips, clock_pips)}}
+_tile_cache = {}
+tile_cache_stats = {'hits': 0, 'misses': 0, 'uncached': 0}
+
+def tile_location_key(db, row, col, tiledata, bm):
+    key = []
+    for name, bel in tiledata.bels.items():
+        if name.startswith("DSP"):
+            return None
+        if name.startswith("RPLL"):
+            key.append(_pll_cells.setdefault(get_pll_A(db, row, col, name[4]), len(_pll_cells)))
+        elif name == "PLLVR":
+            key.append(_pll_cells.setdefault(get_pll_A(db, row, col, 'A'), len(_pll_cells)))
+        elif name.startswith("BSRAM"):
+            if 'BSRAM_SP' in db.shortval[tiledata.ttyp]:
+                key.append(_bsram_cells.setdefault(get_bsram_main_cell(db, row, col, name), len(_bsram_cells)))
+        elif name.startswith("IOB"):
+            if name[-1] == 'B' and bel.fuse_cell_offset:
+                io_row = row + bel.fuse_cell_offset[0]
+                io_col = col + bel.fuse_cell_offset[1]
+                key.append((db.grid[io_row][io_col], bitmatrix.to_int(bm[io_row, io_col])))
+            if _device in {'GW1NZ-1', 'GW1N-1'}:
+                key.append(row == 5)
+        elif name.startswith("BUFS"):
+            key.append(row != 0)
+    return tuple(key)
+
+def copy_tile_result(res):
+    bels, pips, clock_pips = res
+    return {name: bel.copy() for name, bel in bels.items()}, pips.copy(), clock_pips.copy()
+
 # noiostd --- this is the case when the function is called
 # with iostd by default, e.g. from the clock fuzzer
 # With normal gowin_unpack io standard is determined first and it is known.
@@ -366,10 +607,24 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
                 for key, val in db.longval[ttyp]['BANK'].items():
                     _bank_fuse_tables.setdefault(ttyp, {}).setdefault(f'BANK{key[0]}', {})[key[1:]] = val
 
+    tiledata = db[row, col]
+    tile_bits = bitmatrix.to_int(tile)
+
+    tile_cache = chipdb_rt.db_cache(_tile_cache, db)
+    cache_key = tile_location_key(db, row, col, tiledata, bm)
+    if cache_key is None:
+        tile_cache_stats['uncached'] += 1
+    else:
+        cache_key = (tiledata.ttyp, default, tile_bits, cache_key)
+        res = tile_cache.get(cache_key)
+        if res is not None:
+            tile_cache_stats['hits'] += 1
+            return copy_tile_result(res)
+        tile_cache_stats['misses'] += 1
+
     # TLVDS takes two BUF bels, so skip the B bels.
     skip_bels = set()
     #print((row, col))
-    tiledata = db[row, col]
     #if 'HCLK' in db.shortval[tiledata.ttyp].keys():
     #    attrvals =parse_attrvals(tile, db.logicinfo['HCLK'], db.shortval[tiledata.ttyp]['HCLK'], attrids.hclk_attrids)
     #    if attrvals:
@@ -389,13 +644,13 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
     bels = {}
     for name, bel in tiledata.bels.items():
         if name.startswith("ADC"):
-            attrvals = parse_attrvals(tile, db.rev_logicinfo('ADC'), db.shortval[tiledata.ttyp]['ADC'], attrids.adc_attrids, "ADC")
+            attrvals = decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('ADC'), db.shortval[tiledata.ttyp]['ADC'], attrids.adc_attrids, "ADC")
             #print(row, col, name, tiledata.ttyp, attrvals)
         if name.startswith("RPLL"):
             idx = _pll_cells.setdefault(get_pll_A(db, row, col, name[4]), len(_pll_cells))
             modes = { f'DEVICE="{_device}"' }
             if 'PLL' in db.shortval[tiledata.ttyp].keys():
-                attrvals = pll_attrs_refine(parse_attrvals(tile, db.rev_logicinfo('PLL'), db.shortval[tiledata.ttyp]['PLL'], attrids.pll_attrids, "PLL"))
+                attrvals = pll_attrs_refine(decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('PLL'), db.shortval[tiledata.ttyp]['PLL'], attrids.pll_attrids, "PLL"))
                 for attrval in attrvals:
                     modes.add(attrval)
             if modes:
@@ -403,7 +658,7 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
             continue
         if name == "PLLVR":
             idx = _pll_cells.setdefault(get_pll_A(db, row, col, 'A'), len(_pll_cells))
-            attrvals = pll_attrs_refine(parse_attrvals(tile, db.rev_logicinfo('PLL'), db.shortval[tiledata.ttyp]['PLL'], attrids.pll_attrids, "PLL"))
+            attrvals = pll_attrs_refine(decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('PLL'), db.shortval[tiledata.ttyp]['PLL'], attrids.pll_attrids, "PLL"))
             modes = { f'DEVICE="{_device}"' }
             for attrval in attrvals:
                 modes.add(attrval)
@@ -411,7 +666,7 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
                 bels[f'{name}{idx}'] = modes
             continue
         if name.startswith("OSC"):
-            attrvals = osc_attrs_refine(parse_attrvals(tile, db.rev_logicinfo('OSC'), db.shortval[tiledata.ttyp]['OSC'], attrids.osc_attrids, "OSC"))
+            attrvals = osc_attrs_refine(decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('OSC'), db.shortval[tiledata.ttyp]['OSC'], attrids.osc_attrids, "OSC"))
             modes = set()
             for attrval in attrvals:
                 modes.add(attrval)
@@ -424,7 +679,7 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
                 continue
             idx = _bsram_cells.setdefault(get_bsram_main_cell(db, row, col, name), len(_bsram_cells))
             #print(row, col, name, idx, tiledata.ttyp)
-            attrvals = parse_attrvals(tile, db.rev_logicinfo('BSRAM'), db.shortval[tiledata.ttyp]['BSRAM_SP'], attrids.bsram_attrids, "BSRAM")
+            attrvals = decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('BSRAM'), db.shortval[tiledata.ttyp]['BSRAM_SP'], attrids.bsram_attrids, "BSRAM")
             if not attrvals:
                 continue
             #print(row, col, name, idx, tiledata.ttyp, attrvals)
@@ -440,9 +695,9 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
                 row, col = get_dsp_main_cell(db, row, col, name)
 
             if f'DSP{idx}' in db.shortval[tiledata.ttyp]:
-                attrvals = parse_attrvals(tile, db.rev_logicinfo('DSP'), db.shortval[tiledata.ttyp][f'DSP{idx}'], attrids.dsp_attrids, "DSP")
+                attrvals = decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('DSP'), db.shortval[tiledata.ttyp][f'DSP{idx}'], attrids.dsp_attrids, "DSP")
             elif f'5A_DSP' in db.shortval[tiledata.ttyp]:
-                attrvals = parse_attrvals(tile, db.rev_logicinfo('5A_DSP'), db.shortval[tiledata.ttyp][f'5A_DSP'], attrids.dsp_5a_attrids, "5A_DSP")
+                attrvals = decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('5A_DSP'), db.shortval[tiledata.ttyp][f'5A_DSP'], attrids.dsp_5a_attrids, "5A_DSP")
             else:
                 attrvals = None
             if attrvals:
@@ -454,7 +709,7 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
             continue
         if name.startswith("IOLOGIC"):
             idx = name[-1]
-            attrvals = parse_attrvals(tile, db.rev_logicinfo('IOLOGIC'), db.shortval[tiledata.ttyp][f'IOLOGIC{idx}'], attrids.iologic_attrids, "IOLOGIC")
+            attrvals = decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('IOLOGIC'), db.shortval[tiledata.ttyp][f'IOLOGIC{idx}'], attrids.iologic_attrids, "IOLOGIC")
             if not attrvals:
                 continue
             #print_sorted_dict(f'{row}, {col}, {name}, {idx}, {tiledata.ttyp} - ', attrvals)
@@ -495,7 +750,7 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
                 bels.setdefault(name, set()).add(f"CLKODDRMUX_ECLK={attrids.iologic_num2val[attrvals['CLKODDRMUX_ECLK']]}")
         if name.startswith("DFF"):
             idx = int(name[3])
-            attrvals = parse_attrvals(tile, db.rev_logicinfo('SLICE'), db.shortval[tiledata.ttyp][f'CLS{idx // 2}'], attrids.cls_attrids, "CLS")
+            attrvals = decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('SLICE'), db.shortval[tiledata.ttyp][f'CLS{idx // 2}'], attrids.cls_attrids, "CLS")
             #print('parse', row, col, attrvals)
             # skip ALU and unsupported modes
             if attrvals.get('MODE') == attrids.cls_attrvals['SSRAM']:
@@ -514,22 +769,24 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
         if name.startswith("IOB"):
             idx = name[-1]
             io_row, io_col = row, col
-            io_tile = tile
+            io_tile_bits = tile_bits
+            io_width = tiledata.width
             io_ttyp = tiledata.ttyp
 
             if idx == 'B' and tiledata.bels[name].fuse_cell_offset:
                 io_row += tiledata.bels[name].fuse_cell_offset[0]
                 io_col += tiledata.bels[name].fuse_cell_offset[1]
                 io_tiledata = db[io_row, io_col]
-                io_tile = bm[io_row, io_col]
+                io_tile_bits = bitmatrix.to_int(bm[io_row, io_col])
+                io_width = io_tiledata.width
                 io_ttyp = io_tiledata.ttyp
             # XXX
             if idx == 'B' and 'IOBB' not in db.longval[io_ttyp]:
                 continue
-            attrvals = parse_attrvals(io_tile, db.rev_logicinfo('IOB'), db.longval[io_ttyp][f'IOB{idx}'], attrids.iob_attrids, "IOB")
+            attrvals = decode_attrvals(io_tile_bits, io_width, db.rev_logicinfo('IOB'), db.longval[io_ttyp][f'IOB{idx}'], attrids.iob_attrids, "IOB")
             #print(name, io_row, io_col, sorted(attrvals.items()))
             try: # we can ask for invalid pin here because the IOBs share some stuff
-                bank = chipdb.loc2bank(db, io_row, io_col)
+                bank = chipdb_rt.loc2bank(db, io_row, io_col)
             except KeyError:
                 bank = None
             if attrvals:
@@ -567,14 +824,14 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
 
                 bels.setdefault(name, set()).add(mode)
         if name.startswith("BANK"):
-            attrvals = parse_attrvals(tile, db.rev_logicinfo('IOB'), _bank_fuse_tables[tiledata.ttyp][name], attrids.iob_attrids, "IOB")
+            attrvals = decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('IOB'), _bank_fuse_tables[tiledata.ttyp][name], attrids.iob_attrids, "IOB")
             #print(name, row, col, attrvals)
 
             for a, v in attrvals.items():
                 bels.setdefault(name, set()).add(f'{a}={attrids.iob_num2val.get(v, str(v))}')
         if name.startswith("ALU"):
             idx = int(name[3])
-            attrvals = parse_attrvals(tile, db.rev_logicinfo('SLICE'), db.shortval[tiledata.ttyp][f'CLS{idx // 2}'], attrids.cls_attrids, "CLS")
+            attrvals = decode_attrvals(tile_bits, tiledata.width, db.rev_logicinfo('SLICE'), db.shortval[tiledata.ttyp][f'CLS{idx // 2}'], attrids.cls_attrids, "CLS")
             # skip ALU and unsupported modes
             if attrvals.get('MODE') != attrids.cls_attrvals['ALU']:
                 continue
@@ -614,25 +871,9 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
                     clock_pips[f'LWSPINE{half}{qd}{num}'] = f'LW{half}{num}'
         #print("flags:", sorted(bels.get(name, set())))
 
-    pips = {}
-    for dest, srcs in tiledata.pips.items():
-        pip_bits = set().union(*srcs.values())
-        used_bits = {(row, col)
-                     for row, col in pip_bits
-                     if tile[row][col] == 1}
-        for src, bits in srcs.items():
-            # optionally ignore the defautl set() state
-            if bits == used_bits and (default or bits):
-                pips[dest] = src
-
-    for dest, srcs in tiledata.clock_pips.items():
-        pip_bits = set().union(*srcs.values())
-        used_bits = {(row, col)
-                     for row, col in pip_bits
-                     if tile[row][col] == 1}
-        for src, bits in srcs.items():
-            if bits == used_bits:
-                clock_pips[dest] = src
+    # optionally ignore the defautl set() state
+    pips = decode_pips(tile_bits, tiledata.width, tiledata.pips, default)
+    clock_pips.update(decode_pips(tile_bits, tiledata.width, tiledata.clock_pips))
 
     # elvds IO uses the B bel bits
     for name in skip_bels:
@@ -649,7 +890,10 @@ def parse_tile_(db, row, col, tile, bm=None, default=True, noiostd = True):
                 bel_a -= old_mode
                 bel_a.update(mode)
 
-    return {name: bel for name, bel in bels.items() if name not in skip_bels}, pips, clock_pips
+    res = {name: bel for name, bel in bels.items() if name not in skip_bels}, pips, clock_pips
+    if cache_key is not None:
+        tile_cache[cache_key] = copy_tile_result(res)
+    return res
 
 dffmap = {
     "DFF": None,
@@ -936,8 +1180,8 @@ def tile2verilog(dbrow, dbcol, bels, pips, clock_pips, mod, cst, db):
     col = dbcol+1
 
     for dest, src in chain(pips.items(), clock_pips.items()):
-        srcg = chipdb.wire2global(row, col, db, src)
-        destg = chipdb.wire2global(row, col, db, dest)
+        srcg = chipdb_rt.wire2global(row, col, db, src)
+        destg = chipdb_rt.wire2global(row, col, db, dest)
         mod.wires.update({srcg, destg})
         mod.assigns.append((destg, srcg))
 
@@ -1237,9 +1481,9 @@ def tile2verilog(dbrow, dbcol, bels, pips, clock_pips, mod, cst, db):
                 getattr(mod, direction).update(wnames)
             mod.primitives[name] = iob
             # constraints
-            pos = chipdb.loc2pin_name(db, dbrow, dbcol)
+            pos = chipdb_rt.loc2pin_name(db, dbrow, dbcol)
             # XXX tangnano4k uses IOT30 not found in the package
-            #bank = chipdb.loc2bank(db, dbrow, dbcol)
+            #bank = chipdb_rt.loc2bank(db, dbrow, dbcol)
             cst.ports[name] = f"{pos}{idx}"
             if kind[0:5] == 'TLVDS':
                 cst.ports[name] = f"{pos}{idx},{pos}{chr(ord(idx) + 1)}"
@@ -1297,6 +1541,356 @@ def fix_plls(db, mod):
         mod.wires.update(pll.portmap.values())
         fix_pll_ports(pll)
 
+# PLL and BSRAM cells get their indices in the order in which the tiles are
+# decoded. Assign them beforehand so that the tiles can be decoded in any order
+# (and in different processes) without changing the names of the primitives.
+def assign_cell_indices(db, tiles):
+    for row, col in tiles:
+        tiledata = db[row, col]
+        for name in tiledata.bels:
+            if name.startswith("RPLL"):
+                _pll_cells.setdefault(get_pll_A(db, row, col, name[4]), len(_pll_cells))
+            elif name == "PLLVR":
+                _pll_cells.setdefault(get_pll_A(db, row, col, 'A'), len(_pll_cells))
+            elif name.startswith("BSRAM") and 'BSRAM_SP' in db.shortval[tiledata.ttyp]:
+                _bsram_cells.setdefault(get_bsram_main_cell(db, row, col, name), len(_bsram_cells))
+
+def unpack_tile(db, row, col, bm, mod, cst, noalu = False, prof = None):
+    if prof is None:
+        prof = Profiler()
+    with prof.stage('parse_tile_'), prof.sample('parse_tile_', db.grid[row][col]):
+        bels, pips, clock_pips = parse_tile_(db, row, col, bm[(row, col)], bm, noiostd = False)
+    #print("bels:", (row, col), bels)
+    #print(pips)
+    #print(clock_pips)
+    if noalu:
+        removeALUs(bels)
+    else:
+        removeLUTs(bels)
+    ram16_remove_bels(bels)
+    with prof.stage('tile2verilog'):
+        tile2verilog(row, col, bels, pips, clock_pips, mod, cst, db)
+
+# Only the wires the design uses get their aliases, the rest of the
+# precomputed index is never looked at.
+def resolve_wire_aliases(db, mod):
+    roots = chipdb_rt.get_wire_roots(db)
+    for wire in chain(mod.wires, chain.from_iterable(mod.assigns)):
+        if wire in mod.wire_aliases:
+            continue
+        key = chipdb_rt.global2wire(wire)
+        if key in roots:
+            mod.wire_aliases[wire] = roots[key]
+
+# -j N: the tiles are decoded by forked workers, which see the chip database
+# and the tile bitmaps of the parent process.
+_worker_args = None
+
+def _unpack_tiles(tiles):
+    db, bm, noalu = _worker_args
+    mod = codegen.Module()
+    cst = codegen.Constraints()
+    stats = dict(tile_cache_stats)
+    for row, col in tiles:
+        unpack_tile(db, row, col, bm, mod, cst, noalu)
+    return mod, cst, {key: val - stats[key] for key, val in tile_cache_stats.items()}
+
+# primitives that are put together from several tiles, a streamed module
+# keeps them until the end
+_multi_tile_primitives = {'rPLL', 'PLLVR', 'BSRAM'}
+
+def unpack_tiles_parallel(db, bm, tiles, noalu, jobs, mod, cst):
+    global _worker_args
+    _worker_args = (db, bm, noalu)
+    # consecutive runs of tiles so that the fragments can be joined in the
+    # sequential order
+    chunk_size = max(1, len(tiles) // (jobs * 8))
+    chunks = [tiles[i:i + chunk_size] for i in range(0, len(tiles), chunk_size)]
+    with multiprocessing.get_context('fork').Pool(jobs) as pool:
+        for chunk_mod, chunk_cst, stats in pool.imap(_unpack_tiles, chunks):
+            # a streamed module writes the fragment out right away
+            mod.merge(chunk_mod)
+            cst.merge(chunk_cst)
+            for key, val in stats.items():
+                tile_cache_stats[key] += val
+    _worker_args = None
+    return mod, cst
+
+# --stats: resource usage counted straight from the tile fuses, no bels,
+# Module or Verilog are made. The bels that are only modes and flags (LUT,
+# RAM16, BUFS) are tested with masks over the packed tile, compiled once per
+# tile type; the slice, DSP, BSRAM, OSC and IOB settings go through the
+# attribute decoders of parse_tile_ and only the parts that decide whether
+# the bel is used are looked at. The counts are the ones parse_tile_ with
+# the LUT/ALU/RAM16 pruning of unpack_tile gives.
+
+def routing_mask(tiledata):
+    # all the fuses of the tile pips as a packed bitmap
+    mask = 0
+    for table in (tiledata.pips, tiledata.clock_pips):
+        for srcs in table.values():
+            for bits in srcs.values():
+                for row, col in bits:
+                    mask |= 1 << (row * tiledata.width + col)
+    return mask
+
+# returns a function: packed tile -> the modes and flags of a bel that has
+# nothing but modes and flags, as the generic part of parse_tile_ finds them
+def compile_bel_flags(bel, width, flags_need_mode = False):
+    def get_mask(bits):
+        mask = 0
+        for row, col in bits:
+            mask |= 1 << (row * width + col)
+        return mask
+
+    mode_bits = get_mask(bel.mode_bits)
+    modes = [(mode, get_mask(bits)) for mode, bits in bel.modes.items()]
+    flags = [(flag, get_mask(bits)) for flag, bits in bel.flags.items()]
+
+    def decode(tile_bits):
+        used = tile_bits & mode_bits
+        res = {mode for mode, mask in modes if mask == used}
+        if res or not flags_need_mode:
+            res.update(flag for flag, mask in flags if tile_bits & mask == mask)
+        return res
+    return decode
+
+def slice_bel_used(name, attrvals):
+    """ is the DFF or ALU bel used with these CLS settings """
+    if name.startswith("ALU"):
+        return attrvals.get('MODE') == attrids.cls_attrvals['ALU']
+    if attrvals.get('MODE') == attrids.cls_attrvals['SSRAM']:
+        return False
+    idx = int(name[3])
+    if attrvals.get('REGMODE') == attrids.cls_attrvals['LATCH']:
+        return get_latch_type(idx, attrvals) is not None
+    return get_dff_type(idx, attrvals) is not None
+
+def used_iobs(db, row, col, tile_bits, bm):
+    """ names of the used IOB bels of the tile, the B bels that are part of
+        a differential pair are not counted """
+    tiledata = db[row, col]
+    used = []
+    skip = set()
+    for name, bel in tiledata.bels.items():
+        if not name.startswith("IOB"):
+            continue
+        idx = name[-1]
+        io_tile_bits = tile_bits
+        io_width = tiledata.width
+        io_ttyp = tiledata.ttyp
+        if idx == 'B' and bel.fuse_cell_offset:
+            io_row = row + bel.fuse_cell_offset[0]
+            io_col = col + bel.fuse_cell_offset[1]
+            io_tile_bits = bitmatrix.to_int(bm[io_row, io_col])
+            io_width = db[io_row, io_col].width
+            io_ttyp = db.grid[io_row][io_col]
+        if idx == 'B' and 'IOBB' not in db.longval[io_ttyp]:
+            continue
+        attrvals = decode_attrvals(io_tile_bits, io_width, db.rev_logicinfo('IOB'), db.longval[io_ttyp][f'IOB{idx}'], attrids.iob_attrids, "IOB")
+        if not attrvals:
+            continue
+        used.append(name)
+        # the same order of checks as in parse_tile_
+        if 'LVDS_OUT' in attrvals:
+            skip.add(name[:-1] + 'B')
+        elif 'OD' in attrvals:
+            pass
+        elif idx == 'B' and 'DRIVE' not in attrvals and 'IO_TYPE' in attrvals:
+            skip.add(name)
+        elif 'LPRX_A1' in attrvals or 'IOBUF_MIPI_LP' in attrvals:
+            skip.add(name[:-1] + 'B')
+    return [name for name in used if name not in skip]
+
+def collect_stats(db, bm, tiles, noalu = False, prof = None):
+    if prof is None:
+        prof = Profiler()
+    stats = {'LUT4': 0, 'DFF': 0, 'ALU': 0, 'RAM16': 0, 'OSC': 0, 'DSP': 0}
+    bsrams = set()
+    plls = set()
+    iobs = {}
+    # {ttyp: [tiles, used tiles, pips, set routing fuses, routing fuses]}
+    routing = {}
+    for row in range(db.rows):
+        for col in range(db.cols):
+            ttyp = db.grid[row][col]
+            routing.setdefault(ttyp, [0, 0, 0, 0, 0])[0] += 1
+    masks = {}
+    # {(ttyp, bel name): compile_bel_flags()}
+    bel_flags = {}
+    for row, col in tiles:
+        tiledata = db[row, col]
+        ttyp = tiledata.ttyp
+        width = tiledata.width
+        tile_bits = bitmatrix.to_int(bm[(row, col)])
+        with prof.stage('tile_stats'), prof.sample('tile_stats', ttyp):
+            # bels in use, by name as in the tile
+            used = set()
+            # LUT name -> number of the set flags
+            lut_flags = {}
+            clock_pips = {}
+            for name, bel in tiledata.bels.items():
+                if name.startswith("RPLL") or name == "PLLVR":
+                    # the PLL is made from its A and B cells, it is used if
+                    # either of them sets INSEL, like fix_plls decides
+                    if 'PLL' in db.shortval[ttyp]:
+                        attrvals = pll_attrs_refine(decode_attrvals(tile_bits, width, db.rev_logicinfo('PLL'), db.shortval[ttyp]['PLL'], attrids.pll_attrids, "PLL"))
+                        if any(attrval.startswith('INSEL=') for attrval in attrvals):
+                            plls.add(get_pll_A(db, row, col, 'A' if name == "PLLVR" else name[4]))
+                elif name.startswith("OSC"):
+                    if osc_attrs_refine(decode_attrvals(tile_bits, width, db.rev_logicinfo('OSC'), db.shortval[ttyp]['OSC'], attrids.osc_attrids, "OSC")):
+                        stats['OSC'] += 1
+                elif name.startswith("BSRAM"):
+                    # only the main cell is counted
+                    if name == "BSRAM" and 'BSRAM_SP' in db.shortval[ttyp]:
+                        if decode_attrvals(tile_bits, width, db.rev_logicinfo('BSRAM'), db.shortval[ttyp]['BSRAM_SP'], attrids.bsram_attrids, "BSRAM"):
+                            bsrams.add((row, col))
+                elif name.startswith("ALU54D") or name.startswith("DSP_AUX"):
+                    pass
+                elif name.startswith("DSP"):
+                    idx = name[-1]
+                    if f'DSP{idx}' in db.shortval[ttyp]:
+                        attrvals = decode_attrvals(tile_bits, width, db.rev_logicinfo('DSP'), db.shortval[ttyp][f'DSP{idx}'], attrids.dsp_attrids, "DSP")
+                    elif '5A_DSP' in db.shortval[ttyp]:
+                        attrvals = decode_attrvals(tile_bits, width, db.rev_logicinfo('5A_DSP'), db.shortval[ttyp]['5A_DSP'], attrids.dsp_5a_attrids, "5A_DSP")
+                    else:
+                        attrvals = None
+                    if attrvals:
+                        stats['DSP'] += 1
+                elif name.startswith("DFF") or name.startswith("ALU"):
+                    idx = int(name[3])
+                    attrvals = decode_attrvals(tile_bits, width, db.rev_logicinfo('SLICE'), db.shortval[ttyp][f'CLS{idx // 2}'], attrids.cls_attrids, "CLS")
+                    if slice_bel_used(name, attrvals):
+                        used.add(name)
+                elif name.startswith("LUT") or name == "RAM16" or name.startswith("BUFS"):
+                    decoder = bel_flags.get((ttyp, name))
+                    if decoder is None:
+                        decoder = bel_flags.setdefault((ttyp, name), compile_bel_flags(bel, width, name == "RAM16"))
+                    flags = decoder(tile_bits)
+                    if name.startswith("BUFS"):
+                        # the clock pips of the unset flags, see parse_tile_
+                        half = 'T' if row == 0 else 'B'
+                        for qd in flags ^ {'R', 'L'}:
+                            clock_pips[f'LWSPINE{half}{qd}{name[4:]}'] = None
+                    elif flags:
+                        used.add(name)
+                        lut_flags[name] = len(flags)
+            for name in used_iobs(db, row, col, tile_bits, bm):
+                try:
+                    bank = chipdb_rt.loc2bank(db, row, col)
+                except KeyError:
+                    bank = '?'
+                iobs[bank] = iobs.get(bank, 0) + 1
+
+            if noalu:
+                used = {name for name in used if not name.startswith("ALU")}
+            else:
+                used -= {f'LUT{name[3:]}' for name in used if name.startswith("ALU")}
+            if "RAM16" in used:
+                used -= {f'LUT{x}' for x in range(6)} | {f'DFF{x}' for x in range(4, 6)}
+            for name in used:
+                if name.startswith("LUT"):
+                    # all ones is a constant zero driver, not a LUT
+                    if lut_flags[name] < 16:
+                        stats['LUT4'] += 1
+                elif name.startswith("DFF"):
+                    stats['DFF'] += 1
+                elif name.startswith("ALU"):
+                    stats['ALU'] += 1
+                else:
+                    stats['RAM16'] += 1
+
+            clock_pips.update(decode_pips(tile_bits, width, tiledata.clock_pips))
+            pips = decode_pips(tile_bits, width, tiledata.pips)
+
+        if ttyp not in masks:
+            masks[ttyp] = routing_mask(tiledata)
+        rec = routing[ttyp]
+        rec[1] += 1
+        rec[2] += len(pips) + len(clock_pips)
+        rec[3] += bin(tile_bits & masks[ttyp]).count('1')
+
+    for ttyp, rec in routing.items():
+        if ttyp in masks:
+            rec[4] = bin(masks[ttyp]).count('1') * rec[0]
+    stats['BSRAM'] = len(bsrams)
+    stats['PLL'] = len(plls)
+    stats['IOB'] = iobs
+    stats['routing'] = {ttyp: rec for ttyp, rec in routing.items() if rec[1]}
+    return stats
+
+def print_stats(stats, file = sys.stdout):
+    for name in ['LUT4', 'ALU', 'DFF', 'RAM16', 'BSRAM', 'DSP', 'PLL', 'OSC']:
+        print(f"{name:<8} {stats[name]:>8}", file = file)
+    print(file = file)
+    print(f"{'bank':<8} {'IOBs':>8}", file = file)
+    for bank, cnt in sorted(stats['IOB'].items(), key = lambda kv: str(kv[0])):
+        print(f"{bank:<8} {cnt:>8}", file = file)
+    print(file = file)
+    print(f"{'ttyp':<8} {'tiles':>8} {'used':>8} {'pips':>8} {'fuses':>10} {'density, %':>10}", file = file)
+    for ttyp, (cnt, used, pips, fuses, all_fuses) in sorted(stats['routing'].items()):
+        density = 100.0 * fuses / all_fuses if all_fuses else 0.0
+        print(f"{ttyp:<8} {cnt:>8} {used:>8} {pips:>8} {fuses:>10} {density:>10.2f}", file = file)
+
+_tile_range_re = re.compile(r"R(\d+)C(\d+)(?::R(\d+)C(\d+))?$")
+def parse_tile_range(spec):
+    """ 'R1C1:R10C20' or 'R5C7' -> (row0, col0, row1, col1), zero-based inclusive
+    """
+    m = _tile_range_re.match(spec.strip().upper())
+    if not m:
+        raise Exception(f"Bad tile range {spec}, expected RxCy or RxCy:RxCy")
+    row0, col0 = int(m.group(1)) - 1, int(m.group(2)) - 1
+    if m.group(3):
+        row1, col1 = int(m.group(3)) - 1, int(m.group(4)) - 1
+    else:
+        row1, col1 = row0, col0
+    return (min(row0, row1), min(col0, col1), max(row0, row1), max(col0, col1))
+
+# bel names the --bels patterns are matched against: the name in the tile
+# (LUT0, BSRAM, IOBA...) and for the IO the pin name (IOT10A)
+def tile_bel_names(db, row, col):
+    names = set()
+    for name in db[row, col].bels.keys():
+        names.add(name)
+        if name.startswith("IOB"):
+            names.add(chipdb_rt.rc2tbrl_0(db, row, col, name[-1]))
+    return names
+
+def select_tiles(db, tile_ranges, bel_patterns):
+    """ the tiles in any of the ranges that have a bel matching any of the patterns
+    """
+    if tile_ranges:
+        cells = set()
+        for row0, col0, row1, col1 in map(parse_tile_range, tile_ranges):
+            cells.update((row, col) for row in range(max(row0, 0), min(row1 + 1, db.rows))
+                                    for col in range(max(col0, 0), min(col1 + 1, db.cols)))
+    else:
+        cells = ((row, col) for row in range(db.rows) for col in range(db.cols))
+    if not bel_patterns:
+        return set(cells)
+    return {(row, col) for row, col in cells
+            if any(fnmatch.fnmatchcase(name, pat) for name in tile_bel_names(db, row, col) for pat in bel_patterns)}
+
+def context_tiles(db, tiles):
+    """ tiles outside the selection whose bits are needed to decode it: the
+        cells holding the B IOB fuses and the bank tiles
+    """
+    res = set()
+    bank_tiles = db.bank_tiles
+    for row, col in tiles:
+        for name, bel in db[row, col].bels.items():
+            if not name.startswith("IOB"):
+                continue
+            if bel.fuse_cell_offset:
+                res.add((row + bel.fuse_cell_offset[0], col + bel.fuse_cell_offset[1]))
+            try:
+                bank = chipdb_rt.loc2bank(db, row, col)
+            except KeyError:
+                continue
+            if bank in bank_tiles:
+                res.add(bank_tiles[bank])
+    return res - set(tiles)
+
 def main():
     pil_available = True
     try:
@@ -1308,12 +1902,28 @@ def main():
     parser.add_argument('bitstream')
     parser.add_argument('-d', '--device', required=True)
     parser.add_argument('-o', '--output', default='unpack.v')
+    parser.add_argument('--format', choices = ['verilog', 'json'], default = 'verilog',
+                        help = 'write Verilog or a Yosys JSON netlist')
+    parser.add_argument('--stream', action = 'store_true',
+                        help = 'write the Verilog body as the tiles are decoded to save memory')
     parser.add_argument('-s', '--cst', default=None)
     parser.add_argument('--noalu', action = 'store_true')
+    parser.add_argument('-j', '--jobs', type = int, default = 1, help = 'decode tiles in N processes')
+    parser.add_argument('-v', '--verbose', action = 'store_true')
+    parser.add_argument('--stats', action = 'store_true', help = 'print the resource usage instead of making Verilog')
+    parser.add_argument('--tiles', action = 'append', default = [], metavar = 'R1C1:R10C20',
+                        help = 'decode only the tiles in these ranges')
+    parser.add_argument('--bels', action = 'append', default = [], metavar = 'PATTERN',
+                        help = 'decode only the tiles with matching bels (LUT*, BSRAM, IOT*)')
+    parser.add_argument('--profile', action = 'store_true', help = 'print time and peak memory per stage')
+    parser.add_argument('--profile-json', default = None, metavar = 'FILE', help = 'write the profile report as JSON')
     if pil_available:
         parser.add_argument('--png')
 
     args = parser.parse_args()
+    if args.stream and args.format != 'verilog':
+        parser.error("--stream only works with the Verilog output")
+    prof = Profiler(args.profile or args.profile_json is not None)
 
     global _device
     _device = args.device
@@ -1324,40 +1934,57 @@ def main():
         luts = m.group(3)
         _device = f"GW1N{mods}-{luts}"
 
-    with importlib.resources.path('apycula', f'{args.device}.msgpack.xz') as path:
+    with prof.stage('load_chipdb'), importlib.resources.path('apycula', f'{args.device}.msgpack.xz') as path:
         db = load_chipdb(path)
 
     global _pinout
     _pinout = db.pinout[_device][_packages[_device]]
 
-    bitmap, _, _, extra_slots = read_bitstream(args.bitstream)
-    bm = chipdb.tile_bitmap(db, bitmap)
-    mod = codegen.Module()
+    # region of interest
+    roi = None
+    roi_cells = None
+    if args.tiles or args.bels:
+        roi = select_tiles(db, [r for spec in args.tiles for r in spec.split(',')],
+                           [p for spec in args.bels for p in spec.split(',')])
+        roi_cells = roi | context_tiles(db, roi)
+
+    with prof.stage('read_bitstream'):
+        bitmap, _, _, extra_slots = read_bitstream(args.bitstream)
+    with prof.stage('tile_bitmap'):
+        bm = chipdb_rt.tile_bitmap(db, bitmap, tiles = roi_cells)
+
+    # XXX this PLLs have empty main cell
+    pll_cells = []
+    if _device in {'GW1N-9C', 'GW1N-9'}:
+        pll_cells = [(9, 0), (9, 46)]
+    if _device in {'GW2A-18', 'GW2A-18C'}:
+        pll_cells = [(9, 0), (9, 55), (45, 0), (45, 55)]
+    if roi is not None:
+        pll_cells = [pos for pos in pll_cells if pos in roi]
+    if pll_cells:
+        bm.update(chipdb_rt.tile_bitmap(db, bitmap, empty = True, tiles = pll_cells))
+
+    if args.stats:
+        tiles = [idx for idx in bm.keys() if roi is None or idx in roi]
+        print_stats(collect_stats(db, bm, tiles, args.noalu, prof))
+        prof.stop()
+        prof.report()
+        if args.profile_json:
+            prof.write_json(args.profile_json)
+        return
+
+    if args.stream:
+        # the aliases are needed as the assigns are written
+        roots = chipdb_rt.get_wire_roots(db)
+        mod = codegen.StreamingModule(alias = lambda wire: roots.get(chipdb_rt.global2wire(wire)),
+                                      deferred = _multi_tile_primitives)
+    else:
+        mod = codegen.Module()
     cst = codegen.Constraints()
 
     if pil_available and args.png:
         display(args.png, bitmap)
 
-    # make wire aliases from Himbaechel nodes
-    def by_name_len(el):
-        return len(el[2])
-
-    for node_desc in db.nodes.values():
-        root_wire = None
-        for row, col, wire in sorted(node_desc[1], key = by_name_len):
-            wire_name = f'R{row + 1}C{col + 1}_{wire}'
-            if not root_wire:
-                root_wire = wire_name
-                continue
-            mod.wire_aliases[wire_name] = root_wire
-    for row in range(db.rows):
-        for col in range(db.cols):
-            for i in [1, 2]:
-                mod.wire_aliases[chipdb.wire2global(row + 0, col + 1, db, f'N1{i}1')] = f'R{row + 1}C{col + 1}_SN{i}0'
-                mod.wire_aliases[chipdb.wire2global(row + 2, col + 1, db, f'S1{i}1')] = f'R{row + 1}C{col + 1}_SN{i}0'
-                mod.wire_aliases[chipdb.wire2global(row + 1, col + 0, db, f'W1{i}1')] = f'R{row + 1}C{col + 1}_EW{i}0'
-                mod.wire_aliases[chipdb.wire2global(row + 1, col + 2, db, f'E1{i}1')] = f'R{row + 1}C{col + 1}_EW{i}0'
-
     # Slots have no wires only func fuses
     if extra_slots:
         for slot_idx, slot_bitmap in extra_slots.items():
@@ -1370,53 +1997,66 @@ def main():
             else:
                 print('Unknown Slot:', slot_idx)
 
-    # XXX this PLLs have empty main cell
-    if _device in {'GW1N-9C', 'GW1N-9'}:
-        bm_pll = chipdb.tile_bitmap(db, bitmap, empty = True)
-        bm[(9, 0)] = bm_pll[(9, 0)]
-        bm[(9, 46)] = bm_pll[(9, 46)]
-    if _device in {'GW2A-18', 'GW2A-18C'}:
-        bm_pll = chipdb.tile_bitmap(db, bitmap, empty = True)
-        bm[(9, 0)] = bm_pll[(9, 0)]
-        bm[(9, 55)] = bm_pll[(9, 55)]
-        bm[(45, 0)] = bm_pll[(45, 0)]
-        bm[(45, 55)] = bm_pll[(45, 55)]
-
     # banks first: need to know iostandards
     for pos in db.bank_tiles.values():
+        if roi is not None and pos not in roi_cells:
+            continue
         row, col = pos
         try:
             t = bm[(row, col)]
         except KeyError:
             continue
-        bels, pips, clock_pips = parse_tile_(db, row, col, t, bm)
+        with prof.stage('parse_tile_'), prof.sample('parse_tile_', db.grid[row][col]):
+            bels, pips, clock_pips = parse_tile_(db, row, col, t, bm)
         #print("bels:", bels)
-        tile2verilog(row, col, bels, pips, clock_pips, mod, cst, db)
-
-    for idx, t in bm.items():
-        row, col = idx
-        # skip banks
-        if (row, col) in db.bank_tiles.values():
-            continue
-        bels, pips, clock_pips = parse_tile_(db, row, col, t, bm, noiostd = False)
-        #print("bels:", idx, bels)
-        #print(pips)
-        #print(clock_pips)
-        if args.noalu:
-            removeALUs(bels)
+        with prof.stage('tile2verilog'):
+            tile2verilog(row, col, bels, pips, clock_pips, mod, cst, db)
+        if args.stream:
+            mod.flush()
+
+    # skip banks
+    bank_tiles = set(db.bank_tiles.values())
+    tiles = [idx for idx in bm.keys() if idx not in bank_tiles and (roi is None or idx in roi)]
+    jobs = args.jobs
+    if jobs > 1 and 'fork' not in multiprocessing.get_all_start_methods():
+        print("Warning. Parallel decoding needs the fork start method, using one process.")
+        jobs = 1
+    if jobs > 1:
+        assign_cell_indices(db, tiles)
+        with prof.stage('unpack_tiles_parallel'):
+            mod, cst = unpack_tiles_parallel(db, bm, tiles, args.noalu, jobs, mod, cst)
+    else:
+        for row, col in tiles:
+            unpack_tile(db, row, col, bm, mod, cst, args.noalu, prof)
+            if args.stream:
+                mod.flush()
+
+    with prof.stage('fix_plls'):
+        fix_plls(db, mod)
+
+    with prof.stage('wire_aliases'):
+        resolve_wire_aliases(db, mod)
+
+    if args.verbose:
+        lookups = tile_cache_stats['hits'] + tile_cache_stats['misses']
+        hit_rate = 100.0 * tile_cache_stats['hits'] / lookups if lookups else 0.0
+        print(f"Tile cache: {lookups} lookups, {tile_cache_stats['hits']} hits ({hit_rate:.1f}%), "
+              f"{tile_cache_stats['misses']} distinct, {tile_cache_stats['uncached']} not cached")
+
+    with prof.stage('write'), open(args.output, 'w') as f:
+        if args.format == 'json':
+            mod.write_json(f)
         else:
-            removeLUTs(bels)
-        ram16_remove_bels(bels)
-        tile2verilog(row, col, bels, pips, clock_pips, mod, cst, db)
-
-    fix_plls(db, mod)
-
-    with open(args.output, 'w') as f:
-        mod.write(f)
+            mod.write(f)
 
     if args.cst:
         with open(args.cst, 'w') as f:
             cst.write(f)
 
+    prof.stop()
+    prof.report()
+    if args.profile_json:
+        prof.write_json(args.profile_json)
+
 if __name__ == "__main__":
     main()
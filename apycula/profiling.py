@@ -0,0 +1,150 @@
+"""Per-stage wall time and peak memory accounting for the command line tools.
+
+A disabled Profiler costs next to nothing, so the stage markers can stay in
+the code paths permanently. Memory is measured with tracemalloc, which slows
+Python allocations down noticeably: timings taken with the profiler enabled
+are good for comparing stages with each other, not with an unprofiled run.
+"""
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+_MiB = 1024 * 1024
+
+# histogram buckets are powers of two in microseconds
+def _bucket(seconds):
+    return max(int(seconds * 1e6), 1).bit_length()
+
+def _bucket_label(bucket):
+    usecs = 1 << bucket
+    if usecs >= 1000000:
+        return f'{usecs // 1000000}s'
+    if usecs >= 1000:
+        return f'{usecs // 1000}ms'
+    return f'{usecs}us'
+
+class Profiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        # {stage: [calls, seconds, peak bytes]}
+        self.stages = {}
+        # {group: {key: [count, seconds]}}
+        self.groups = {}
+        # {group: {key: [count, seconds, max seconds, {bucket: count}]}}
+        self.histograms = {}
+        # running peaks of the stages that are currently open
+        self._peaks = []
+        self._started_tracing = False
+        if enabled and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def stop(self):
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name):
+        if not self.enabled:
+            yield
+            return
+        # the peak counter is global, so remember what the enclosing stage
+        # has seen so far before reusing the counter for this one
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self._peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            rec = self.stages.setdefault(name, [0, 0.0, 0])
+            rec[0] += 1
+            rec[1] += elapsed
+            rec[2] = max(rec[2], peak)
+
+    def add(self, group, key, elapsed, count = 1):
+        if not self.enabled:
+            return
+        rec = self.groups.setdefault(group, {}).setdefault(key, [0, 0.0])
+        rec[0] += count
+        rec[1] += elapsed
+
+    @contextmanager
+    def sample(self, group, key):
+        """Time the block and put the result into the key's histogram."""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            rec = self.histograms.setdefault(group, {}).setdefault(key, [0, 0.0, 0.0, {}])
+            rec[0] += 1
+            rec[1] += elapsed
+            rec[2] = max(rec[2], elapsed)
+            bucket = _bucket(elapsed)
+            rec[3][bucket] = rec[3].get(bucket, 0) + 1
+
+    def iterate(self, group, iterable, key):
+        """Pass the items through, charging the time the consumer spends on
+        each item (until it asks for the next one) to key(item)."""
+        if not self.enabled:
+            return iterable
+        return self._iterate(group, iterable, key)
+
+    def _iterate(self, group, iterable, key):
+        for item in iterable:
+            start = time.perf_counter()
+            yield item
+            self.add(group, key(item), time.perf_counter() - start)
+
+    def as_dict(self):
+        return {
+            'stages': [{'name': name, 'calls': calls, 'seconds': secs, 'peak_bytes': peak}
+                       for name, (calls, secs, peak) in self.stages.items()],
+            'groups': {group: [{'key': str(key), 'count': cnt, 'seconds': secs}
+                               for key, (cnt, secs) in sorted(recs.items(), key = lambda kv: -kv[1][1])]
+                       for group, recs in self.groups.items()},
+            'histograms': {group: [{'key': str(key), 'count': cnt, 'seconds': secs, 'max_seconds': worst,
+                                    'buckets': {f'<{_bucket_label(b)}': n for b, n in sorted(buckets.items())}}
+                                   for key, (cnt, secs, worst, buckets) in sorted(recs.items(), key = lambda kv: -kv[1][1])]
+                           for group, recs in self.histograms.items()},
+        }
+
+    def report(self, file = sys.stdout):
+        if not self.enabled:
+            return
+        total = sum(rec[1] for rec in self.stages.values())
+        print(f"{'stage':<28} {'calls':>6} {'time, s':>10} {'%':>6} {'peak, MiB':>10}", file = file)
+        for name, (calls, secs, peak) in self.stages.items():
+            pct = 100.0 * secs / total if total else 0.0
+            print(f"{name:<28} {calls:>6} {secs:>10.4f} {pct:>6.1f} {peak / _MiB:>10.2f}", file = file)
+        for group, recs in self.groups.items():
+            print(file = file)
+            gtotal = sum(rec[1] for rec in recs.values())
+            print(f"{group:<28} {'count':>6} {'time, s':>10} {'%':>6}", file = file)
+            for key, (cnt, secs) in sorted(recs.items(), key = lambda kv: -kv[1][1]):
+                pct = 100.0 * secs / gtotal if gtotal else 0.0
+                print(f"{str(key):<28} {cnt:>6} {secs:>10.4f} {pct:>6.1f}", file = file)
+        for group, recs in self.histograms.items():
+            print(file = file)
+            print(f"{group:<28} {'count':>6} {'time, s':>10} {'mean, us':>10} {'max, us':>10}  histogram", file = file)
+            for key, (cnt, secs, worst, buckets) in sorted(recs.items(), key = lambda kv: -kv[1][1]):
+                hist = ' '.join(f'<{_bucket_label(b)}:{n}' for b, n in sorted(buckets.items()))
+                print(f"{str(key):<28} {cnt:>6} {secs:>10.4f} {secs / cnt * 1e6:>10.1f} {worst * 1e6:>10.1f}  {hist}", file = file)
+
+    def write_json(self, fname):
+        if not self.enabled:
+            return
+        with open(fname, 'w') as f:
+            json.dump(self.as_dict(), f, indent = 1)
@@ -3,8 +3,8 @@ import re
 import string
 from typing import Iterable, TypeAlias
 from collections import defaultdict, deque
-from apycula.chipdb import Device, rc2tbrl, rc2tbrl_0
-from apycula.gowin_unpack import parse_tile_, tbrl2rc
+from apycula.chipdb_rt import Device, rc2tbrl, rc2tbrl_0, wire_resolver
+from apycula.gowin_unpack import get_tile_pips, tbrl2rc
 import random
 # from apycula.chipdb_builder import tbrl2rc
 
@@ -31,27 +31,7 @@ def is_intertile_node(wire:str):
 # Mostly copied from gowin_arch_gen in nextpnr :). Logic for handling cases
 # Where a wire would appear to go out of bounds
 def uturn(db:Device, node:Node):
-    row, col, wire = node
-    uturnlut = {'N': 'S', 'S': 'N', 'E': 'W', 'W': 'E'}
-    m = re.match(r"([NESW])([128]\d)(\d)", wire)
-    if m:
-        direction, num, segment = m.groups()
-        # wires wrap around the edges
-        # assumes 0-based indexes
-        if row < 0:
-            row = -1 - row
-            direction = uturnlut[direction]
-        if col < 0:
-            col = -1 - col
-            direction = uturnlut[direction]
-        if row > db.rows - 1:
-            row = 2 * db.rows - 1 - row
-            direction = uturnlut[direction]
-        if col > db.cols - 1:
-            col = 2 * db.cols - 1 - col
-            direction = uturnlut[direction]
-        wire = f'{direction}{num}{segment}'
-    return row, col, wire
+    return wire_resolver(db).uturn(*node)
 
 def source_intertile_wire(db:Device, node:Node):
     """
@@ -175,7 +155,7 @@ def get_input_path_dict(tile_dict:dict[Node, Node], db:Device, source:Node|str,
         if tile_loc not in tile_dict or not tile_wires[tile_loc]:
             continue
 
-        _, all_tile_wires, _ = parse_tile_(db, srow, scol, tile_dict[(srow,scol)])
+        all_tile_wires, _ = get_tile_pips(db, srow, scol, tile_dict[(srow,scol)])
         wire_dict = defaultdict(list)
         for dest_wire, src_wire in all_tile_wires.items():
             wire_dict[src_wire].append(dest_wire)
@@ -270,7 +250,7 @@ def get_output_path_dict(tile_dict:dict, db:Device, source:Node|str, through_bel
 
         wire_deque = deque(tile_wires[tile_loc])
         tile_wires[tile_loc].clear()
-        _, wire_dict, _ = parse_tile_(db, *tile_loc, tile_dict[tile_loc], default=True)
+        wire_dict, _ = get_tile_pips(db, *tile_loc, tile_dict[tile_loc], default=True)
 
         # Trace the output of an IOB to its input
         tile_bels = db[tile_loc[0], tile_loc[1]].bels
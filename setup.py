@@ -34,6 +34,8 @@ setuptools.setup(
             'gowin_pack=apycula.gowin_pack:main',
             'gowin_unpack=apycula.gowin_unpack:main',
             'gowin_pll=apycula.gowin_pll:main',
+            'gowin_diff=apycula.gowin_diff:main',
+            'gowin_bram_patch=apycula.gowin_bram_patch:main',
         ],
     },
     use_scm_version=True,
@@ -0,0 +1,20 @@
+import io
+from apycula import codegen
+
+# The streamed Verilog must carry the same assigns as Module.write, where the
+# last assign to a net wins.
+
+def assigns(mod):
+    f = io.StringIO()
+    mod.write(f)
+    return sorted(line for line in f.getvalue().splitlines() if line.startswith('assign'))
+
+def test_streaming_keeps_last_assign():
+    parts = [[('a', 'b'), ('c', 'd')], [('a', 'e')], [('c', 'f'), ('g', 'a')]]
+    mod = codegen.Module()
+    streamed = codegen.StreamingModule()
+    for part in parts:
+        mod.assigns.extend(part)
+        streamed.assigns.extend(part)
+        streamed.flush()
+    assert assigns(streamed) == assigns(mod) == ['assign a = e;', 'assign c = f;', 'assign g = a;']
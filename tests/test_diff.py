@@ -0,0 +1,51 @@
+import random
+from apycula import bitmatrix, bslib, gowin_diff
+from apycula.chipdb_rt import Device, Tile, tile_offsets
+
+# The bitstreams of the chips before GW5A carry the BSRAM init rows below the
+# main grid, a change there is not a change of any tile.
+
+# the GW2A-18 device ID, its rows have no padding
+_header = [bytearray(b'\xff' * 8), bytearray(b'\xff' * 8), bytearray(b'\xa5\xc3'),
+           bytearray(b'\x06\x00\x00\x00\x00\x00\x08\x1b'), bytearray(b'\x10\x00\x00\x00\x00\x00\x00\x00'),
+           bytearray(b'\x51\x00\xff\xff\xff\xff\xff\xff'), bytearray(b'\x3b\x80\x00\x00')]
+_footer = [bytearray(b'\xff' * 8), bytearray(b'\x0a\x00\x00\x00\x00\x00\x12\x34')]
+
+def make_device():
+    db = Device()
+    db.grid = [[1] * 6 for _ in range(10)]
+    db.tiles = {1: Tile(60, 20, 1)}
+    return db
+
+def write(fname, main, init):
+    bslib.write_bitstream(fname, main, [bytearray(line) for line in _header], [bytearray(line) for line in _footer],
+                          False, {}, bsram_init = (256, {(0, 60): init}))
+
+def test_init_data_only(tmp_path):
+    db = make_device()
+    rnd = random.Random(5)
+    main = bitmatrix.zeros(db.height, db.width)
+    for _ in range(200):
+        main[rnd.randrange(db.height)][rnd.randrange(db.width)] = 1
+    init_a = bitmatrix.zeros(256, 180)
+    init_b = bitmatrix.zeros(256, 180)
+    for _ in range(50):
+        init_b[rnd.randrange(256)][rnd.randrange(180)] = 1
+    write(str(tmp_path / 'a.fs'), main, init_a)
+    write(str(tmp_path / 'b.fs'), main, init_b)
+    bitmap_a = bslib.read_bitstream(str(tmp_path / 'a.fs'))[0]
+    bitmap_b = bslib.read_bitstream(str(tmp_path / 'b.fs'))[0]
+    assert bitmatrix.shape(bitmap_a) == (db.height + 256, db.width)
+
+    offsets = tile_offsets(db)
+    changed = gowin_diff.changed_bits(bitmap_a, bitmap_b, offsets)
+    assert changed == {}
+    assert gowin_diff.affected_tiles(db, changed) == []
+    assert gowin_diff.changed_init_bits(bitmap_a, bitmap_b, offsets) == bitmatrix.bsum(init_b)
+
+    # a tile bit is still found in its tile
+    main[25][130] ^= 1
+    write(str(tmp_path / 'c.fs'), main, init_b)
+    bitmap_c = bslib.read_bitstream(str(tmp_path / 'c.fs'))[0]
+    assert gowin_diff.changed_bits(bitmap_b, bitmap_c, offsets) == {(1, 2): [(5, 10)]}
+    assert gowin_diff.changed_init_bits(bitmap_b, bitmap_c, offsets) == 0
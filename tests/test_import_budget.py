@@ -0,0 +1,29 @@
+import os
+import subprocess
+import sys
+
+# gowin_pack only needs the runtime part of the chip database, the builder
+# modules must stay out of its imports.
+_builder_modules = {'apycula.chipdb', 'apycula.dat_parser', 'apycula.fse_parser', 'apycula.pindef'}
+# self time of all apycula modules, microseconds; numpy and msgspec are not counted
+_budget_us = 100000
+
+def import_times(module):
+    """{module: self time in us} from python -X importtime"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    res = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                         cwd = root, capture_output = True, text = True, check = True)
+    times = {}
+    for line in res.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(self_us)
+    return times
+
+def test_gowin_pack_import_budget():
+    times = import_times('apycula.gowin_pack')
+    assert 'apycula.gowin_pack' in times
+    assert not _builder_modules & times.keys()
+    own = sum(us for name, us in times.items() if name == 'apycula' or name.startswith('apycula.'))
+    assert own < _budget_us, f'apycula modules take {own} us to import'
@@ -0,0 +1,178 @@
+import gc
+import random
+import re
+import pytest
+from apycula import attrids, gowin_unpack
+from apycula.chipdb_rt import Bel, Device, Tile
+
+# gowin_unpack --stats tests the fuse masks of the bels instead of decoding
+# the tiles, the counts must be the ones of the full parse_tile_ decode. The
+# chip is a made-up 4x4 grid: a row of IO tiles with a DSP, two rows of
+# slices and a row with the A and B cells of a PLL, an OSC and a BSRAM.
+
+_slice_li = {
+    ('MODE', 'ALU'): 1, ('MODE', 'SSRAM'): 2, ('REGMODE', 'LATCH'): 3, ('LSRONMUX', 'LSRMUX'): 4,
+    ('CLKMUX_CLK', 'INV'): 5, ('SRMODE', 'ASYNC'): 6, ('REG0_REGSET', 'RESET'): 7,
+    ('REG0_REGSET', 'SET'): 8, ('REG1_REGSET', 'RESET'): 9, ('REG1_REGSET', 'SET'): 10,
+}
+_iob_li = {
+    ('IO_TYPE', 'LVCMOS33'): 1, ('LVDS_OUT', 'ON'): 2, ('DRIVE', '8'): 3, ('ODMUX', 'ENABLE'): 4,
+    ('PERSISTENT', 'OFF'): 5, ('OD', 'ENABLE'): 6, ('LPRX_A1', 'ENABLE'): 7, ('IOBUF_MIPI_LP', 'ENABLE'): 8,
+}
+_pll_li = {('INSEL', 'CLKIN1'): 1, ('FBSEL', 'CLKFB0'): 2, ('IDIV', 3): 3, ('PWDEN', 'ENABLE'): 4}
+_osc_li = {('MCLKCIB', 5): 1, ('MCLKCIB_EN', 'ENABLE'): 2, ('NORMAL', 'ENABLE'): 3}
+_bsram_li = {('CEMUX_CEA', 'INV'): 1, ('CLKMUX_CLKA', 'INV'): 2}
+_dsp_li = {('CEHMUX_CREG', 'INV'): 1, ('CEHMUX_OREG0', 'INV'): 2}
+# ALU modes as the builder makes them from the LUT fuses
+_alu_modes = {'0': "0110000001101010", '1': "1001000010011010", 'C2L': "0000000000000000"}
+
+def logicinfo(attr_table, val_table, table):
+    return {(attr_table[attr], val if isinstance(val, int) else val_table[val]): code
+            for (attr, val), code in table.items()}
+
+def make_device(rnd):
+    free = {}
+
+    def bits(ttyp, cnt = 1):
+        if ttyp not in free:
+            free[ttyp] = [(r, c) for r in range(8) for c in range(db.tiles[ttyp].width)]
+            rnd.shuffle(free[ttyp])
+        return {free[ttyp].pop() for _ in range(cnt)}
+
+    db = Device()
+    db.grid = [[2, 2, 2, 7], [1] * 4, [1] * 4, [3, 4, 5, 6]]
+    db.tiles = {1: Tile(40, 8, 1), 2: Tile(20, 8, 2)}
+    db.tiles.update((ttyp, Tile(20, 8, ttyp)) for ttyp in range(3, 8))
+    db.logicinfo['PLL'] = logicinfo(attrids.pll_attrids, attrids.pll_attrvals, _pll_li)
+    db.logicinfo['OSC'] = logicinfo(attrids.osc_attrids, attrids.osc_attrvals, _osc_li)
+    db.logicinfo['BSRAM'] = logicinfo(attrids.bsram_attrids, attrids.bsram_attrvals, _bsram_li)
+    db.logicinfo['DSP'] = logicinfo(attrids.dsp_attrids, attrids.dsp_attrvals, _dsp_li)
+    db.logicinfo['SLICE'] = {(attrids.cls_attrids[attr], attrids.cls_attrvals[val]): code
+                             for (attr, val), code in _slice_li.items()}
+    db.logicinfo['IOB'] = {(attrids.iob_attrids[attr], attrids.iob_attrvals[val]): code
+                           for (attr, val), code in _iob_li.items()}
+
+    sl = db.tiles[1]
+    for num in range(6):
+        lut = sl.bels[f'LUT{num}'] = Bel()
+        lut.flags = {bit: bits(1) for bit in range(16)}
+        sl.bels[f'DFF{num}'] = Bel()
+        alu = sl.bels[f'ALU{num}'] = Bel()
+        for mode, init in _alu_modes.items():
+            alu.modes[mode] = set().union(*(lut.flags[15 - i] for i, bit in enumerate(init) if bit == '0'))
+    sl.bels['RAM16'] = Bel(modes = {'0': bits(1, 2)}, flags = {'W': bits(1)})
+    sl.bels['BUFS0'] = Bel(flags = {'R': bits(1), 'L': bits(1)})
+    db.shortval[1] = {f'CLS{cls}': {(code, 0): bits(1, 2) for code in _slice_li.values()} for cls in range(3)}
+    sl.pips = {f'X{dest}': {f'S{src}': bits(1, 2) for src in range(3)} for dest in range(6)}
+    sl.pips['X0']['VCC'] = set()
+    sl.clock_pips = {'LWSPINEB1': {'LW0': bits(1)}, 'GB0': {'GT0': bits(1)}}
+
+    io = db.tiles[2]
+    io.bels = {'IOBA': Bel(), 'IOBB': Bel()}
+    db.longval[2] = {f'IOB{idx}': {(code, 0): bits(2) for code in _iob_li.values()} for idx in 'AB'}
+    io.pips = {'A0': {'S0': bits(2)}}
+
+    # the PLL settings are in both cells
+    for ttyp, name in [(3, 'RPLLA'), (4, 'RPLLB')]:
+        db.tiles[ttyp].bels[name] = Bel()
+        db.shortval[ttyp] = {'PLL': {(code, 0): bits(ttyp, 2) for code in _pll_li.values()}}
+        db.tiles[ttyp].pips = {'PLL_I': {'S0': bits(ttyp)}}
+    db.tiles[5].bels['OSC'] = Bel()
+    db.shortval[5] = {'OSC': {(code, 0): bits(5, 2) for code in _osc_li.values()}}
+    db.tiles[6].bels['BSRAM'] = Bel()
+    db.shortval[6] = {'BSRAM_SP': {(code, 0): bits(6, 2) for code in _bsram_li.values()}}
+    db.tiles[7].bels.update({'DSP0': Bel(), 'DSP1': Bel()})
+    db.shortval[7] = {f'DSP{idx}': {(code, 0): bits(7, 2) for code in _dsp_li.values()} for idx in '01'}
+    return db
+
+def random_tiles(rnd, db, density):
+    bm = {}
+    for row in range(db.rows):
+        for col in range(db.cols):
+            tile = db[row, col]
+            bm[row, col] = [[int(rnd.random() < density) for _ in range(tile.width)] for _ in range(tile.height)]
+    return bm
+
+# the resources as they come from the full decode of the bels
+_belre = re.compile(r"(IOB|LUT|DFF|ALU|RAM16|OSC[ZFHWO]?|RPLL[AB]|PLLVR|BSRAM|DSP)(\w*)")
+
+def decoded_stats(db, bm, noalu):
+    stats = {'LUT4': 0, 'DFF': 0, 'ALU': 0, 'RAM16': 0, 'IOB': 0, 'OSC': 0, 'DSP': 0, 'pips': {}}
+    bsrams = set()
+    # {cell index: INSEL is set}, see fix_plls
+    plls = {}
+    for row, col in bm:
+        bels, pips, clock_pips = gowin_unpack.parse_tile_(db, row, col, bm[row, col], bm, noiostd = False)
+        if noalu:
+            gowin_unpack.removeALUs(bels)
+        else:
+            gowin_unpack.removeLUTs(bels)
+        gowin_unpack.ram16_remove_bels(bels)
+        ttyp = db.grid[row][col]
+        stats['pips'][ttyp] = stats['pips'].get(ttyp, 0) + len(pips) + len(clock_pips)
+        for bel, flags in bels.items():
+            m = _belre.match(bel)
+            if not m:
+                continue
+            typ = m.group(1)
+            if typ == 'LUT':
+                stats['LUT4'] += len(flags) < 16
+            elif typ == 'IOB':
+                stats['IOB'] += bool(flags.intersection(gowin_unpack.iobmap))
+            elif typ == 'BSRAM':
+                bsrams.add(m.group(2))
+            elif typ.startswith('RPLL'):
+                idx = m.group(2)
+                plls[idx] = plls.get(idx, False) or any(flag.startswith('INSEL=') for flag in flags)
+            elif typ.startswith('OSC'):
+                stats['OSC'] += 1
+            else:
+                stats[typ] += 1
+    stats['BSRAM'] = len(bsrams)
+    stats['PLL'] = sum(plls.values())
+    return stats
+
+@pytest.mark.parametrize('noalu', [False, True])
+@pytest.mark.parametrize('seed', range(20))
+def test_stats_match_decode(seed, noalu):
+    rnd = random.Random(seed)
+    db = make_device(rnd)
+    bm = random_tiles(rnd, db, rnd.choice([0.05, 0.2, 0.5, 0.9]))
+    expected = decoded_stats(db, bm, noalu)
+    stats = gowin_unpack.collect_stats(db, bm, list(bm), noalu)
+    for name in ['LUT4', 'DFF', 'ALU', 'RAM16', 'OSC', 'DSP', 'BSRAM', 'PLL']:
+        assert stats[name] == expected[name], name
+    assert sum(stats['IOB'].values()) == expected['IOB']
+    assert {ttyp: rec[2] for ttyp, rec in stats['routing'].items()} == expected['pips']
+
+def test_stats_forced_pll_cells(monkeypatch):
+    # GW1N-9 and GW2A-18 decode their PLL cells even if they are empty,
+    # neither they nor PLL cells with only routing fuses are a used PLL
+    monkeypatch.setattr(gowin_unpack, '_device', 'GW1N-9')
+    rnd = random.Random(1)
+    db = make_device(rnd)
+    bm = random_tiles(rnd, db, 0)
+    stats = gowin_unpack.collect_stats(db, bm, list(bm))
+    assert stats['PLL'] == 0
+    for col in range(2):
+        for row_, col_ in db[3, col].pips['PLL_I']['S0']:
+            bm[3, col][row_][col_] = 1
+    stats = gowin_unpack.collect_stats(db, bm, list(bm))
+    assert stats['PLL'] == 0
+    assert stats['routing'][3][3] == 1
+    assert decoded_stats(db, bm, False)['PLL'] == 0
+    # INSEL in the B cell is enough
+    for row_, col_ in db.shortval[4]['PLL'][_pll_li['INSEL', 'CLKIN1'], 0]:
+        bm[3, 1][row_][col_] = 1
+    assert gowin_unpack.collect_stats(db, bm, list(bm))['PLL'] == 1
+
+def test_tile_cache_does_not_keep_db():
+    rnd = random.Random(2)
+    db = make_device(rnd)
+    bm = random_tiles(rnd, db, 0.2)
+    decoded_stats(db, bm, False)
+    assert gowin_unpack._tile_cache[id(db)]
+    key = id(db)
+    del db
+    gc.collect()
+    assert key not in gowin_unpack._tile_cache